@@ -0,0 +1,156 @@
+# FluLink AI Agent - 上游熔断与重试预算
+# 按失败率熔断：打开期间请求立即失败并走本地降级；冷却后半开放行少量探测请求；重试受预算限制并带随机退避
+
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求未发往上游"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"上游 {name} 已熔断，{retry_after:.1f}s 后重新探测")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """滑动时间窗内失败率超过阈值（且样本数足够）时打开"""
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, min_requests: int = 5,
+                 window_seconds: float = 30.0, open_seconds: float = 15.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_requests = max(1, min_requests)
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.state = CLOSED
+        self._window: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = open_seconds
+        self._probes = 0
+        self.stats = {"opened": 0, "short_circuited": 0, "successes": 0, "failures": 0}
+
+    def _trim(self, now: float):
+        window = self._window
+        while window and window[0][0] < now - self.window_seconds:
+            _, ok = window.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def allow(self) -> bool:
+        """是否放行本次请求；放行半开探测时占用一个探测名额"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self._open_for:
+                self.stats["short_circuited"] += 1
+                return False
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                self.stats["short_circuited"] += 1
+                return False
+            self._probes += 1
+        return True
+
+    def release(self):
+        """放行的请求未产生结果（如被取消）时归还半开探测名额"""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self._open_for - time.monotonic())
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        if self.state == HALF_OPEN:
+            # 探测成功：关闭熔断器并清空旧样本
+            self.state = CLOSED
+            self._window.clear()
+            self._failures = 0
+            return
+        self._record(True)
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        self._record(False)
+        if (self.state == CLOSED and len(self._window) >= self.min_requests
+                and self._failures / len(self._window) >= self.failure_rate_threshold):
+            self._open()
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._trim(now)
+        self._window.append((now, ok))
+        if not ok:
+            self._failures += 1
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        # 冷却时间加 ±20% 抖动，避免多个实例同时探测恢复中的上游
+        self._open_for = self.open_seconds * random.uniform(0.8, 1.2)
+        self.stats["opened"] += 1
+
+    def status(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        samples = len(self._window)
+        return {
+            "state": self.state,
+            "failure_rate": round(self._failures / samples, 4) if samples else 0,
+            "window_samples": samples,
+            "retry_after": round(self.retry_after(), 3) if self.state == OPEN else None,
+            "failure_rate_threshold": self.failure_rate_threshold,
+            "min_requests": self.min_requests,
+            "window_seconds": self.window_seconds,
+            "open_seconds": self.open_seconds,
+            **self.stats
+        }
+
+
+class RetryBudget:
+    """重试预算：每个请求存入 ratio 个令牌（上限 max_tokens），每次重试消耗一个，防止上游故障时重试放大流量"""
+
+    def __init__(self, max_retries: int = 2, ratio: float = 0.2, max_tokens: float = 10.0,
+                 backoff_base: float = 0.05, backoff_max: float = 1.0):
+        self.max_retries = max(0, max_retries)
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._tokens = max_tokens
+        self.stats = {"retries": 0, "exhausted": 0}
+
+    def deposit(self):
+        self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self, attempt: int) -> Optional[float]:
+        """允许重试时返回退避秒数，否则返回 None"""
+        if attempt >= self.max_retries:
+            return None
+        if self._tokens < 1:
+            self.stats["exhausted"] += 1
+            return None
+        self._tokens -= 1
+        self.stats["retries"] += 1
+        # full jitter：在 [0, min(上限, base * 2^attempt)] 内均匀取值
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "max_retries": self.max_retries,
+            "ratio": self.ratio,
+            "tokens": round(self._tokens, 3),
+            **self.stats
+        }
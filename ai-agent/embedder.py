@@ -0,0 +1,259 @@
+# FluLink AI Agent - 文本向量化
+# 与 ai-service 使用同一模型（all-MiniLM-L6-v2），两种方式二选一：
+#   local      进程内加载模型，并发请求经微批聚合为一次 encode([...])
+#   ai_service 通过连接池以二进制 float32 向量调用 ai-service /api/ai/embed-text
+# 两种方式都带 LRU 向量缓存；模型不可用时抛出 EmbeddingUnavailable，不返回占位向量
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from request_cache import TTLCache, request_key
+
+if TYPE_CHECKING:
+    from http_pool import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODES = ("local", "ai_service")
+
+
+class EmbeddingUnavailable(Exception):
+    """当前无法生成与 ai-service 可比较的向量"""
+
+
+class MicroBatcher:
+    """把并发的单条请求聚合成批，在线程池中调用 encode_fn(texts)"""
+
+    def __init__(self, encode_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"batches": 0, "items": 0, "errors": 0, "last_batch_size": 0, "last_batch_ms": None}
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self._queue and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(EmbeddingUnavailable("微批处理器已停止"))
+
+    async def submit(self, text: str) -> np.ndarray:
+        if not self.running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [item for item in await self._collect() if not item[1].done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(None, self.encode_fn, [text for text, _ in batch])
+            except Exception as e:
+                self.stats["errors"] += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["last_batch_size"] = len(batch)
+            self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            **self.stats
+        }
+
+
+class LocalEmbedder:
+    """进程内模型；启动时在后台线程加载，加载完成前的请求最多等待 timeout 秒"""
+
+    mode = "local"
+
+    def __init__(self, model_name: str, cache: TTLCache, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, timeout: float = 10.0):
+        self.model_name = model_name
+        self.cache = cache
+        self.timeout = timeout
+        self.model = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._load_error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+        self.batcher = MicroBatcher(self._encode, max_batch_size, max_wait_ms)
+
+    def _load(self):
+        # 延迟导入：ai_service 模式下不加载 torch
+        from sentence_transformers import SentenceTransformer
+        started = time.perf_counter()
+        model = SentenceTransformer(self.model_name)
+        self._load_seconds = round(time.perf_counter() - started, 3)
+        return model
+
+    def _begin_load(self) -> asyncio.Future:
+        if self._load_task is None or (self._load_task.done() and self.model is None):
+            self._load_error = None
+            self._load_task = asyncio.get_running_loop().run_in_executor(None, self._load)
+            self._load_task.add_done_callback(self._on_loaded)
+        return self._load_task
+
+    def _on_loaded(self, task: asyncio.Future):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self._load_error = str(error)
+            logger.error(f"本地嵌入模型加载失败: {error}")
+            return
+        self.model = task.result()
+        logger.info(f"本地嵌入模型已加载: {self.model_name} ({self._load_seconds}s)")
+
+    async def _ensure_model(self):
+        if self.model is not None:
+            return
+        task = self._begin_load()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise EmbeddingUnavailable("本地嵌入模型加载中")
+        except Exception as e:
+            raise EmbeddingUnavailable(f"本地嵌入模型加载失败: {e}")
+        if self.model is None:
+            self.model = task.result()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # 与 ai-service 的 _encode_texts 参数一致，保证向量可比较
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+    async def start(self):
+        """启动微批处理器并在后台开始加载模型（不阻塞服务启动）"""
+        self.batcher.start()
+        self._begin_load()
+
+    async def stop(self):
+        await self.batcher.stop()
+
+    async def embed(self, text: str) -> Tuple[np.ndarray, str]:
+        key = request_key(self.model_name, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, self.model_name
+        await self._ensure_model()
+        try:
+            vector = await asyncio.wait_for(self.batcher.submit(text), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise EmbeddingUnavailable("本地向量化超时")
+        except EmbeddingUnavailable:
+            raise
+        except Exception as e:
+            raise EmbeddingUnavailable(f"本地向量化失败: {e}")
+        vector = np.asarray(vector, dtype=np.float32)
+        self.cache.put(key, vector)
+        return vector, self.model_name
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "loading": self.model is None and self._load_task is not None and not self._load_task.done(),
+            "load_seconds": self._load_seconds,
+            "load_error": self._load_error,
+            "batching": self.batcher.status(),
+            "cache": self.cache.status()
+        }
+
+
+class RemoteEmbedder:
+    """调用 ai-service：二进制 float32 响应用 np.frombuffer 直接解码，省去 JSON 浮点数组的序列化开销"""
+
+    mode = "ai_service"
+
+    def __init__(self, http: "UpstreamClient", model_name: str, cache: TTLCache):
+        self.http = http
+        self.model_name = model_name
+        self.cache = cache
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def embed(self, text: str) -> Tuple[np.ndarray, str]:
+        key = request_key(self.model_name, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, self.model_name
+        try:
+            response = await self.http.post(
+                "/api/ai/embed-text",
+                headers={"Accept": "application/octet-stream", "X-Vector-Dtype": "float32"},
+                json={"text": text, "vector_dtype": "float32"}
+            )
+        except Exception as e:
+            raise EmbeddingUnavailable(f"ai-service 不可用: {e}")
+        if response.status_code != 200:
+            raise EmbeddingUnavailable(f"ai-service 返回 {response.status_code}")
+        # ai-service 降级向量与模型向量不在同一空间，不能写入向量库
+        if response.headers.get("X-Model-Used", "primary") != "primary":
+            raise EmbeddingUnavailable("ai-service 嵌入模型未就绪（仅有降级向量）")
+        if response.headers.get("X-Vector-Dtype", "float32") != "float32":
+            raise EmbeddingUnavailable("ai-service 返回了非 float32 向量")
+        vector = np.frombuffer(response.content, dtype="<f4")
+        self.cache.put(key, vector)
+        return vector, self.model_name
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "model": self.model_name,
+            "upstream": self.http.base_url,
+            "cache": self.cache.status()
+        }
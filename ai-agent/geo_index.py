@@ -0,0 +1,339 @@
+# FluLink v4.0 - 地理层级空间索引
+# 每个德道经传播层级（community / neighborhood / street / city）一层等经纬度网格，网格边长等于该层级半径；
+# 网格用哈希表保存（单元格 -> 用户集合），单元格查询 O(1)，半径查询只检查覆盖圆的少量单元格
+# 用户移动时只改动其所在单元格，无需重建；数据来源为 PocketBase users.location_data
+# 全量重建期间的增量写入记入日志，新索引换入后按顺序重放，不会被较早的数据快照覆盖
+# 注意：ai-service 与 ai-agent 各保留一份相同实现（两者独立构建镜像）
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM  # 球面上任意两点的最大距离
+
+# 各层级的影响半径（公里）
+DEFAULT_LEVEL_RADII_KM = {
+    "community": 0.5,
+    "neighborhood": 2.0,
+    "street": 5.0,
+    "city": 30.0
+}
+
+Cell = Tuple[int, int]
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def parse_location(value: Any) -> Optional[Tuple[float, float]]:
+    """支持 {lat, lng} 与 {latitude, longitude} 两种写法"""
+    if not isinstance(value, dict):
+        return None
+    lat = value.get("lat", value.get("latitude"))
+    lng = value.get("lng", value.get("longitude"))
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+class GeoIndex:
+    """多精度网格索引；读写均在锁内完成，可在线程池中并发查询"""
+
+    def __init__(self, level_radii_km: Optional[Dict[str, float]] = None, max_query_cells: int = 4096):
+        radii = level_radii_km or DEFAULT_LEVEL_RADII_KM
+        self.max_query_cells = max(9, max_query_cells)
+        # 按半径从小到大排列（由细到粗）
+        self.level_radii_km = dict(sorted(radii.items(), key=lambda item: item[1]))
+        self._cell_deg = {level: max(radius, 1e-3) / KM_PER_DEGREE for level, radius in self.level_radii_km.items()}
+        self._lock = threading.RLock()
+        self._coords: Dict[str, Tuple[float, float]] = {}
+        self._grids: Dict[str, Dict[Cell, Set[str]]] = {level: {} for level in self.level_radii_km}
+        self.loaded_at: Optional[float] = None
+        # 重建进行中时记录增量写入 (user_id, 坐标或 None=移除)；没有进行中的重建时为 None
+        self._journal: Optional[List[Tuple[str, Optional[Tuple[float, float]]]]] = None
+        self._pending_rebuilds = 0
+        self.stats = {"upserts": 0, "moves": 0, "removals": 0, "rebuilds": 0, "queries": 0, "last_rebuild_ms": None}
+
+    def _cell(self, level: str, lat: float, lng: float) -> Cell:
+        deg = self._cell_deg[level]
+        return int(math.floor((lat + 90.0) / deg)), int(math.floor((lng + 180.0) / deg))
+
+    def _cell_id(self, level: str, cell: Cell) -> str:
+        return f"{level}:{cell[0]}:{cell[1]}"
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    # 写入
+
+    def _discard(self, user_id: str, lat: float, lng: float, keep: Optional[Tuple[float, float]] = None):
+        for level, grid in self._grids.items():
+            cell = self._cell(level, lat, lng)
+            if keep is not None and self._cell(level, *keep) == cell:
+                continue
+            members = grid.get(cell)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del grid[cell]
+
+    def _apply(self, user_id: str, point: Optional[Tuple[float, float]]) -> bool:
+        """写入、移动（point 非空）或移除（point 为 None）一个用户，调用方持锁"""
+        previous = self._coords.get(user_id)
+        if previous == point:
+            return False
+        if point is None:
+            del self._coords[user_id]
+            self._discard(user_id, *previous)
+            self.stats["removals"] += 1
+            return True
+        if previous is not None:
+            # 只改动单元格发生变化的层级
+            self._discard(user_id, *previous, keep=point)
+            self.stats["moves"] += 1
+        for level, grid in self._grids.items():
+            grid.setdefault(self._cell(level, *point), set()).add(user_id)
+        self._coords[user_id] = point
+        self.stats["upserts"] += 1
+        return True
+
+    def _write(self, user_id: str, point: Optional[Tuple[float, float]]) -> bool:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((user_id, point))
+            return self._apply(user_id, point)
+
+    def upsert(self, user_id: str, location: Any) -> bool:
+        """写入或移动一个用户；location 无法解析时移除该用户。返回索引是否发生变化"""
+        point = location if isinstance(location, tuple) else parse_location(location)
+        return self._write(user_id, point)
+
+    def remove(self, user_id: str) -> bool:
+        return self._write(user_id, None)
+
+    def begin_rebuild(self) -> int:
+        """在读取数据源之前调用：此后的增量写入都会记入日志。返回交给 rebuild / cancel_rebuild 的日志位置"""
+        with self._lock:
+            if self._journal is None:
+                self._journal = []
+            self._pending_rebuilds += 1
+            return len(self._journal)
+
+    def _end_rebuild(self):
+        self._pending_rebuilds -= 1
+        if self._pending_rebuilds <= 0:
+            self._pending_rebuilds = 0
+            self._journal = None
+
+    def cancel_rebuild(self):
+        """读取数据源失败时调用，结束 begin_rebuild 开始的日志记录"""
+        with self._lock:
+            self._end_rebuild()
+
+    def _build(self, records: Iterable[Tuple[str, Any]]) -> Tuple[Dict[str, Tuple[float, float]], Dict[str, Dict[Cell, Set[str]]]]:
+        coords: Dict[str, Tuple[float, float]] = {}
+        for user_id, location in records:
+            point = parse_location(location)
+            if point is not None:
+                coords[user_id] = point
+        grids: Dict[str, Dict[Cell, Set[str]]] = {level: {} for level in self.level_radii_km}
+        if coords:
+            ids = list(coords)
+            points = np.array(list(coords.values()))
+            for level, grid in grids.items():
+                # 单元格坐标整批计算，逐条只做集合插入
+                deg = self._cell_deg[level]
+                ys = np.floor((points[:, 0] + 90.0) / deg).astype(np.int64).tolist()
+                xs = np.floor((points[:, 1] + 180.0) / deg).astype(np.int64).tolist()
+                for user_id, y, x in zip(ids, ys, xs):
+                    members = grid.get((y, x))
+                    if members is None:
+                        grid[(y, x)] = {user_id}
+                    else:
+                        members.add(user_id)
+        return coords, grids
+
+    def rebuild(self, records: Iterable[Tuple[str, Any]], since: Optional[int] = None) -> int:
+        """用 (user_id, location) 全量重建；构建期间旧索引照常提供查询。
+
+        since 为 begin_rebuild 的返回值：换入新索引后重放此后记录的增量写入，避免被较早的快照回退。
+        """
+        started = time.perf_counter()
+        try:
+            coords, grids = self._build(records)
+        except BaseException:
+            if since is not None:
+                self.cancel_rebuild()
+            raise
+        with self._lock:
+            self._coords = coords
+            self._grids = grids
+            if since is not None:
+                for user_id, point in (self._journal or [])[since:]:
+                    self._apply(user_id, point)
+                self._end_rebuild()
+            self.loaded_at = time.time()
+            self.stats["rebuilds"] += 1
+            self.stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return len(coords)
+
+    # 查询
+
+    def cell_users(self, level: str, lat: float, lng: float) -> Tuple[str, List[str]]:
+        """返回 (单元格标识, 单元格内用户)"""
+        cell = self._cell(level, lat, lng)
+        with self._lock:
+            self.stats["queries"] += 1
+            return self._cell_id(level, cell), list(self._grids[level].get(cell, ()))
+
+    @staticmethod
+    def _extent(lat: float, radius_km: float) -> Tuple[float, float]:
+        """圆的外接矩形的半高、半宽（度），不超过整个球面"""
+        dlat = min(180.0, radius_km / KM_PER_DEGREE)
+        dlng = min(180.0, dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        return dlat, dlng
+
+    def _covering_cells(self, level: str, lat: float, lng: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """覆盖以 (lat, lng) 为圆心、radius_km 为半径的圆的外接矩形的全部单元格 (行, 列)"""
+        deg = self._cell_deg[level]
+        dlat, dlng = self._extent(lat, radius_km)
+        (y0, x0), (y1, x1) = self._cell(level, lat - dlat, lng - dlng), self._cell(level, lat + dlat, lng + dlng)
+        ys, xs = np.meshgrid(np.arange(y0, y1 + 1), np.arange(x0, x1 + 1), indexing="ij")
+        return ys.ravel(), xs.ravel()
+
+    def _query_level(self, lat: float, lng: float, radius_km: float) -> Optional[str]:
+        """选用覆盖单元格数不超过 max_query_cells 的最细网格：单元格越细，整格落在圆内的比例越高。
+        没有网格满足预算（或半径覆盖整个球面）时返回 None，由调用方直接扫描全部用户"""
+        if radius_km >= HALF_CIRCUMFERENCE_KM:
+            return None
+        dlat, dlng = self._extent(lat, radius_km)
+        for level, deg in self._cell_deg.items():
+            if (2 * dlat / deg + 2) * (2 * dlng / deg + 2) <= self.max_query_cells:
+                return level
+        return None
+
+    def _all_users(self) -> Tuple[List[str], np.ndarray]:
+        return list(self._coords), np.array(list(self._coords.values()), dtype=float).reshape(-1, 2)
+
+    def _candidates(self, level: str, lat: float, lng: float, radius_km: float) -> Tuple[int, List[str]]:
+        """整格落在圆内的单元格只计数，其余单元格的成员需逐个精确判断；返回 (圆内确定人数, 边界候选)"""
+        deg = self._cell_deg[level]
+        ys, xs = self._covering_cells(level, lat, lng, radius_km)
+        south, west = ys * deg - 90.0, xs * deg - 180.0
+        farthest = np.max([
+            haversine_km(lat, lng, south + dy, west + dx) for dy in (0.0, deg) for dx in (0.0, deg)
+        ], axis=0)
+        nearest_lat = np.clip(lat, south, south + deg)
+        nearest_lng = np.clip(lng, west, west + deg)
+        # 最近点超出半径的单元格不可能有命中
+        reachable = haversine_km(lat, lng, nearest_lat, nearest_lng) <= radius_km
+        grid = self._grids[level]
+        inside = 0
+        boundary: List[str] = []
+        for y, x, whole in zip(ys[reachable].tolist(), xs[reachable].tolist(),
+                               (farthest[reachable] <= radius_km).tolist()):
+            members = grid.get((y, x))
+            if not members:
+                continue
+            if whole:
+                inside += len(members)
+            else:
+                boundary.extend(members)
+        return inside, boundary
+
+    def count_radius(self, lat: float, lng: float, radius_km: float) -> int:
+        with self._lock:
+            self.stats["queries"] += 1
+            level = self._query_level(lat, lng, radius_km)
+            if level is None:
+                inside, (_, points) = 0, self._all_users()
+            else:
+                inside, boundary = self._candidates(level, lat, lng, radius_km)
+                points = np.array([self._coords[user_id] for user_id in boundary], dtype=float).reshape(-1, 2)
+            if not points.shape[0]:
+                return inside
+        return inside + int((haversine_km(lat, lng, points[:, 0], points[:, 1]) <= radius_km).sum())
+
+    def query_radius(self, lat: float, lng: float, radius_km: float,
+                     limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """半径内的用户，按距离升序返回 (user_id, 距离公里)"""
+        with self._lock:
+            self.stats["queries"] += 1
+            level = self._query_level(lat, lng, radius_km)
+            if level is None:
+                ids, points = self._all_users()
+            else:
+                grid = self._grids[level]
+                ys, xs = self._covering_cells(level, lat, lng, radius_km)
+                ids = [user_id for cell in zip(ys.tolist(), xs.tolist()) for user_id in grid.get(cell, ())]
+                points = np.array([self._coords[user_id] for user_id in ids], dtype=float).reshape(-1, 2)
+            if not ids:
+                return []
+        distance = haversine_km(lat, lng, points[:, 0], points[:, 1])
+        within = np.flatnonzero(distance <= radius_km)
+        if limit is not None and len(within) > limit:
+            within = within[np.argpartition(distance[within], limit - 1)[:limit]]
+        within = within[np.argsort(distance[within], kind="stable")]
+        return [(ids[i], round(float(distance[i]), 4)) for i in within]
+
+    def level_counts(self, lat: float, lng: float) -> Dict[str, int]:
+        """各层级半径内的用户数"""
+        return {level: self.count_radius(lat, lng, radius) for level, radius in self.level_radii_km.items()}
+
+    def location_of(self, user_id: str) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            return self._coords.get(user_id)
+
+    def coords_of(self, user_ids: Sequence[str]) -> np.ndarray:
+        """批量取坐标，返回 (len(user_ids), 2) 的 [lat, lng]，不在索引中的行为 NaN"""
+        missing = (math.nan, math.nan)
+        with self._lock:
+            rows = [self._coords.get(user_id, missing) for user_id in user_ids]
+        return np.array(rows, dtype=np.float64).reshape(len(rows), 2)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._coords),
+                "levels": {
+                    level: {"radius_km": radius, "cells": len(self._grids[level])}
+                    for level, radius in self.level_radii_km.items()
+                },
+                "loaded_at": self.loaded_at,
+                **self.stats
+            }
+
+
+async def fetch_user_locations(client, headers: Optional[Dict[str, str]] = None,
+                               per_page: int = 500) -> List[Tuple[str, Any]]:
+    """分页读取 PocketBase users 的 (id, location_data)；client 为带 get(path, params=, headers=) 的异步客户端"""
+    records: List[Tuple[str, Any]] = []
+    page = 1
+    while True:
+        response = await client.get(
+            "/api/collections/users/records",
+            params={"page": page, "perPage": per_page, "fields": "id,location_data", "skipTotal": 1},
+            headers=headers or {}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"PocketBase 返回 {response.status_code}")
+        items = response.json().get("items", [])
+        records.extend((item["id"], item.get("location_data")) for item in items if item.get("id"))
+        if len(items) < per_page:
+            return records
+        page += 1
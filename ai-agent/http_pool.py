@@ -0,0 +1,209 @@
+# FluLink AI Agent - 上游 HTTP 连接池
+# 每个上游一个长期复用的 httpx.AsyncClient（keep-alive、可选 HTTP/2、独立超时），并统计连接池利用率
+# 每个上游各自带熔断器与重试预算：熔断打开时直接抛出 CircuitOpenError，调用方立即走本地降级
+
+import asyncio
+import importlib.util
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError, RetryBudget
+
+logger = logging.getLogger(__name__)
+
+
+# 可安全重试的失败：连接未建立或上游明确表示暂时不可用（读超时不重试，避免放大慢请求）
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+RETRYABLE_STATUS = {502, 503, 504}
+# 计入熔断失败率的状态码
+FAILURE_STATUS = {429, 500, 502, 503, 504}
+
+
+def http2_available() -> bool:
+    """HTTP/2 需要 h2 包（httpx[http2]）"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class UpstreamClient:
+    """单个上游的共享客户端：首次请求时创建，服务关闭时统一释放"""
+
+    def __init__(self, name: str, base_url: str, timeout: float = 10.0, connect_timeout: float = 5.0,
+                 max_connections: int = 100, max_keepalive: int = 20, keepalive_expiry: float = 30.0,
+                 http2: bool = False, breaker: Optional[CircuitBreaker] = None,
+                 retry_budget: Optional[RetryBudget] = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        # HTTP/2 只在 https 上协商；缺少 h2 包时退回 HTTP/1.1
+        self.http2 = bool(http2 and self.base_url.startswith("https") and http2_available())
+        if http2 and self.base_url.startswith("https") and not self.http2:
+            logger.warning(f"上游 {name} 未安装 h2，退回 HTTP/1.1")
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = breaker or CircuitBreaker(name)
+        self.retry_budget = retry_budget or RetryBudget()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "pool_timeouts": 0,
+            "total_latency_ms": 0.0
+        }
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2
+            )
+        return self._client
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        breaker = self.breaker
+        if not breaker.allow():
+            raise CircuitOpenError(self.name, breaker.retry_after())
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            recorded = False
+            try:
+                response = await self._send(method, path, **kwargs)
+            except httpx.PoolTimeout:
+                # 本地连接池耗尽不代表上游故障，不计入熔断
+                breaker.release()
+                recorded = True
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                recorded = True
+                delay = self._retry_delay(attempt) if isinstance(e, RETRYABLE_ERRORS) else None
+                if delay is None:
+                    raise
+            else:
+                if response.status_code in FAILURE_STATUS:
+                    breaker.record_failure()
+                    recorded = True
+                    delay = self._retry_delay(attempt) if response.status_code in RETRYABLE_STATUS else None
+                    if delay is None:
+                        return response
+                    await response.aclose()
+                else:
+                    breaker.record_success()
+                    return response
+            finally:
+                if not recorded and breaker.state != CLOSED:
+                    breaker.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+            if not breaker.allow():
+                raise CircuitOpenError(self.name, breaker.retry_after())
+
+    def _retry_delay(self, attempt: int) -> Optional[float]:
+        # 熔断器已打开或处于半开探测时不再重试
+        if self.breaker.state != CLOSED:
+            return None
+        return self.retry_budget.withdraw(attempt)
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        stats = self.stats
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        started = time.perf_counter()
+        try:
+            return await self.client.request(method, path, **kwargs)
+        except httpx.PoolTimeout:
+            # 连接池已满且等待超时：说明 max_connections 不足
+            stats["pool_timeouts"] += 1
+            stats["errors"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            stats["total_latency_ms"] += (time.perf_counter() - started) * 1000
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _connection_stats(self) -> Dict[str, Any]:
+        """读取 httpcore 连接池中的连接状态（内部结构，读取失败时不影响服务）"""
+        if self._client is None:
+            return {"open": 0, "idle": 0, "active": 0}
+        try:
+            connections = list(self._client._transport._pool.connections)
+            idle = sum(1 for conn in connections if conn.is_idle())
+            return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+        except AttributeError:
+            return {"open": None, "idle": None, "active": None}
+
+    def status(self) -> Dict[str, Any]:
+        stats = self.stats
+        connections = self._connection_stats()
+        max_connections = self.limits.max_connections
+        completed = stats["requests"] - stats["in_flight"]
+        return {
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "timeout": self.timeout.read,
+            "max_connections": max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "connections": connections,
+            "circuit_breaker": self.breaker.status(),
+            "retry_budget": self.retry_budget.status(),
+            "utilization": round(stats["in_flight"] / max_connections, 4) if max_connections else None,
+            "peak_utilization": round(stats["peak_in_flight"] / max_connections, 4) if max_connections else None,
+            "avg_latency_ms": round(stats["total_latency_ms"] / completed, 3) if completed else None,
+            **{key: value for key, value in stats.items() if key != "total_latency_ms"}
+        }
+
+
+class UpstreamRegistry:
+    """按名称管理全部上游客户端"""
+
+    def __init__(self):
+        self._upstreams: Dict[str, UpstreamClient] = {}
+
+    def register(self, upstream: UpstreamClient) -> UpstreamClient:
+        self._upstreams[upstream.name] = upstream
+        return upstream
+
+    def get(self, name: str) -> UpstreamClient:
+        return self._upstreams[name]
+
+    async def aclose(self):
+        for upstream in self._upstreams.values():
+            try:
+                await upstream.aclose()
+            except Exception as e:
+                logger.error(f"关闭上游 {upstream.name} 连接池失败: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {name: upstream.status() for name, upstream in self._upstreams.items()}
+
+    def breaker_states(self) -> Dict[str, str]:
+        return {name: upstream.breaker.state for name, upstream in self._upstreams.items()}
@@ -0,0 +1,212 @@
+# FluLink v4.0 - 多模式关键词匹配（Aho–Corasick）
+# 启动时由全部词典构建一个自动机，一次扫描文本即可得到各类别的命中，耗时与词典规模无关
+# 注意：ai-service 与 ai-agent 各保留一份相同实现（两者独立构建镜像）
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MatchResult:
+    """一次扫描的结果：每个关键词的出现次数，按类别汇总（只遍历命中的关键词，与词典规模无关）"""
+
+    def __init__(self, matcher: "KeywordMatcher", hits: Dict[int, int]):
+        self._matcher = matcher
+        self._hits = hits
+        self._distinct: Dict[str, int] = {}
+        self._occurrences: Dict[str, int] = {}
+        for kid, occurrences in hits.items():
+            for category in matcher.keyword_categories[kid]:
+                self._distinct[category] = self._distinct.get(category, 0) + 1
+                self._occurrences[category] = self._occurrences.get(category, 0) + occurrences
+
+    def keywords(self, category: str) -> List[str]:
+        """命中的不同关键词（按首次载入词典的顺序）"""
+        return [
+            self._matcher.keywords[kid] for kid in sorted(self._hits)
+            if category in self._matcher.keyword_categories[kid]
+        ]
+
+    def count(self, category: str, distinct: bool = True) -> int:
+        """distinct=True 时统计命中的不同关键词数（等价于逐词 `word in text`），否则统计总出现次数"""
+        return (self._distinct if distinct else self._occurrences).get(category, 0)
+
+    def has(self, category: str) -> bool:
+        return category in self._distinct
+
+    def matched_categories(self, prefix: str = "") -> List[str]:
+        """有命中的类别（按词典中的类别顺序），可按前缀筛选"""
+        return [
+            category for category in self._matcher.categories
+            if category.startswith(prefix) and category in self._distinct
+        ]
+
+    def counts(self, distinct: bool = True) -> Dict[str, int]:
+        source = self._distinct if distinct else self._occurrences
+        return {category: source.get(category, 0) for category in self._matcher.categories}
+
+
+class KeywordMatcher:
+    """Aho–Corasick 自动机；同一关键词可属于多个类别"""
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]], ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.categories: List[str] = list(lexicons.keys())
+        self.keywords: List[str] = []
+        self.category_keywords: Dict[str, Tuple[int, ...]] = {}
+        keyword_ids: Dict[str, int] = {}
+        for category, words in lexicons.items():
+            kids = []
+            for word in words:
+                key = word.lower() if ignore_case else word
+                if not key:
+                    continue
+                if key not in keyword_ids:
+                    keyword_ids[key] = len(self.keywords)
+                    self.keywords.append(word)
+                if keyword_ids[key] not in kids:
+                    kids.append(keyword_ids[key])
+            self.category_keywords[category] = tuple(kids)
+        categories_of: List[List[str]] = [[] for _ in self.keywords]
+        for category, kids in self.category_keywords.items():
+            for kid in kids:
+                categories_of[kid].append(category)
+        self.keyword_categories: List[Tuple[str, ...]] = [tuple(c) for c in categories_of]
+        self._build(keyword_ids)
+
+    def _build(self, keyword_ids: Dict[str, int]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Tuple[int, ...]] = [()]
+        for key, kid in keyword_ids.items():
+            state = 0
+            for char in key:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    outputs.append(())
+                state = nxt
+            outputs[state] = outputs[state] + (kid,)
+
+        # 广度优先计算失配指针，并把失配链上的输出合并到本节点
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(char, 0)
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+
+    @property
+    def num_states(self) -> int:
+        return len(self._goto)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """逐个产出 (结束位置, 关键词)"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        if self.ignore_case:
+            text = text.lower()
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for kid in outputs[state]:
+                yield pos, self.keywords[kid]
+
+    def scan(self, text: str) -> MatchResult:
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        if self.ignore_case:
+            text = text.lower()
+        hits: Dict[int, int] = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                for kid in outputs[state]:
+                    hits[kid] = hits.get(kid, 0) + 1
+        return MatchResult(self, hits)
+
+
+def load_lexicons(defaults: Dict[str, List[str]], path: Optional[str]) -> Dict[str, List[str]]:
+    """在内置词典基础上叠加 JSON 词典文件 {类别: [关键词, ...]}；文件中出现的类别整体替换内置词表"""
+    lexicons = {category: list(words) for category, words in defaults.items()}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("词典文件必须是 {类别: [关键词, ...]} 格式")
+        for category, words in data.items():
+            if not isinstance(words, list) or not all(isinstance(w, str) for w in words):
+                raise ValueError(f"词典类别 {category} 必须是字符串列表")
+            lexicons[category] = words
+    return lexicons
+
+
+class LexiconStore:
+    """持有当前自动机，支持热重载：新自动机构建完成后整体替换引用，扫描中的请求不受影响"""
+
+    def __init__(self, defaults: Dict[str, List[str]], path: Optional[str] = None, ignore_case: bool = False):
+        self.defaults = defaults
+        self.path = path or None
+        self.ignore_case = ignore_case
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._mtime: Optional[float] = None
+        self._error: Optional[str] = None
+        self.matcher = KeywordMatcher(defaults, ignore_case)
+        if self.path:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"词典文件加载失败，使用内置词典: {e}")
+        else:
+            self._loaded_at = time.time()
+
+    def reload(self) -> Dict[str, Any]:
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path) if self.path else None
+                matcher = KeywordMatcher(load_lexicons(self.defaults, self.path), self.ignore_case)
+            except Exception as e:
+                self._error = str(e)
+                raise
+            self.matcher = matcher
+            self._mtime = mtime
+            self._loaded_at = time.time()
+            self._error = None
+        logger.info(f"关键词词典已加载: {len(matcher.keywords)} 个关键词, {matcher.num_states} 个状态")
+        return self.status()
+
+    def scan(self, text: str) -> MatchResult:
+        return self.matcher.scan(text)
+
+    def status(self) -> Dict[str, Any]:
+        matcher = self.matcher
+        return {
+            "path": self.path,
+            "ignore_case": self.ignore_case,
+            "categories": {category: len(kids) for category, kids in matcher.category_keywords.items()},
+            "keywords": len(matcher.keywords),
+            "states": matcher.num_states,
+            "loaded_at": self._loaded_at,
+            "file_mtime": self._mtime,
+            "error": self._error
+        }
@@ -5,12 +5,19 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-import httpx
 import json
 import logging
 from datetime import datetime
 import asyncio
 import os
+import zlib
+from keyword_matcher import LexiconStore
+from http_pool import UpstreamClient, UpstreamRegistry
+from circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget
+from embedder import EMBEDDING_MODES, EmbeddingUnavailable, LocalEmbedder, RemoteEmbedder
+from request_cache import SingleFlight, TTLCache, request_key
+from spread_simulator import SpreadSimulator
+from geo_index import DEFAULT_LEVEL_RADII_KM, GeoIndex, fetch_user_locations, parse_location
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +44,102 @@ CONTEXT7_API_KEY = os.getenv("CONTEXT7_API_KEY", "ctx7sk-3eff1f70-bd18-43af-955d
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 POCKETBASE_URL = os.getenv("POCKETBASE_URL", "http://pocketbase:8090")
 CHROMA_URL = os.getenv("CHROMA_URL", "http://chroma:8000")
+CONTEXT7_BASE_URL = os.getenv("CONTEXT7_BASE_URL", "https://api.context7.ai/v1")
+AI_SERVICE_URL = os.getenv("AI_SERVICE_URL", "")
+
+# 向量化配置：与 ai-service 使用同一模型，保证两个服务产生的向量可直接比较
+# local: 进程内加载模型；ai_service: 调用 AI_SERVICE_URL（未设置 AGENT_EMBEDDING_MODE 时按是否配置该地址选择）
+EMBEDDING_CONFIG = {
+    "mode": os.getenv("AGENT_EMBEDDING_MODE", "ai_service" if AI_SERVICE_URL else "local"),
+    "model_name": os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"),
+    "max_batch_size": int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+    "max_wait_ms": float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5")),
+    "timeout": float(os.getenv("EMBEDDING_TIMEOUT", "10")),
+    "cache_ttl": float(os.getenv("EMBEDDING_CACHE_TTL", "3600")),
+    "cache_max_entries": int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+}
+if EMBEDDING_CONFIG["mode"] not in EMBEDDING_MODES:
+    raise ValueError(f"AGENT_EMBEDDING_MODE 仅支持 {', '.join(EMBEDDING_MODES)}")
+
+# 上游连接池配置（每个上游一个长期复用的客户端）
+HTTP_POOL_CONFIG = {
+    "max_connections": int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+    "max_keepalive": int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")),
+    "keepalive_expiry": float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30")),
+    "connect_timeout": float(os.getenv("HTTP_POOL_CONNECT_TIMEOUT", "5")),
+    "http2": os.getenv("HTTP2_ENABLED", "true").lower() == "true"   # 仅对 https 上游生效
+}
+
+UPSTREAM_TIMEOUTS = {
+    "context7": float(os.getenv("CONTEXT7_TIMEOUT", "30")),
+    "chroma": float(os.getenv("CHROMA_TIMEOUT", "10")),
+    "pocketbase": float(os.getenv("POCKETBASE_TIMEOUT", "10")),
+    "ai_service": float(os.getenv("AI_SERVICE_TIMEOUT", "10"))
+}
+
+# 上游熔断配置：窗口内失败率达到阈值即打开，冷却后放行少量探测请求
+CIRCUIT_BREAKER_CONFIG = {
+    "failure_rate_threshold": float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+    "min_requests": int(os.getenv("CIRCUIT_MIN_REQUESTS", "5")),
+    "window_seconds": float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30")),
+    "open_seconds": float(os.getenv("CIRCUIT_OPEN_SECONDS", "15")),
+    "half_open_max_calls": int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+}
+
+# 重试预算：每个请求积累 ratio 次重试额度，退避时间带随机抖动
+RETRY_CONFIG = {
+    "max_retries": int(os.getenv("UPSTREAM_MAX_RETRIES", "2")),
+    "ratio": float(os.getenv("RETRY_BUDGET_RATIO", "0.2")),
+    "max_tokens": float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10")),
+    "backoff_base": float(os.getenv("RETRY_BACKOFF_BASE", "0.05")),
+    "backoff_max": float(os.getenv("RETRY_BACKOFF_MAX", "1.0"))
+}
+
+# Context7 分析结果缓存：只缓存上游成功返回的结果，降级结果不入缓存
+CONTEXT7_CACHE_CONFIG = {
+    "ttl_seconds": float(os.getenv("CONTEXT7_CACHE_TTL", "300")),
+    "max_entries": int(os.getenv("CONTEXT7_CACHE_MAX_ENTRIES", "10000"))
+}
+
+# 传播模拟配置：每次请求在预算内尽量完成 runs 次级联，按 chunk_runs 分块并行
+SPREAD_SIMULATION_CONFIG = {
+    "workers": int(os.getenv("SPREAD_SIM_WORKERS", "2")),  # 0 为不启用进程池；与请求处理共用 CPU，默认只用少量进程
+    "runs": int(os.getenv("SPREAD_SIM_RUNS", "4000")),
+    "chunk_runs": int(os.getenv("SPREAD_SIM_CHUNK_RUNS", "500")),
+    "budget_ms": float(os.getenv("SPREAD_SIM_BUDGET_MS", "200"))
+}
+
+# 地理层级索引配置：启动时从 PocketBase users.location_data 全量加载，之后按 refresh_seconds 定期重建，
+# 用户位置变化由 PocketBase 钩子通过 /api/geo/users 增量推送
+GEO_INDEX_CONFIG = {
+    "enabled": os.getenv("GEO_INDEX_ENABLED", "true").lower() == "true",
+    "refresh_seconds": float(os.getenv("GEO_INDEX_REFRESH_SECONDS", "600")),   # 0 为只在启动时加载
+    "page_size": int(os.getenv("GEO_INDEX_PAGE_SIZE", "500")),
+    "max_query_cells": int(os.getenv("GEO_INDEX_MAX_QUERY_CELLS", "4096")),
+    "level_radii_km": {
+        level: float(os.getenv(f"GEO_RADIUS_{level.upper()}_KM", str(radius)))
+        for level, radius in DEFAULT_LEVEL_RADII_KM.items()
+    }
+}
+
+# 各地理层级的默认人口（地理索引未加载或发布位置缺失时使用）
+LEVEL_POPULATIONS = {
+    "community": 50,
+    "neighborhood": 200,
+    "street": 1000,
+    "city": 10000
+}
+
+# 毒性降级分析词典：LEXICON_PATH 指向的 JSON 文件可替换或扩充，支持热重载
+TOXICITY_LEXICONS = {
+    "high": ["病毒", "感染", "传播", "爆发", "疫情", "危险", "致命"],
+    "medium": ["流行", "趋势", "热门", "火爆", "疯狂", "强烈"],
+    "low": ["有趣", "好玩", "新奇", "特别", "独特"]
+}
+TOXICITY_WEIGHTS = {"high": 3, "medium": 2, "low": 1}
+
+# 启动时构建一次自动机，降级分析只需扫描一遍内容
+toxicity_lexicons = LexiconStore(TOXICITY_LEXICONS, os.getenv("LEXICON_PATH", ""), ignore_case=True)
 
 # 德道经规则配置
 DAOISM_RULES = {
@@ -85,6 +188,10 @@ class SpreadPredictionResponse(BaseModel):
     confidence_score: float
     geo_hierarchy_progression: List[str]
     daoism_compliance: bool
+    simulation: Optional[Dict[str, Any]] = None
+
+class GeoUsersUpdate(BaseModel):
+    users: List[Dict[str, Any]]               # {"id": ..., "location_data": {...}}，位置为空表示移除
 
 class EmbeddingRequest(BaseModel):
     content: str
@@ -97,61 +204,58 @@ class EmbeddingResponse(BaseModel):
 
 # Context7 API 客户端
 class Context7Client:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, http: UpstreamClient, cache: Optional[TTLCache] = None):
         self.api_key = api_key
-        self.base_url = "https://api.context7.ai/v1"
+        self.http = http
+        self.base_url = http.base_url
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        self.cache = cache or TTLCache()
+        self.single_flight = SingleFlight()
 
     async def analyze_content(self, content: str, analysis_type: str = "toxicity") -> Dict[str, Any]:
-        """使用Context7 API分析内容"""
+        """使用Context7 API分析内容（先查缓存；并发的相同请求合并为一次上游调用）"""
+        key = request_key(analysis_type, content)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        return await self.single_flight.do(key, lambda: self._request_analysis(key, content, analysis_type))
+
+    async def _request_analysis(self, key: str, content: str, analysis_type: str) -> Dict[str, Any]:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/analyze",
-                    headers=self.headers,
-                    json={
-                        "content": content,
-                        "analysis_type": analysis_type,
-                        "language": "zh-CN",
-                        "context": "social_media_viral_content"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Context7 API error: {response.status_code} - {response.text}")
-                    return await self._fallback_analysis(content)
-                    
+            response = await self.http.post(
+                "/analyze",
+                headers=self.headers,
+                json={
+                    "content": content,
+                    "analysis_type": analysis_type,
+                    "language": "zh-CN",
+                    "context": "social_media_viral_content"
+                }
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                self.cache.put(key, result)
+                return result
+            else:
+                logger.error(f"Context7 API error: {response.status_code} - {response.text}")
+                return await self._fallback_analysis(content)
+
+        except CircuitOpenError:
+            # 熔断期间不等待上游超时，直接本地降级
+            return await self._fallback_analysis(content)
         except Exception as e:
             logger.error(f"Context7 API request failed: {e}")
             return await self._fallback_analysis(content)
 
     async def _fallback_analysis(self, content: str) -> Dict[str, Any]:
         """降级分析策略"""
-        # 基于关键词的简单毒性分析
-        toxicity_keywords = {
-            "high": ["病毒", "感染", "传播", "爆发", "疫情", "危险", "致命"],
-            "medium": ["流行", "趋势", "热门", "火爆", "疯狂", "强烈"],
-            "low": ["有趣", "好玩", "新奇", "特别", "独特"]
-        }
-        
-        content_lower = content.lower()
-        score = 0
-        
-        for level, keywords in toxicity_keywords.items():
-            for keyword in keywords:
-                if keyword in content_lower:
-                    if level == "high":
-                        score += 3
-                    elif level == "medium":
-                        score += 2
-                    else:
-                        score += 1
+        # 基于关键词的简单毒性分析（每个命中的不同关键词按所属等级计分）
+        match = toxicity_lexicons.scan(content)
+        score = sum(weight * match.count(level) for level, weight in TOXICITY_WEIGHTS.items())
         
         # 基于内容长度的调整
         length_factor = min(len(content) / 100, 2.0)
@@ -166,23 +270,22 @@ class Context7Client:
 
 # ChromaDB 客户端
 class ChromaClient:
-    def __init__(self, base_url: str):
-        self.base_url = base_url
+    def __init__(self, http: UpstreamClient):
+        self.http = http
+        self.base_url = http.base_url
 
     async def add_embedding(self, collection_name: str, id: str, embedding: List[float], metadata: Dict[str, Any]):
         """添加向量嵌入到ChromaDB"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/collections/{collection_name}/add",
-                    json={
-                        "ids": [id],
-                        "embeddings": [embedding],
-                        "metadatas": [metadata]
-                    },
-                    timeout=10.0
-                )
-                return response.status_code == 200
+            response = await self.http.post(
+                f"/api/v1/collections/{collection_name}/add",
+                json={
+                    "ids": [id],
+                    "embeddings": [embedding],
+                    "metadatas": [metadata]
+                }
+            )
+            return response.status_code == 200
         except Exception as e:
             logger.error(f"ChromaDB add embedding failed: {e}")
             return False
@@ -190,26 +293,25 @@ class ChromaClient:
     async def query_similar(self, collection_name: str, query_embedding: List[float], n_results: int = 10):
         """查询相似向量"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/collections/{collection_name}/query",
-                    json={
-                        "query_embeddings": [query_embedding],
-                        "n_results": n_results
-                    },
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return None
+            response = await self.http.post(
+                f"/api/v1/collections/{collection_name}/query",
+                json={
+                    "query_embeddings": [query_embedding],
+                    "n_results": n_results
+                }
+            )
+            if response.status_code == 200:
+                return response.json()
+            return None
         except Exception as e:
             logger.error(f"ChromaDB query failed: {e}")
             return None
 
 # PocketBase 客户端
 class PocketBaseClient:
-    def __init__(self, base_url: str, admin_email: str, admin_password: str):
-        self.base_url = base_url
+    def __init__(self, http: UpstreamClient, admin_email: str, admin_password: str):
+        self.http = http
+        self.base_url = http.base_url
         self.admin_email = admin_email
         self.admin_password = admin_password
         self.auth_token = None
@@ -217,51 +319,94 @@ class PocketBaseClient:
     async def authenticate(self):
         """管理员认证"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/admins/auth-with-password",
-                    json={
-                        "identity": self.admin_email,
-                        "password": self.admin_password
-                    },
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    self.auth_token = data.get("token")
-                    return True
-                return False
+            response = await self.http.post(
+                "/api/admins/auth-with-password",
+                json={
+                    "identity": self.admin_email,
+                    "password": self.admin_password
+                }
+            )
+            if response.status_code == 200:
+                data = response.json()
+                self.auth_token = data.get("token")
+                return True
+            return False
         except Exception as e:
             logger.error(f"PocketBase authentication failed: {e}")
             return False
 
+    async def list_user_locations(self, per_page: int = 500) -> List[tuple]:
+        """分页读取全部用户的 (id, location_data)"""
+        if not self.auth_token and not await self.authenticate():
+            raise RuntimeError("PocketBase 认证失败")
+        return await fetch_user_locations(
+            self.http, headers={"Authorization": f"Bearer {self.auth_token}"}, per_page=per_page
+        )
+
     async def update_strain(self, strain_id: str, data: Dict[str, Any]):
         """更新毒株数据"""
         if not self.auth_token:
             await self.authenticate()
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.patch(
-                    f"{self.base_url}/api/collections/strains/records/{strain_id}",
-                    headers={"Authorization": f"Bearer {self.auth_token}"},
-                    json=data,
-                    timeout=10.0
-                )
-                return response.status_code == 200
+            response = await self.http.patch(
+                f"/api/collections/strains/records/{strain_id}",
+                headers={"Authorization": f"Bearer {self.auth_token}"},
+                json=data
+            )
+            return response.status_code == 200
         except Exception as e:
             logger.error(f"PocketBase update strain failed: {e}")
             return False
 
+# 全局上游连接池
+upstreams = UpstreamRegistry()
+_upstream_urls = [("context7", CONTEXT7_BASE_URL), ("chroma", CHROMA_URL), ("pocketbase", POCKETBASE_URL)]
+if EMBEDDING_CONFIG["mode"] == "ai_service":
+    _upstream_urls.append(("ai_service", AI_SERVICE_URL or "http://ai-service:8000"))
+for _name, _url in _upstream_urls:
+    upstreams.register(UpstreamClient(
+        _name, _url,
+        timeout=UPSTREAM_TIMEOUTS[_name],
+        connect_timeout=HTTP_POOL_CONFIG["connect_timeout"],
+        max_connections=HTTP_POOL_CONFIG["max_connections"],
+        max_keepalive=HTTP_POOL_CONFIG["max_keepalive"],
+        keepalive_expiry=HTTP_POOL_CONFIG["keepalive_expiry"],
+        http2=HTTP_POOL_CONFIG["http2"],
+        breaker=CircuitBreaker(_name, **CIRCUIT_BREAKER_CONFIG),
+        retry_budget=RetryBudget(**RETRY_CONFIG)
+    ))
+
 # 全局客户端实例
-context7_client = Context7Client(CONTEXT7_API_KEY)
-chroma_client = ChromaClient(CHROMA_URL)
+context7_client = Context7Client(
+    CONTEXT7_API_KEY,
+    upstreams.get("context7"),
+    cache=TTLCache(CONTEXT7_CACHE_CONFIG["ttl_seconds"], CONTEXT7_CACHE_CONFIG["max_entries"])
+)
+chroma_client = ChromaClient(upstreams.get("chroma"))
 pb_client = PocketBaseClient(
-    POCKETBASE_URL,
+    upstreams.get("pocketbase"),
     os.getenv("POCKETBASE_ADMIN_EMAIL", "admin@flulink.app"),
     os.getenv("POCKETBASE_ADMIN_PASSWORD", "Flulink2025!Admin")
 )
 
+# 向量化：本地模型或 ai-service，两者都带向量缓存
+_embedding_cache = TTLCache(EMBEDDING_CONFIG["cache_ttl"], EMBEDDING_CONFIG["cache_max_entries"])
+if EMBEDDING_CONFIG["mode"] == "ai_service":
+    embedder = RemoteEmbedder(upstreams.get("ai_service"), EMBEDDING_CONFIG["model_name"], _embedding_cache)
+else:
+    embedder = LocalEmbedder(
+        EMBEDDING_CONFIG["model_name"],
+        _embedding_cache,
+        max_batch_size=EMBEDDING_CONFIG["max_batch_size"],
+        max_wait_ms=EMBEDDING_CONFIG["max_wait_ms"],
+        timeout=EMBEDDING_CONFIG["timeout"]
+    )
+
+spread_simulator = SpreadSimulator(**SPREAD_SIMULATION_CONFIG)
+geo_index = GeoIndex(GEO_INDEX_CONFIG["level_radii_km"], GEO_INDEX_CONFIG["max_query_cells"])
+_geo_task: Optional[asyncio.Task] = None
+
 # 毒性分析服务
 @app.post("/api/analyze/toxicity", response_model=ToxicityAnalysisResponse)
 async def analyze_toxicity(request: ToxicityAnalysisRequest):
@@ -310,28 +455,46 @@ async def predict_spread(request: SpreadPredictionRequest):
         user_level_config = DAOISM_RULES["user_levels"][request.creator_level]
         allowed_levels = user_level_config["spread_range"]
         
-        # 构建传播路径
+        # 通过感染阈值的层级按顺序参与模拟
+        infection_rate = min(request.toxicity_score / 10, 1.0)
+        geo_hierarchy_progression = [
+            level for level in allowed_levels
+            if request.toxicity_score >= DAOISM_RULES["spread_hierarchy"][level]["infection_threshold"]
+        ]
+        populations = await asyncio.get_event_loop().run_in_executor(
+            None, _level_populations, geo_hierarchy_progression, request.origin_location
+        )
+        levels = [
+            (
+                level,
+                populations[level],
+                DAOISM_RULES["spread_hierarchy"][level]["delay_minutes"],
+                DAOISM_RULES["spread_hierarchy"][level]["infection_threshold"]
+            )
+            for level in geo_hierarchy_progression
+        ]
+
         predicted_path = []
-        geo_hierarchy_progression = []
-        
-        for level in allowed_levels:
-            level_config = DAOISM_RULES["spread_hierarchy"][level]
-            
-            # 检查感染阈值
-            if request.toxicity_score >= level_config["infection_threshold"]:
-                geo_hierarchy_progression.append(level)
-                
-                # 预测该层级的传播
-                estimated_users = await _estimate_level_users(level, request.origin_location)
+        estimated_reach = 0
+        simulation = None
+        if levels:
+            # 同一毒株同一参数得到同一预测
+            seed = zlib.crc32(f"{request.strain_id}:{request.creator_level}:{request.toxicity_score}".encode("utf-8"))
+            simulation = await spread_simulator.simulate(
+                levels, infection_rate, user_level_config["immunity_power"], seed
+            )
+            for (level, _, delay_minutes, _), result in zip(levels, simulation["levels"]):
                 predicted_path.append({
                     "level": level,
-                    "estimated_users": estimated_users,
-                    "delay_minutes": level_config["delay_minutes"],
-                    "infection_rate": min(request.toxicity_score / 10, 1.0)
+                    "estimated_users": int(result["reach"]["p50"] or 0),
+                    "delay_minutes": delay_minutes,
+                    "infection_rate": infection_rate,
+                    "reach_probability": result["reach_probability"],
+                    "reach_percentiles": result["reach"],
+                    "start_minutes": result["start_minutes"],
+                    "saturation_minutes": result["saturation_minutes"]
                 })
-        
-        # 计算总预估到达人数
-        estimated_reach = sum(level["estimated_users"] for level in predicted_path)
+            estimated_reach = int(simulation["total_reach"]["p50"] or 0)
         
         # 计算置信度分数
         confidence_score = min(request.toxicity_score / 10, 1.0)
@@ -341,7 +504,8 @@ async def predict_spread(request: SpreadPredictionRequest):
             estimated_reach=estimated_reach,
             confidence_score=confidence_score,
             geo_hierarchy_progression=geo_hierarchy_progression,
-            daoism_compliance=True
+            daoism_compliance=True,
+            simulation={k: v for k, v in simulation.items() if k != "levels"} if simulation else None
         )
         
     except Exception as e:
@@ -351,44 +515,61 @@ async def predict_spread(request: SpreadPredictionRequest):
 # 向量化服务
 @app.post("/api/embed", response_model=EmbeddingResponse)
 async def create_embedding(request: EmbeddingRequest):
-    """创建内容向量嵌入"""
+    """创建内容向量嵌入（与 ai-service 同一模型；不可用时返回 503，不生成占位向量）"""
     try:
-        # 使用Context7 API生成嵌入向量
-        embedding_result = await context7_client.analyze_content(
-            request.content, 
-            analysis_type="embedding"
-        )
-        
-        vector = embedding_result.get("embedding", [])
-        if not vector:
-            # 降级策略：生成随机向量
-            vector = [0.1] * 384  # 标准向量维度
-        
-        return EmbeddingResponse(
-            vector=vector,
-            dimension=len(vector),
-            model_used="context7"
-        )
-        
+        vector, model_used = await embedder.embed(request.content)
+    except EmbeddingUnavailable as e:
+        logger.warning(f"Embedding unavailable: {e}")
+        raise HTTPException(status_code=503, detail=f"向量化暂不可用: {e}")
     except Exception as e:
         logger.error(f"Embedding creation failed: {e}")
         raise HTTPException(status_code=500, detail=f"向量化失败: {str(e)}")
 
+    return EmbeddingResponse(
+        vector=vector.tolist(),
+        dimension=len(vector),
+        model_used=model_used
+    )
+
 # 辅助函数
-async def _estimate_level_users(level: str, location: Dict[str, Any]) -> int:
-    """估算层级用户数量"""
-    # 基于地理层级的用户数量估算
-    level_multipliers = {
-        "community": 50,
-        "neighborhood": 200,
-        "street": 1000,
-        "city": 10000
-    }
-    
-    base_users = level_multipliers.get(level, 50)
-    # 添加随机变化
-    import random
-    return int(base_users * random.uniform(0.8, 1.2))
+def _level_populations(levels: List[str], location: Dict[str, Any]) -> Dict[str, int]:
+    """各层级的用户数：地理索引已加载时按发布位置实时统计，否则使用默认人口。
+    层级半径相互嵌套，每个层级只计入上一层级半径之外的环形区域，总触达不重复计数"""
+    origin = parse_location(location)
+    populations = {}
+    inner = 0
+    for level in levels:
+        radius = geo_index.level_radii_km.get(level)
+        if origin is not None and radius is not None and len(geo_index):
+            within = geo_index.count_radius(origin[0], origin[1], radius)
+            # 至少包含创作者本人
+            populations[level] = max(1, within - inner)
+            inner = max(inner, within)
+        else:
+            populations[level] = LEVEL_POPULATIONS.get(level, LEVEL_POPULATIONS["community"])
+    return populations
+
+async def _reload_geo_index() -> int:
+    """全量重建地理索引；读取期间收到的增量推送在换入新索引后重放"""
+    since = geo_index.begin_rebuild()
+    try:
+        records = await pb_client.list_user_locations(GEO_INDEX_CONFIG["page_size"])
+    except BaseException:
+        geo_index.cancel_rebuild()
+        raise
+    return await asyncio.get_event_loop().run_in_executor(None, geo_index.rebuild, records, since)
+
+async def _geo_refresh_loop():
+    """启动时加载一次，之后定期全量重建（增量推送遗漏时以此兜底）"""
+    while True:
+        try:
+            users = await _reload_geo_index()
+            logger.info(f"✅ 地理索引已加载 ({users} 个有位置的用户)")
+        except Exception as e:
+            logger.warning(f"⚠️ 地理索引加载失败: {e}")
+        if GEO_INDEX_CONFIG["refresh_seconds"] <= 0:
+            return
+        await asyncio.sleep(GEO_INDEX_CONFIG["refresh_seconds"])
 
 # 健康检查
 @app.get("/health")
@@ -399,14 +580,83 @@ async def health_check():
         "service": "FluLink AI Agent",
         "version": "1.0.0",
         "daoism_rules_loaded": True,
+        "lexicons": toxicity_lexicons.status(),
+        "circuit_breakers": upstreams.breaker_states(),
+        "upstreams": upstreams.status(),
+        "embedding": embedder.status(),
+        "spread_simulation": spread_simulator.status(),
+        "geo_index": geo_index.status(),
+        "context7_cache": {
+            "cache": context7_client.cache.status(),
+            "single_flight": context7_client.single_flight.status()
+        },
         "timestamp": datetime.now().isoformat()
     }
 
+# 地理索引增量更新与查询
+@app.post("/api/geo/users")
+async def update_geo_users(request: GeoUsersUpdate):
+    """写入或移动用户位置（location_data 为空时移除）"""
+    changed = 0
+    for user in request.users:
+        if user.get("id"):
+            changed += geo_index.upsert(str(user["id"]), user.get("location_data", user.get("location")))
+    return {"changed": changed, "users": len(geo_index)}
+
+@app.delete("/api/geo/users/{user_id}")
+async def delete_geo_user(user_id: str):
+    return {"removed": geo_index.remove(user_id), "users": len(geo_index)}
+
+@app.post("/api/geo/reload")
+async def reload_geo_index():
+    """立即从 PocketBase 全量重建地理索引"""
+    try:
+        users = await _reload_geo_index()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"地理索引加载失败: {e}")
+    return {"status": "success", "users": users}
+
+@app.get("/api/geo/levels")
+async def geo_level_counts(lat: float, lng: float):
+    """各传播层级半径内的用户数与发布位置所在单元格"""
+    loop = asyncio.get_event_loop()
+    counts = await loop.run_in_executor(None, geo_index.level_counts, lat, lng)
+    return {
+        "levels": {
+            level: {
+                "radius_km": geo_index.level_radii_km[level],
+                "users": count,
+                "cell": geo_index.cell_users(level, lat, lng)[0]
+            }
+            for level, count in counts.items()
+        }
+    }
+
+# 热重载毒性词典
+@app.post("/api/lexicons/reload")
+async def reload_lexicons():
+    """重新读取 LEXICON_PATH 并重建自动机（构建完成前继续使用旧词典）"""
+    try:
+        status = await asyncio.get_event_loop().run_in_executor(None, toxicity_lexicons.reload)
+        return {"status": "success", "lexicons": status}
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"词典加载失败: {e}")
+
 # 启动事件
 @app.on_event("startup")
 async def startup_event():
     """服务启动时初始化"""
+    global _geo_task
     logger.info("FluLink AI Agent 启动中...")
+
+    # 本地模式在后台加载嵌入模型，不阻塞启动
+    await embedder.start()
+
+    # 预热传播模拟进程
+    try:
+        await spread_simulator.start()
+    except Exception as e:
+        logger.warning(f"⚠️ 传播模拟进程池预热失败: {e}")
     
     # 验证Context7 API连接
     try:
@@ -424,9 +674,24 @@ async def startup_event():
             logger.warning("⚠️ PocketBase 认证失败")
     except Exception as e:
         logger.warning(f"⚠️ PocketBase 连接异常: {e}")
+
+    # 地理索引在后台加载，未加载完成前按默认人口预测
+    if GEO_INDEX_CONFIG["enabled"]:
+        _geo_task = asyncio.create_task(_geo_refresh_loop())
     
     logger.info("🚀 FluLink AI Agent 启动完成")
 
+# 关闭事件
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止向量化微批处理、传播模拟进程池并释放各上游连接池"""
+    await embedder.stop()
+    spread_simulator.shutdown()
+    if _geo_task:
+        _geo_task.cancel()
+    await upstreams.aclose()
+    logger.info("FluLink AI Agent 已关闭")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,239 @@
+# FluLink AI Agent - 传播蒙特卡洛模拟
+# 按德道经地理层级逐级模拟：每个层级内为 Reed-Frost 链式二项级联，上一层级感染率达到下一层级的
+# infection_threshold 后才向其扩散，且不早于该层级的 delay_minutes
+# 数千次独立级联以 numpy 数组同时推进；按块分发到进程池（在途的块不超过工作进程数），每次请求有固定的毫秒预算
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMULATION_PARAMS = {
+    "base_r0": 3.0,              # 毒性 10、免疫力量 1.0 时每个感染者平均再感染人数
+    "bridge_fraction": 0.05,     # 上一层级感染者中把毒株带入下一层级的比例
+    "generation_minutes": 15.0,  # 一代传播所需时间
+    "max_generations": 48,
+    "saturation": 0.9            # 感染达到最终规模的该比例时视为该层级传播完成
+}
+
+
+def simulate_chunk(levels: Sequence[Tuple[str, int, float, float]], infection_rate: float,
+                   immunity_power: float, runs: int, seed: Any,
+                   params: Optional[Dict[str, Any]] = None) -> Dict[str, np.ndarray]:
+    """模拟 runs 次独立级联。levels 为 (层级, 人口, delay_minutes, infection_threshold)，按传播顺序排列。
+
+    返回 reach / start / saturation 三个 (runs, 层级数) 数组；未到达的层级 reach 为 0，时间为 nan。
+    """
+    params = {**DEFAULT_SIMULATION_PARAMS, **(params or {})}
+    rng = np.random.default_rng(seed)
+    gen_minutes = float(params["generation_minutes"])
+    max_generations = int(params["max_generations"])
+    # 免疫力量越高，毒株越能突破受众的免疫，传播力按比例放大
+    r0 = float(params["base_r0"]) * infection_rate * immunity_power
+
+    reach = np.zeros((runs, len(levels)), dtype=np.int64)
+    start = np.full((runs, len(levels)), np.nan)
+    saturation = np.full((runs, len(levels)), np.nan)
+
+    # 第一层级由创作者本人发起
+    seeds = np.ones(runs, dtype=np.int64)
+    level_start = np.full(runs, float(levels[0][2]) if levels else 0.0)
+    for k, (_, population, _, _) in enumerate(levels):
+        population = max(1, int(population))
+        active = seeds > 0
+        seeds = np.minimum(seeds, population)
+        susceptible = population - seeds
+        infected = seeds.copy()
+        cumulative = np.zeros((max_generations + 1, runs), dtype=np.int64)
+        cumulative[0] = seeds
+        generations = 0
+        for g in range(1, max_generations + 1):
+            if not infected.any():
+                break
+            # Reed-Frost：每个易感者在本代被至少一名感染者传染的概率
+            p = -np.expm1(-r0 * infected / population)
+            infected = rng.binomial(susceptible, p)
+            susceptible -= infected
+            cumulative[g] = cumulative[g - 1] + infected
+            generations = g
+        cumulative[generations + 1:] = cumulative[generations]
+        final = cumulative[-1]
+
+        reach[active, k] = final[active]
+        start[active, k] = level_start[active]
+        done = np.argmax(cumulative >= np.ceil(params["saturation"] * final), axis=0)
+        saturation[active, k] = level_start[active] + done[active] * gen_minutes
+
+        if k + 1 == len(levels):
+            break
+        # 下一层级：本层级感染率越过其阈值的时刻之后（且不早于其固定延迟）开始
+        _, _, next_delay, next_threshold = levels[k + 1]
+        crossed = cumulative >= math.ceil(next_threshold * population)
+        reached = active & crossed[-1]
+        cross_time = level_start + np.argmax(crossed, axis=0) * gen_minutes
+        level_start = np.maximum(cross_time, float(next_delay))
+        seeds = np.where(reached, np.maximum(1, rng.binomial(final, params["bridge_fraction"])), 0)
+
+    return {"reach": reach, "start": start, "saturation": saturation}
+
+
+def _percentiles(values: np.ndarray, percentiles: Sequence[float]) -> Dict[str, Optional[float]]:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {f"p{int(p)}": None for p in percentiles}
+    return {f"p{int(p)}": round(float(v), 2) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+
+
+def summarize(levels: Sequence[Tuple[str, int, float, float]], chunks: List[Dict[str, np.ndarray]],
+              percentiles: Sequence[float] = (10, 50, 90)) -> Dict[str, Any]:
+    """合并各块结果：每个层级的到达概率、触达人数与开始/完成时间分位数，以及总触达分位数"""
+    reach = np.concatenate([c["reach"] for c in chunks])
+    start = np.concatenate([c["start"] for c in chunks])
+    saturation = np.concatenate([c["saturation"] for c in chunks])
+    per_level = []
+    for k, (level, population, _, _) in enumerate(levels):
+        per_level.append({
+            "level": level,
+            "population": int(population),
+            "reach_probability": round(float(np.mean(~np.isnan(start[:, k]))), 4),
+            "reach": _percentiles(reach[:, k].astype(float), percentiles),
+            "start_minutes": _percentiles(start[:, k], percentiles),
+            "saturation_minutes": _percentiles(saturation[:, k], percentiles)
+        })
+    return {
+        "runs": int(reach.shape[0]),
+        "levels": per_level,
+        "total_reach": _percentiles(reach.sum(axis=1).astype(float), percentiles)
+    }
+
+
+def _discard_result(future: asyncio.Future):
+    """预算耗尽后仍在运行的块：丢弃结果，取出异常以免被当作未处理的异常记录"""
+    if not future.cancelled():
+        future.exception()
+
+
+class SpreadSimulator:
+    """传播模拟进程池：按块并行，预算耗尽时只汇总已完成的块（至少一块）"""
+
+    def __init__(self, workers: int, runs: int = 4000, chunk_runs: int = 500, budget_ms: float = 200.0,
+                 percentiles: Sequence[float] = (10, 50, 90), params: Optional[Dict[str, Any]] = None):
+        self.workers = max(0, workers)
+        self.runs = max(1, runs)
+        self.chunk_runs = max(1, chunk_runs)
+        self.budget_ms = budget_ms
+        self.percentiles = tuple(percentiles)
+        self.params = {**DEFAULT_SIMULATION_PARAMS, **(params or {})}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats = {"requests": 0, "chunks": 0, "over_budget": 0, "restarts": 0, "last_runs": 0, "last_ms": None}
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers == 0:
+            # 不启用进程池时在默认线程池中计算
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def start(self):
+        """预热工作进程，避免首个请求的预算被进程启动耗尽"""
+        executor = self._get_executor()
+        if executor is None:
+            return
+        loop = asyncio.get_running_loop()
+        warmup = [("warmup", 1, 0.0, 0.0)]
+        await asyncio.gather(*[
+            loop.run_in_executor(executor, simulate_chunk, warmup, 0.0, 1.0, 1, i, self.params)
+            for i in range(self.workers)
+        ])
+
+    async def simulate(self, levels: Sequence[Tuple[str, int, float, float]], infection_rate: float,
+                       immunity_power: float, seed: int, runs: Optional[int] = None,
+                       budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        """同一 seed 且全部块在预算内完成时结果可复现"""
+        started = time.perf_counter()
+        runs = max(1, runs or self.runs)
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+
+        sizes = [min(self.chunk_runs, runs - i) for i in range(0, runs, self.chunk_runs)]
+        # 每块使用独立的子随机流，结果与块的完成顺序无关
+        child_seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        # 已开始运行的块无法取消：在途的块不超过工作进程数，预算耗尽后不再提交，超出预算的计算最多一波
+        wave = max(1, self.workers)
+        deadline = started + budget
+        results: Dict[int, Dict[str, np.ndarray]] = {}
+        running: Dict[asyncio.Future, int] = {}
+        submitted = 0
+        try:
+            while submitted < len(sizes) or running:
+                while submitted < len(sizes) and len(running) < wave and (time.perf_counter() < deadline or not submitted):
+                    future = loop.run_in_executor(executor, simulate_chunk, list(levels), infection_rate,
+                                                  immunity_power, sizes[submitted], child_seeds[submitted], self.params)
+                    running[future] = submitted
+                    submitted += 1
+                if not running:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 and results:
+                    break
+                # 预算耗尽仍没有完成的块时等待第一块
+                done, _ = await asyncio.wait(running, timeout=remaining if remaining > 0 else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except BrokenProcessPool:
+            logger.error("传播模拟进程池已损坏，将重建")
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.stats["restarts"] += 1
+            raise
+        finally:
+            for future in running:
+                future.add_done_callback(_discard_result)
+        # 按块顺序汇总已完成的块
+        chunks = [results[i] for i in sorted(results)]
+        complete = len(chunks) == len(sizes)
+
+        result = summarize(levels, chunks, self.percentiles)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        result.update({
+            "requested_runs": runs,
+            "complete": complete,
+            "seed": seed,
+            "elapsed_ms": elapsed_ms
+        })
+        self.stats["requests"] += 1
+        self.stats["chunks"] += len(chunks)
+        self.stats["over_budget"] += not complete
+        self.stats["last_runs"] = result["runs"]
+        self.stats["last_ms"] = elapsed_ms
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "runs": self.runs,
+            "chunk_runs": self.chunk_runs,
+            "budget_ms": self.budget_ms,
+            "running": self._executor is not None,
+            **self.stats
+        }
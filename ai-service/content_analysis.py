@@ -0,0 +1,201 @@
+# FluLink v4.0 AI 服务 - 毒株内容分析
+# 一次计算情感、话题、关键词、标签、可读性、参与度与传播潜力；短 TTL 备忘录按内容哈希共享结果，批量分析走进程池
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+TOPIC_PREFIX = "topic:"
+
+
+def analyze_text(content: str, matcher: KeywordMatcher) -> Dict[str, Any]:
+    """规则版内容分析（降级策略），返回 analyze-content / extract-tags / predict-potential 所需的全部字段"""
+    # 一次扫描得到情感词与话题词的全部命中
+    match = matcher.scan(content)
+
+    # 简单的情感分析（降级策略）
+    positive_count = match.count("positive")
+    negative_count = match.count("negative")
+    if positive_count > negative_count:
+        sentiment = 'positive'
+    elif negative_count > positive_count:
+        sentiment = 'negative'
+    else:
+        sentiment = 'neutral'
+
+    # 简单的话题提取
+    topics = [category[len(TOPIC_PREFIX):] for category in match.matched_categories(TOPIC_PREFIX)]
+
+    # 关键词提取（简单版本）
+    keywords = [word for word in content.split() if len(word) > 1][:5]
+
+    # 可读性评分（简单版本）
+    readability = min(100, max(0, 100 - len(content) * 0.1))
+
+    # 参与度潜力（基于内容长度和情感）
+    engagement_potential = min(100, max(0,
+        readability * 0.5 +
+        (positive_count * 10) +
+        (len(topics) * 15)
+    ))
+
+    # 组合话题和关键词作为标签（去重保序，限制数量）
+    tags = list(dict.fromkeys(topics + keywords[:3]))[:5]
+
+    # 传播潜力得分
+    potential_score = min(100, max(0,
+        engagement_potential * 0.6 +
+        readability * 0.3 +
+        len(topics) * 5
+    ))
+
+    return {
+        "sentiment": sentiment,
+        "topics": topics,
+        "keywords": keywords,
+        "tags": tags,
+        "readability": readability,
+        "engagement_potential": engagement_potential,
+        "potential_score": potential_score
+    }
+
+
+# 分析进程内的自动机（由进程池 initializer 设置，每个进程只反序列化一次）
+_worker_matcher: Optional[KeywordMatcher] = None
+
+
+def _init_worker(matcher: KeywordMatcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def _analyze_chunk(contents: List[str]) -> List[Dict[str, Any]]:
+    return [analyze_text(content, _worker_matcher) for content in contents]
+
+
+class AnalysisPool:
+    """批量内容分析进程池：按块分发到各进程，随 CPU 核数扩展；词典热重载后自动重建"""
+
+    def __init__(self, workers: int, chunk_size: int = 256):
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._matcher: Optional[KeywordMatcher] = None
+        self.stats = {"batches": 0, "items": 0, "chunks": 0, "restarts": 0, "last_batch_ms": None}
+
+    def _get_executor(self, matcher: KeywordMatcher) -> ProcessPoolExecutor:
+        if self._executor is None or self._matcher is not matcher:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self.stats["restarts"] += 1
+            # spawn 启动的进程只导入本模块，不继承父进程的模型与推理线程
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(matcher,)
+            )
+            self._matcher = matcher
+        return self._executor
+
+    async def analyze(self, contents: List[str], matcher: KeywordMatcher) -> List[Dict[str, Any]]:
+        """按输入顺序返回分析结果"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor(matcher)
+        chunks = [contents[i:i + self.chunk_size] for i in range(0, len(contents), self.chunk_size)]
+        try:
+            parts = await asyncio.gather(*[
+                loop.run_in_executor(executor, _analyze_chunk, chunk) for chunk in chunks
+            ])
+        except BrokenProcessPool:
+            # 有进程异常退出：关闭并丢弃整个进程池（回收剩余进程、取消排队的块），下次调用时重建
+            logger.error("内容分析进程池已损坏，将重建")
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self.stats["restarts"] += 1
+            raise
+        self.stats["batches"] += 1
+        self.stats["items"] += len(contents)
+        self.stats["chunks"] += len(chunks)
+        self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return [result for part in parts for result in part]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "running": self._executor is not None,
+            **self.stats
+        }
+
+
+def content_key(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class AnalysisMemo:
+    """按内容哈希缓存分析结果（TTL + 条数上限，LRU 淘汰）"""
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, content: str) -> Optional[Dict[str, Any]]:
+        key = content_key(content)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, content: str, result: Dict[str, Any]):
+        if self.ttl_seconds <= 0:
+            return
+        key = content_key(content)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def status(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0,
+            **self.stats
+        }
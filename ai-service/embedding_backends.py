@@ -0,0 +1,429 @@
+# FluLink v4.0 AI 服务 - 嵌入模型推理后端
+# torch（fp32 原始模型）/ torch_int8（动态量化）/ onnx / onnx_int8（ONNX Runtime CPU），非 fp32 后端加载前做余弦一致性校验
+# 校验（含 ONNX 导出、量化与参考向量计算）在一次性子进程中执行，服务进程本身不因校验执行任何推理；
+# 校验结果记录在产物旁的 parity.json，产物与来源未变化时直接复用，不再重复校验
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+# 一致性校验语料：覆盖中英文、长短句与业务常见词
+PARITY_SENTENCES = [
+    "附近有人在讨论新开的咖啡馆",
+    "今天的天气很好，适合出门散步",
+    "FluLink 星尘共鸣：基于地理位置的内容传播",
+    "这条毒株在同城用户中传播很快",
+    "周末一起去爬山吗？带上相机拍日出",
+    "Looking for people who like indie music and live shows nearby",
+    "How to train a small language model on a laptop",
+    "新手学习 Python 数据分析的路线图",
+    "猫咪今天又把杯子推下桌子了",
+    "城市马拉松报名开始，名额有限",
+    "A short note",
+    "道法自然，无为而治。上善若水，水善利万物而不争。" * 4,
+]
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return (a * b).sum(axis=1) / np.maximum(denom, np.finfo(np.float32).tiny)
+
+
+def parity_check(model, reference: np.ndarray, threshold: float) -> Dict[str, Any]:
+    """用同一批语料比较候选后端与 fp32 参考向量"""
+    vectors = model.encode(PARITY_SENTENCES, batch_size=len(PARITY_SENTENCES), convert_to_numpy=True)
+    cosines = _cosine_rows(vectors, reference)
+    return {
+        "min_cosine": round(float(cosines.min()), 5),
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "threshold": threshold,
+        "samples": len(PARITY_SENTENCES),
+        "passed": bool(cosines.min() >= threshold)
+    }
+
+
+def _load_torch(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _reference_vectors(model) -> np.ndarray:
+    return model.encode(PARITY_SENTENCES, batch_size=len(PARITY_SENTENCES), convert_to_numpy=True)
+
+
+def _quantize_torch(model):
+    """对 Linear 层做动态 int8 量化（权重 int8，激活在运行时量化）"""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEmbeddingModel:
+    """ONNX Runtime 版 SentenceTransformer：tokenizers 分词 + 均值池化 + 可选归一化，不依赖 torch"""
+
+    def __init__(self, export_dir: str, model_file: str = "model.onnx", num_threads: int = 0):
+        import onnxruntime  # noqa: F401  缺少依赖时尽早失败
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(export_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.path = os.path.join(export_dir, model_file)
+        self.num_threads = num_threads
+        self.input_names = self.meta["input_names"]
+        self.tokenizer = Tokenizer.from_file(os.path.join(export_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_token_id"], pad_token=self.meta["pad_token"])
+        self._session = None
+        self._session_pid = None
+        self._orphaned = []
+        self._lock = threading.Lock()
+
+    def set_num_threads(self, threads: int):
+        """推理进程内设置线程数（在会话创建前调用才生效）"""
+        self.num_threads = threads
+
+    def _get_session(self):
+        # ONNX Runtime 会话不能跨 fork 使用：每个进程首次推理时各自创建
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    import onnxruntime as ort
+                    options = ort.SessionOptions()
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    options.inter_op_num_threads = 1
+                    if self.num_threads:
+                        options.intra_op_num_threads = self.num_threads
+                    if self._session is not None:
+                        # 父进程的会话在子进程中不能安全析构，只保留引用
+                        self._orphaned.append(self._session)
+                    self._session = ort.InferenceSession(
+                        self.path, options, providers=["CPUExecutionProvider"]
+                    )
+                    self._session_pid = pid
+        return self._session
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.meta["dimension"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        features = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self._get_session().run(None, {name: features[name] for name in self.input_names})[0]
+        mask = features["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.meta["normalize"]:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.meta["dimension"]), dtype=np.float32)
+        # 按长度排序后分批，减少 padding
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        output = np.empty((len(texts), self.meta["dimension"]), dtype=np.float32)
+        batch_size = max(1, batch_size)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            output[rows] = self._encode_batch([texts[i] for i in rows])
+        return output[0] if single else output
+
+
+PARITY_FILE = "parity.json"
+
+# 各后端的产物文件（位于 _artifact_dir 返回的目录中）
+ARTIFACT_FILES = {"torch_int8": "model.int8.pt", "onnx": "model.onnx", "onnx_int8": "model.int8.onnx"}
+
+
+def _artifact_dir(backend: str, model_name: str, model_dir: str) -> str:
+    suffix = ".torch_int8" if backend == "torch_int8" else ".onnx"
+    return os.path.join(model_dir, model_name.replace("/", "__") + suffix)
+
+
+def _source_mtime(source: str) -> Optional[float]:
+    """本地快照目录的修改时间；按模型名从 Hugging Face 缓存加载时为 None"""
+    return os.path.getmtime(source) if os.path.isdir(source) else None
+
+
+def _source_matches(artifact_dir: str, source: str) -> bool:
+    """产物 meta.json 记录的来源与当前来源一致（快照重新生成后产物需要重建）"""
+    try:
+        with open(os.path.join(artifact_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("source") == source and meta.get("source_mtime") == _source_mtime(source)
+
+
+def _replace_dir(tmp_dir: str, target: str):
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(tmp_dir, target)
+
+
+def export_onnx(model_name: str, export_dir: str, source: Optional[str] = None) -> None:
+    """把 SentenceTransformer 的 Transformer 模块导出为 ONNX，并保存分词器与 fp32 参考向量（来源不变时只需执行一次）"""
+    import torch
+    from sentence_transformers.models import Normalize
+
+    source = source or model_name
+    model = _load_torch(source)
+    transformer = model[0]
+    pooling = model[1]
+    if pooling.get_pooling_mode_str() != "mean":
+        raise RuntimeError(f"ONNX 后端仅支持均值池化，当前为 {pooling.get_pooling_mode_str()}")
+
+    tokenizer = model.tokenizer
+    dummy = tokenizer(["hello world", "你好"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    tmp_dir = export_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(transformer.auto_model).eval(),
+            tuple(dummy[name] for name in input_names),
+            os.path.join(tmp_dir, "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            do_constant_folding=True
+        )
+    tokenizer.save_pretrained(tmp_dir)
+    np.save(os.path.join(tmp_dir, "reference.npy"), _reference_vectors(model))
+    meta = {
+        "model_name": model_name,
+        "source": source,
+        "source_mtime": _source_mtime(source),
+        "input_names": input_names,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "exported_at": time.time()
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _replace_dir(tmp_dir, export_dir)
+    logger.info(f"ONNX 模型已导出: {export_dir}")
+
+
+def _quantize_onnx(export_dir: str) -> str:
+    """用 ONNX Runtime 动态量化生成 int8 模型（已存在时直接复用）"""
+    target = os.path.join(export_dir, ARTIFACT_FILES["onnx_int8"])
+    if not os.path.exists(target):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(export_dir, ARTIFACT_FILES["onnx"]), target, weight_type=QuantType.QInt8)
+    return os.path.basename(target)
+
+
+def _load_onnx(backend: str, model_name: str, model_dir: str, num_threads: int,
+               source: str) -> Tuple[Any, np.ndarray]:
+    export_dir = _artifact_dir(backend, model_name, model_dir)
+    if not _source_matches(export_dir, source):
+        export_onnx(model_name, export_dir, source)
+    model_file = _quantize_onnx(export_dir) if backend == "onnx_int8" else ARTIFACT_FILES["onnx"]
+    model = OnnxEmbeddingModel(export_dir, model_file, num_threads)
+    return model, np.load(os.path.join(export_dir, "reference.npy"))
+
+
+def _load_torch_int8(model_name: str, model_dir: str, source: str) -> Tuple[Any, np.ndarray]:
+    """加载量化产物；来源变化或产物缺失时由 fp32 模型计算参考向量、量化并整体保存"""
+    import torch
+
+    artifact_dir = _artifact_dir("torch_int8", model_name, model_dir)
+    if _source_matches(artifact_dir, source):
+        model = torch.load(os.path.join(artifact_dir, ARTIFACT_FILES["torch_int8"]),
+                           map_location="cpu", weights_only=False)
+        return model, np.load(os.path.join(artifact_dir, "reference.npy"))
+
+    fp32_model = _load_torch(source)
+    reference = _reference_vectors(fp32_model)
+    model = _quantize_torch(fp32_model)
+    tmp_dir = artifact_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    torch.save(model, os.path.join(tmp_dir, ARTIFACT_FILES["torch_int8"]))
+    np.save(os.path.join(tmp_dir, "reference.npy"), reference)
+    meta = {
+        "model_name": model_name,
+        "source": source,
+        "source_mtime": _source_mtime(source),
+        "quantized_at": time.time()
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _replace_dir(tmp_dir, artifact_dir)
+    logger.info(f"int8 量化模型已保存: {artifact_dir}")
+    return model, reference
+
+
+def load_backend_model(backend: str, model_name: str, model_dir: str, num_threads: int = 0,
+                       source: Optional[str] = None):
+    """按已选定（已通过校验）的后端加载产物，不做一致性校验也不执行推理；推理进程用它在进程内自行加载"""
+    source = source or model_name
+    if backend == "torch_int8":
+        import torch
+        path = os.path.join(_artifact_dir(backend, model_name, model_dir), ARTIFACT_FILES[backend])
+        return torch.load(path, map_location="cpu", weights_only=False)
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxEmbeddingModel(_artifact_dir(backend, model_name, model_dir), ARTIFACT_FILES[backend], num_threads)
+    return _load_torch(source)
+
+
+def _parity_key(backend: str, model_name: str, model_dir: str, source: str) -> Optional[Dict[str, Any]]:
+    """校验记录的有效条件：模型、来源及其修改时间、产物修改时间都不变"""
+    artifact = os.path.join(_artifact_dir(backend, model_name, model_dir), ARTIFACT_FILES[backend])
+    if not os.path.exists(artifact):
+        return None
+    return {
+        "model_name": model_name,
+        "source": source,
+        "source_mtime": _source_mtime(source),
+        "artifact_mtime": os.path.getmtime(artifact)
+    }
+
+
+def _read_parity_records(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_parity(backend: str, model_name: str, model_dir: str, source: str, parity: Dict[str, Any]):
+    path = os.path.join(_artifact_dir(backend, model_name, model_dir), PARITY_FILE)
+    records = _read_parity_records(path)
+    records[backend] = {**_parity_key(backend, model_name, model_dir, source), "parity": parity}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _cached_parity(backend: str, model_name: str, model_dir: str, source: str) -> Optional[Dict[str, Any]]:
+    """产物与来源未变化时返回 parity.json 中记录的校验结果"""
+    artifact_dir = _artifact_dir(backend, model_name, model_dir)
+    if not _source_matches(artifact_dir, source):
+        return None
+    key = _parity_key(backend, model_name, model_dir, source)
+    record = _read_parity_records(os.path.join(artifact_dir, PARITY_FILE)).get(backend)
+    if key is None or record is None or any(record.get(k) != v for k, v in key.items()):
+        return None
+    return record["parity"]
+
+
+def _check_backend(backend: str, model_name: str, model_dir: str, min_cosine: float,
+                   num_threads: int, source: str) -> Dict[str, Any]:
+    """准备候选后端产物（必要时导出 / 量化）并与 fp32 参考向量比较，结果写入 parity.json；只在 _run_isolated 的子进程中调用"""
+    if backend == "torch_int8":
+        candidate, reference = _load_torch_int8(model_name, model_dir, source)
+    else:
+        candidate, reference = _load_onnx(backend, model_name, model_dir, num_threads, source)
+    parity = parity_check(candidate, reference, min_cosine)
+    _save_parity(backend, model_name, model_dir, source, parity)
+    return parity
+
+
+def _run_isolated(fn, *args):
+    """在一次性 spawn 子进程中执行 fn 并返回结果，推理线程池与 OpenMP 状态随子进程退出"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def prepare_embedding_backend(backend: str, model_name: str, model_dir: str,
+                              min_cosine: float = 0.99, num_threads: int = 0,
+                              source: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """准备非 fp32 后端并返回一致性校验结果（torch 与未知后端返回 None）。
+
+    产物与来源未变化时复用 parity.json 中的记录，否则在一次性子进程中导出 / 量化并校验（镜像构建时由
+    warm_start.py 预先执行）；是否通过按本次的阈值重新判定。准备失败时返回 passed=False 与 error。
+    """
+    if backend == "torch" or backend not in SUPPORTED_BACKENDS:
+        return None
+    source = source or model_name
+    try:
+        parity = _cached_parity(backend, model_name, model_dir, source)
+        if parity is None:
+            parity = _run_isolated(_check_backend, backend, model_name, model_dir, min_cosine,
+                                   num_threads, source)
+        else:
+            logger.info(f"复用嵌入后端 {backend} 的一致性校验记录 (min_cosine={parity['min_cosine']})")
+    except Exception as e:
+        logger.error(f"嵌入后端 {backend} 准备失败: {e}")
+        return {"passed": False, "error": str(e)}
+    return {**parity, "threshold": min_cosine, "passed": bool(parity["min_cosine"] >= min_cosine)}
+
+
+def load_embedding_backend(backend: str, model_name: str, model_dir: str,
+                           min_cosine: float = 0.99, num_threads: int = 0,
+                           source: Optional[str] = None,
+                           parity: Optional[Dict[str, Any]] = None) -> Tuple[Any, Dict[str, Any]]:
+    """加载指定后端；非 fp32 后端校验失败或依赖缺失时回退到 torch fp32。
+
+    source 为本地热启动快照目录（见 warm_start.py），缺省时按模型名从 Hugging Face 缓存加载。
+    parity 为 prepare_embedding_backend 的结果，已事先准备时传入，缺省时在这里准备。
+    返回 (模型, 后端状态)，模型对外提供与 SentenceTransformer 相同的 encode 接口。
+    """
+    source = source or model_name
+    started = time.time()
+    info: Dict[str, Any] = {
+        "requested": backend, "active": "torch", "source": source, "parity": None, "fallback_reason": None
+    }
+    if backend not in SUPPORTED_BACKENDS:
+        info["fallback_reason"] = f"未知后端: {backend}"
+        backend = "torch"
+
+    model = None
+    if backend != "torch":
+        if parity is None:
+            parity = prepare_embedding_backend(backend, model_name, model_dir, min_cosine, num_threads, source)
+        info["parity"] = parity
+        if parity["passed"]:
+            try:
+                # 导出与量化产物已在准备阶段生成，这里只加载
+                model = load_backend_model(backend, model_name, model_dir, num_threads, source)
+                info["active"] = backend
+            except Exception as e:
+                logger.error(f"嵌入后端 {backend} 加载失败，回退到 torch fp32: {e}")
+                info["fallback_reason"] = str(e)
+        else:
+            info["fallback_reason"] = parity.get("error") or f"一致性校验未通过 (min_cosine={parity['min_cosine']})"
+
+    if model is None:
+        model = _load_torch(source)
+    info["load_seconds"] = round(time.time() - started, 3)
+    if info["fallback_reason"]:
+        logger.warning(f"⚠️ 嵌入后端回退到 torch fp32: {info['fallback_reason']}")
+    return model, info
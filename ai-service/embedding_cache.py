@@ -0,0 +1,398 @@
+# FluLink v4.0 AI 服务 - 嵌入向量缓存
+# 以 (模型名, 规范化文本) 的哈希为键，内存 LRU 按字节数限额，可选磁盘 mmap 层跨重启保留（分两段轮换淘汰）
+# 磁盘层读取由调用方放到线程池执行，写入由单个后台线程完成，事件循环只触及内存层
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 32  # sha256 摘要长度
+ENTRY_OVERHEAD = 96  # 每条内存记录的近似额外开销（字典槽位、元组等）
+DISK_QUEUE_SIZE = 4096  # 等待写入磁盘层的条目上限，超出时丢弃（只影响磁盘层命中率）
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：NFKC + 折叠空白，使重复转发的内容命中同一键"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def make_key(model_name: str, text: str) -> bytes:
+    """计算内容寻址键"""
+    payload = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).digest()
+
+
+class _Segment:
+    """磁盘层的一段：键文件与向量文件按行对应，只追加"""
+
+    def __init__(self, keys_path: str, vectors_path: str):
+        self.keys_path = keys_path
+        self.vectors_path = vectors_path
+        self.rows: Dict[bytes, int] = {}
+        self.count = 0  # 文件中的行数（复制到当前段的键会从 rows 中移除，行仍留在文件里）
+        self._mmap: Optional[np.memmap] = None
+
+    def create(self):
+        for path in (self.keys_path, self.vectors_path):
+            open(path, "wb").close()
+
+    def load(self, dimension: int) -> int:
+        for path in (self.keys_path, self.vectors_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+        with open(self.keys_path, "rb") as f:
+            keys = f.read()
+        # 进程中断可能留下半条记录，以两文件中较短者为准
+        rows = min(len(keys) // KEY_SIZE, os.path.getsize(self.vectors_path) // (dimension * 4))
+        for row in range(rows):
+            self.rows[keys[row * KEY_SIZE:(row + 1) * KEY_SIZE]] = row
+        self.count = rows
+        with open(self.keys_path, "r+b") as f:
+            f.truncate(rows * KEY_SIZE)
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(rows * dimension * 4)
+        return rows
+
+    def get(self, key: bytes, dimension: int) -> Optional[np.ndarray]:
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        # 按需重新映射，使新追加的行可见
+        if self._mmap is None or self._mmap.shape[0] <= row:
+            self._mmap = np.memmap(self.vectors_path, dtype="<f4", mode="r", shape=(self.count, dimension))
+        return np.array(self._mmap[row], dtype=np.float32)
+
+    def append(self, key: bytes, vector: np.ndarray):
+        with open(self.vectors_path, "ab") as f:
+            f.write(vector.astype("<f4", copy=False).tobytes())
+        with open(self.keys_path, "ab") as f:
+            f.write(key)
+        self.rows[key] = self.count
+        self.count += 1
+
+    def move(self, keys_path: str, vectors_path: str):
+        os.replace(self.keys_path, keys_path)
+        os.replace(self.vectors_path, vectors_path)
+        self.keys_path, self.vectors_path = keys_path, vectors_path
+        self._mmap = None
+
+    def remove(self):
+        self.rows.clear()
+        self.count = 0
+        self._mmap = None
+        for path in (self.keys_path, self.vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class DiskVectorTier:
+    """单个模型的磁盘层：当前段与上一段各一对追加文件（keys / vectors），读取走 np.memmap。
+
+    当前段写满一半预算时轮换：删除上一段，当前段改为上一段，再新建空的当前段。磁盘占用始终不超过预算，
+    写满后仍可写入新条目（最早写入的一半被淘汰）；上一段命中的条目由 EmbeddingCache 重新写入当前段，常用条目不随轮换丢失。
+    不加锁，由 EmbeddingCache 的磁盘层锁串行访问。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dimension: Optional[int] = None
+        self.rotations = 0
+        self._current = _Segment(os.path.join(directory, "keys.bin"), os.path.join(directory, "vectors.f32"))
+        self._previous = _Segment(os.path.join(directory, "keys.prev.bin"), os.path.join(directory, "vectors.prev.f32"))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def __len__(self) -> int:
+        return len(self._current.rows) + len(self._previous.rows)
+
+    def _segment_rows(self) -> int:
+        """每段最多行数（两段合计不超过 max_bytes）"""
+        return self.max_bytes // 2 // (self.dimension * 4 + KEY_SIZE)
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            self.dimension = int(json.load(f)["dimension"])
+        self._current.load(self.dimension)
+        self._previous.load(self.dimension)
+        for key in self._current.rows:
+            self._previous.rows.pop(key, None)
+        logger.info(f"嵌入缓存磁盘层已加载 {len(self)} 条: {self.directory}")
+
+    def _rotate(self):
+        current_paths = (self._current.keys_path, self._current.vectors_path)
+        previous_paths = (self._previous.keys_path, self._previous.vectors_path)
+        self._previous.remove()
+        self._current.move(*previous_paths)
+        self._previous = self._current
+        self._current = _Segment(*current_paths)
+        self._current.create()
+        self.rotations += 1
+
+    def _append(self, key: bytes, vector: np.ndarray):
+        if self._current.count >= self._segment_rows():
+            self._rotate()
+        self._previous.rows.pop(key, None)
+        self._current.append(key, vector)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self._current.get(key, self.dimension)
+        if vector is None:
+            vector = self._previous.get(key, self.dimension)
+        return vector
+
+    def in_previous(self, key: bytes) -> bool:
+        """条目只存在于上一段（下次轮换时会被淘汰）"""
+        return key in self._previous.rows
+
+    def put(self, key: bytes, vector: np.ndarray) -> bool:
+        if key in self._current.rows:
+            return True
+        if self.dimension is None:
+            self.dimension = int(vector.shape[0])
+            with open(self.meta_path, "w") as f:
+                json.dump({"dimension": self.dimension}, f)
+            self._current.create()
+        if vector.shape[0] != self.dimension:
+            return False
+        if self._segment_rows() < 1:
+            # 预算容不下一段一条
+            return False
+        self._append(key, vector)
+        return True
+
+    def clear(self):
+        self._current.remove()
+        self._previous.remove()
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        self.dimension = None
+
+
+class EmbeddingCache:
+    """两级嵌入缓存：内存 LRU（按字节限额）+ 可选磁盘层。
+
+    内存层与磁盘层各用一把锁：get_memory / put 只触及内存层，可在事件循环中调用；get 会读磁盘层，
+    启用磁盘层时应在线程池中调用；磁盘层写入由单个后台线程按队列顺序执行。两把锁嵌套时先取磁盘层锁。
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[bytes, Tuple[str, np.ndarray]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_tiers: Dict[str, DiskVectorTier] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_queue: "queue.Queue[Optional[Tuple[int, str, bytes, np.ndarray]]]" = queue.Queue(DISK_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "disk_writes": 0,
+            "disk_rejected": 0,
+            "disk_dropped": 0
+        }
+
+    @property
+    def generation(self) -> int:
+        """失效代数；写入时代数不一致说明期间发生过失效，结果丢弃"""
+        return self._generation
+
+    @property
+    def disk_enabled(self) -> bool:
+        return bool(self.disk_dir)
+
+    def _disk_tier(self, model_name: str) -> Optional[DiskVectorTier]:
+        """取模型的磁盘层，首次访问时加载键文件；调用方需持有磁盘层锁"""
+        if not self.disk_dir:
+            return None
+        tier = self._disk_tiers.get(model_name)
+        if tier is None:
+            slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+            digest = hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:8]
+            try:
+                tier = DiskVectorTier(os.path.join(self.disk_dir, f"{slug}-{digest}"), self.disk_max_bytes)
+            except Exception as e:
+                logger.warning(f"嵌入缓存磁盘层不可用: {e}")
+                return None
+            self._disk_tiers[model_name] = tier
+        return tier
+
+    def open_disk_tier(self, model_name: str):
+        """预先加载模型的磁盘层（启动或切换模型时在线程池中调用），请求路径上不再承担加载开销"""
+        if self.disk_dir:
+            with self._disk_lock:
+                self._disk_tier(model_name)
+
+    def _remember(self, key: bytes, model_name: str, vector: np.ndarray):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        size = vector.nbytes + KEY_SIZE + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (model_name, vector)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes + KEY_SIZE + ENTRY_OVERHEAD
+            self.stats["evictions"] += 1
+
+    def _memory_hit(self, key: bytes) -> Optional[np.ndarray]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        self.stats["hits"] += 1
+        self.stats["memory_hits"] += 1
+        return entry[1]
+
+    def get_memory(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """只查内存层，不做磁盘 I/O；未命中时不计入 misses，由随后的 get 继续查找并计数"""
+        key = make_key(model_name, text)
+        with self._lock:
+            return self._memory_hit(key)
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """依次查内存层与磁盘层；启用磁盘层时会读文件，应在线程池中调用"""
+        key = make_key(model_name, text)
+        with self._lock:
+            vector = self._memory_hit(key)
+            generation = self._generation
+        if vector is not None or not self.disk_dir:
+            if vector is None:
+                with self._lock:
+                    self.stats["misses"] += 1
+            return vector
+
+        promote = False
+        with self._disk_lock:
+            tier = self._disk_tier(model_name)
+            if tier is not None:
+                try:
+                    vector = tier.get(key)
+                except OSError as e:
+                    logger.warning(f"嵌入缓存读取磁盘失败: {e}")
+                promote = vector is not None and tier.in_previous(key)
+
+        with self._lock:
+            if vector is None:
+                self.stats["misses"] += 1
+                return None
+            if generation == self._generation:
+                self._remember(key, model_name, vector)
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+        if promote:
+            # 上一段的命中重新写入当前段，避免下次轮换时被淘汰
+            self._enqueue_disk(generation, model_name, key, vector)
+        return vector
+
+    def put(self, model_name: str, text: str, vector, generation: Optional[int] = None):
+        """写入内存层；磁盘层写入交给后台线程，调用方不等待磁盘 I/O"""
+        vector = np.asarray(vector, dtype=np.float32)
+        key = make_key(model_name, text)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._remember(key, model_name, vector)
+            generation = self._generation
+        if self.disk_dir:
+            self._enqueue_disk(generation, model_name, key, vector)
+
+    def _enqueue_disk(self, generation: int, model_name: str, key: bytes, vector: np.ndarray):
+        with self._lock:
+            if self._closed:
+                return
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._disk_writer, daemon=True, name="embedding-cache-writer")
+                self._writer.start()
+        try:
+            self._disk_queue.put_nowait((generation, model_name, key, vector))
+        except queue.Full:
+            with self._lock:
+                self.stats["disk_dropped"] += 1
+
+    def _disk_writer(self):
+        """后台写入线程：按队列顺序追加到磁盘层，期间发生过失效的条目直接丢弃"""
+        while True:
+            item = self._disk_queue.get()
+            if item is None:
+                return
+            generation, model_name, key, vector = item
+            with self._disk_lock:
+                if generation != self._generation:
+                    continue
+                tier = self._disk_tier(model_name)
+                if tier is None:
+                    continue
+                try:
+                    written = tier.put(key, vector)
+                except OSError as e:
+                    logger.warning(f"嵌入缓存写入磁盘失败: {e}")
+                    written = False
+            with self._lock:
+                self.stats["disk_writes" if written else "disk_rejected"] += 1
+
+    def invalidate_model(self, model_name: str):
+        """清除某个模型的全部缓存（内存与磁盘）；会删除磁盘文件，应在线程池中调用"""
+        with self._disk_lock:
+            with self._lock:
+                self._generation += 1
+                stale = [key for key, (name, _) in self._memory.items() if name == model_name]
+                for key in stale:
+                    _, vector = self._memory.pop(key)
+                    self._memory_bytes -= vector.nbytes + KEY_SIZE + ENTRY_OVERHEAD
+                self.stats["invalidations"] += 1
+            tier = self._disk_tier(model_name)
+            if tier is not None:
+                tier.clear()
+        logger.info(f"嵌入缓存已失效: {model_name} ({len(stale)} 条内存记录)")
+
+    def close(self, timeout: float = 10.0):
+        """停止后台写入线程（先写完队列中已有的条目）"""
+        with self._lock:
+            self._closed = True
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._disk_queue.put(None)
+            writer.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "max_bytes": self.max_bytes,
+            "disk_enabled": bool(self.disk_dir),
+            "disk_entries": sum(len(tier) for tier in list(self._disk_tiers.values())),
+            "disk_rotations": sum(tier.rotations for tier in list(self._disk_tiers.values())),
+            "disk_queue": self._disk_queue.qsize(),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats
+        }
@@ -0,0 +1,355 @@
+# FluLink v4.0 AI 服务 - 后台向量化回填任务
+# 任务与待处理文本保存在本地 SQLite；工作协程按大批次编码并写入向量集合，每批完成后记录检查点
+# 服务重启后未完成的任务从检查点继续；支持按任务限速，状态接口给出 rows/s 与预计剩余时间
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    batch_size INTEGER NOT NULL,
+    max_rows_per_second REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    item_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+"""
+
+_JOB_COLUMNS = (
+    "id", "collection", "status", "total", "done", "batch_size", "max_rows_per_second",
+    "created_at", "started_at", "updated_at", "finished_at", "error"
+)
+
+
+class JobNotReady(Exception):
+    """模型或向量集合尚未就绪：任务保留当前批次，稍后重试，不计入失败次数"""
+
+
+class EmbeddingJobQueue:
+    """进程内回填任务队列。
+
+    encode_fn(texts) -> float32 矩阵，在线程池中调用；
+    upsert_fn(collection, ids, matrix, metadatas) 为协程，负责写入向量集合。
+    两者都可以抛出 JobNotReady 表示暂时不可用。
+    """
+
+    def __init__(self, db_path: str, encode_fn: Callable[[List[str]], np.ndarray],
+                 upsert_fn: Callable[..., Awaitable[Any]], workers: int = 1, batch_size: int = 256,
+                 max_rows_per_second: float = 0.0, retry_interval: float = 5.0, max_attempts: int = 3):
+        self.db_path = db_path or ":memory:"
+        self.encode_fn = encode_fn
+        self.upsert_fn = upsert_fn
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_rows_per_second = max(0.0, max_rows_per_second)
+        self.retry_interval = retry_interval
+        self.max_attempts = max(1, max_attempts)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # 本次运行内的吞吐统计（不落盘）：开始时间、已处理行数、累计暂停时长
+        self._progress: Dict[str, Dict[str, float]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._active: set = set()
+
+    # ---- SQLite ----
+
+    def open(self):
+        """打开数据库并恢复任务：上次运行中断的任务回到排队状态，从检查点继续"""
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+        conn.commit()
+        self._conn = conn
+        rows = conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs ORDER BY created_at").fetchall()
+        self._jobs = {row[0]: dict(zip(_JOB_COLUMNS, row)) for row in rows}
+        pending = sum(1 for job in self._jobs.values() if job["status"] == QUEUED)
+        logger.info(f"回填任务库已打开: {len(self._jobs)} 个任务，{pending} 个待继续")
+        return self
+
+    def _execute(self, sql: str, params: Sequence = ()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def _save(self, job: Dict[str, Any], *fields: str):
+        job["updated_at"] = time.time()
+        fields = fields + ("updated_at",)
+        self._execute(
+            f"UPDATE jobs SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?",
+            [job[field] for field in fields] + [job["id"]]
+        )
+
+    def _insert(self, job: Dict[str, Any], ids: Sequence[str], texts: Sequence[str],
+                metadatas: Optional[Sequence[Optional[Dict[str, Any]]]]):
+        metas = metadatas or [None] * len(ids)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT INTO jobs ({', '.join(_JOB_COLUMNS)}) VALUES ({', '.join('?' * len(_JOB_COLUMNS))})",
+                    [job[column] for column in _JOB_COLUMNS]
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, seq, item_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (job["id"], seq, str(item_id), text,
+                         json.dumps(meta, ensure_ascii=False) if meta else None)
+                        for seq, (item_id, text, meta) in enumerate(zip(ids, texts, metas))
+                    )
+                )
+
+    def _fetch_items(self, job_id: str, start: int, limit: int) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT item_id, text, metadata FROM job_items WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, start, limit)
+            ).fetchall()
+
+    def _drop_items(self, job_id: str):
+        self._execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+
+    async def _db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    # ---- 任务管理 ----
+
+    async def submit(self, collection: str, ids: Sequence[str], texts: Sequence[str],
+                     metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+                     batch_size: Optional[int] = None,
+                     max_rows_per_second: Optional[float] = None) -> Dict[str, Any]:
+        if len(ids) != len(texts):
+            raise ValueError("ids 与 texts 数量不一致")
+        if metadatas is not None and len(metadatas) != len(ids):
+            raise ValueError("metadatas 与 ids 数量不一致")
+        if not ids:
+            raise ValueError("ids 不能为空")
+        job = {
+            "id": uuid.uuid4().hex,
+            "collection": collection,
+            "status": QUEUED,
+            "total": len(ids),
+            "done": 0,
+            "batch_size": max(1, int(batch_size or self.batch_size)),
+            "max_rows_per_second": max(0.0, float(
+                self.max_rows_per_second if max_rows_per_second is None else max_rows_per_second
+            )),
+            "created_at": time.time(),
+            "started_at": None,
+            "updated_at": None,
+            "finished_at": None,
+            "error": None
+        }
+        await self._db(self._insert, job, ids, texts, metadatas)
+        self._jobs[job["id"]] = job
+        self._enqueue(job["id"])
+        return self.status(job["id"])
+
+    def _enqueue(self, job_id: str):
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+
+    def _get(self, job_id: str) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    async def pause(self, job_id: str) -> Dict[str, Any]:
+        """暂停：当前批次完成后停止，检查点保留"""
+        job = self._get(job_id)
+        if job["status"] in (QUEUED, RUNNING):
+            job["status"] = PAUSED
+            await self._db(self._save, job, "status")
+        return self.status(job_id)
+
+    async def resume(self, job_id: str) -> Dict[str, Any]:
+        """继续已暂停或失败的任务（从检查点开始）"""
+        job = self._get(job_id)
+        if job["status"] in (PAUSED, FAILED):
+            job["status"] = QUEUED
+            job["error"] = None
+            await self._db(self._save, job, "status", "error")
+            self._enqueue(job_id)
+        return self.status(job_id)
+
+    async def cancel(self, job_id: str) -> Dict[str, Any]:
+        job = self._get(job_id)
+        if job["status"] not in FINISHED_STATES:
+            job["status"] = CANCELLED
+            job["finished_at"] = time.time()
+            await self._db(self._save, job, "status", "finished_at")
+            await self._db(self._drop_items, job_id)
+        return self.status(job_id)
+
+    # ---- 执行 ----
+
+    def start(self):
+        """启动工作协程，并把待继续的任务放入队列（需在事件循环内调用）"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        for job in self._jobs.values():
+            if job["status"] == QUEUED:
+                self._queue.put_nowait(job["id"])
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # 中断的任务保持 running，下次 open() 时回到排队状态
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            # 同一任务只允许一个工作协程执行；暂停后立即恢复时由正在执行的协程收尾后重新入队
+            if job is None or job["status"] != QUEUED or job_id in self._active:
+                continue
+            self._active.add(job_id)
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"回填任务 {job_id} 失败: {e}")
+                job["status"] = FAILED
+                job["error"] = str(e)
+                await self._db(self._save, job, "status", "error")
+            finally:
+                self._active.discard(job_id)
+            if job["status"] == QUEUED:
+                self._enqueue(job_id)
+
+    async def _run(self, job: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        job["status"] = RUNNING
+        job["started_at"] = job["started_at"] or time.time()
+        await self._db(self._save, job, "status", "started_at")
+        progress = self._progress[job["id"]] = {"started": time.perf_counter(), "rows": 0, "waited": 0.0}
+        attempts = 0
+
+        while job["done"] < job["total"]:
+            if job["status"] != RUNNING:
+                return
+            items = await self._db(self._fetch_items, job["id"], job["done"], job["batch_size"])
+            if not items:
+                break
+            ids = [item[0] for item in items]
+            metadatas = [json.loads(item[2]) if item[2] else {} for item in items]
+            try:
+                matrix = await loop.run_in_executor(None, self.encode_fn, [item[1] for item in items])
+                await self.upsert_fn(job["collection"], ids, np.asarray(matrix, dtype=np.float32), metadatas)
+            except JobNotReady as e:
+                job["error"] = f"等待就绪: {e}"
+                await asyncio.sleep(self.retry_interval)
+                progress["waited"] += self.retry_interval
+                continue
+            except Exception as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    raise
+                logger.warning(f"回填任务 {job['id']} 批次失败（第 {attempts} 次）: {e}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            attempts = 0
+            job["error"] = None
+            job["done"] += len(items)
+            progress["rows"] += len(items)
+            await self._db(self._save, job, "done", "error")
+
+            # 限速：按本次运行的累计行数计算应耗时间，提前完成则等待
+            rate = job["max_rows_per_second"]
+            if rate > 0:
+                ahead = progress["rows"] / rate - (time.perf_counter() - progress["started"] - progress["waited"])
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+
+        if job["status"] == RUNNING:
+            job["status"] = COMPLETED
+            job["finished_at"] = time.time()
+            await self._db(self._save, job, "status", "finished_at")
+            # 完成后删除原文，只保留任务记录
+            await self._db(self._drop_items, job["id"])
+            logger.info(f"回填任务 {job['id']} 完成: {job['total']} 条 -> {job['collection']}")
+
+    # ---- 状态 ----
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        job = dict(self._get(job_id))
+        progress = self._progress.get(job_id)
+        rows_per_second = None
+        if progress and progress["rows"]:
+            elapsed = time.perf_counter() - progress["started"] - progress["waited"]
+            rows_per_second = round(progress["rows"] / elapsed, 2) if elapsed > 0 else None
+        remaining = job["total"] - job["done"]
+        job.update({
+            "remaining": remaining,
+            "progress": round(job["done"] / job["total"], 4) if job["total"] else 1.0,
+            "rows_per_second": rows_per_second,
+            "eta_seconds": round(remaining / rows_per_second, 1)
+            if rows_per_second and job["status"] == RUNNING else None
+        })
+        return job
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        jobs = [job for job in reversed(list(self._jobs.values())) if status is None or job["status"] == status]
+        return [self.status(job["id"]) for job in jobs[:limit]]
+
+    def summary(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "db_path": self.db_path,
+            "workers": self.workers,
+            "running": bool(self._workers),
+            "batch_size": self.batch_size,
+            "max_rows_per_second": self.max_rows_per_second,
+            "jobs": counts
+        }
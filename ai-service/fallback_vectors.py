@@ -0,0 +1,85 @@
+# FluLink v4.0 AI 服务 - 降级向量（字符 n-gram 特征哈希）
+# 模型不可用时使用：同一文本始终得到同一向量，字面相近的文本向量也相近，可直接用于缓存与近邻检索
+# 整批文本一次完成：码点数组上用 numpy 计算 n-gram 哈希，再用一次 bincount 累加成稠密矩阵
+
+import hashlib
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_PRIME = np.uint64(0x100000001B3)
+_MIX1 = np.uint64(0xFF51AFD7ED558CCD)
+_MIX2 = np.uint64(0xC4CEB9FE1A85EC53)
+_SHIFT = np.uint64(33)
+_SIGN_BIT = np.uint64(1) << np.uint64(63)
+
+
+def _fmix64(h: np.ndarray) -> np.ndarray:
+    """murmur3 的 64 位终混函数，使相邻 n-gram 的哈希均匀分布"""
+    h = h ^ (h >> _SHIFT)
+    h = h * _MIX1
+    h = h ^ (h >> _SHIFT)
+    h = h * _MIX2
+    return h ^ (h >> _SHIFT)
+
+
+def _stable_hash(token: str) -> int:
+    # 不使用内置 hash()：其结果随进程随机化，向量无法跨进程复现
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def hashed_ngram_vectors(texts: Sequence[str], dimension: int = 384, ngram_range=(1, 3),
+                         keywords: Optional[List[Iterable[str]]] = None,
+                         keyword_weight: float = 2.0) -> np.ndarray:
+    """返回 (len(texts), dimension) 的 float32 矩阵，每行 L2 归一化（空文本为全零行）。
+
+    特征为小写后的字符 n-gram，带符号哈希到 dimension 个桶，按 log1p 做次线性缩放；
+    keywords[i] 给出第 i 条文本命中的关键词时，额外按 keyword_weight 计入一个关键词特征。
+    """
+    rows = len(texts)
+    if rows == 0:
+        return np.zeros((0, dimension), dtype=np.float32)
+    codes = [np.frombuffer(text.lower().encode("utf-32-le"), dtype="<u4") for text in texts]
+    lengths = np.fromiter((len(c) for c in codes), dtype=np.int64, count=rows)
+    flat = np.concatenate(codes).astype(np.uint64) if lengths.sum() else np.zeros(0, dtype=np.uint64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    row_of = np.repeat(np.arange(rows, dtype=np.int64), lengths)
+    offset_in_row = np.arange(len(flat), dtype=np.int64) - starts[row_of]
+
+    dim = np.uint64(dimension)
+    bucket_parts, weight_parts = [], []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        # 以该位置开头、长度为 n 的 n-gram 必须完整落在本条文本内
+        valid = np.flatnonzero(offset_in_row + n <= lengths[row_of])
+        if not len(valid):
+            continue
+        h = np.full(len(valid), n, dtype=np.uint64)
+        for k in range(n):
+            h = h * _PRIME + flat[valid + k]
+        h = _fmix64(h)
+        bucket_parts.append(row_of[valid] * dimension + (h % dim).astype(np.int64))
+        weight_parts.append(np.where(h & _SIGN_BIT, -1.0, 1.0))
+
+    if keywords is not None:
+        kw_buckets, kw_weights = [], []
+        for row, words in enumerate(keywords):
+            for word in words:
+                h = _stable_hash("kw:" + word.lower())
+                kw_buckets.append(row * dimension + h % dimension)
+                kw_weights.append(-keyword_weight if h >> 63 else keyword_weight)
+        if kw_buckets:
+            bucket_parts.append(np.asarray(kw_buckets, dtype=np.int64))
+            weight_parts.append(np.asarray(kw_weights, dtype=np.float64))
+
+    if bucket_parts:
+        matrix = np.bincount(
+            np.concatenate(bucket_parts),
+            weights=np.concatenate(weight_parts),
+            minlength=rows * dimension
+        ).reshape(rows, dimension)
+    else:
+        matrix = np.zeros((rows, dimension))
+    matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix.astype(np.float32)
@@ -0,0 +1,299 @@
+# FluLink v4.0 AI 服务 - 多进程推理工作池
+# spawn 出 N 个推理进程，各自从热启动快照加载模型并绑定一组 CPU 核；文本经管道发送，向量写回共享内存，不 pickle 大数组
+# 不使用 fork：父进程是已执行过推理的多线程服务，fork 出的子进程可能卡死在 OpenMP / intra-op 线程状态上
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PoolClosedError(RuntimeError):
+    """工作池已关闭（重新加载模型时被新工作池替换）"""
+
+
+def _worker_main(model_factory: Callable[[], Any], conn, shm_name: str, dimension: int, max_rows: int,
+                 cores: Optional[List[int]], threads: int):
+    """推理进程主循环：先加载模型并回报 ready，再接收文本列表，向量写入共享内存后只回传行数"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    try:
+        model = model_factory()
+        loaded_dimension = model.get_sentence_embedding_dimension()
+        if loaded_dimension != dimension:
+            raise RuntimeError(f"模型维度 {loaded_dimension} 与工作池维度 {dimension} 不一致")
+    except Exception as e:
+        conn.send(("error", f"推理进程加载模型失败: {e}"))
+        return
+    if hasattr(model, "set_num_threads"):
+        # ONNX 后端：会话在本进程首次推理时按该线程数创建
+        model.set_num_threads(threads)
+    else:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    output = np.ndarray((max_rows, dimension), dtype=np.float32, buffer=shm.buf)
+    conn.send(("ready", dimension))
+    try:
+        while True:
+            texts = conn.recv()
+            if texts is None:
+                break
+            try:
+                vectors = model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+                output[:len(texts)] = vectors
+                conn.send(("ok", len(texts)))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        del output
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, slot: int, process, conn, shm: shared_memory.SharedMemory, cores: Optional[List[int]]):
+        self.slot = slot
+        self.process = process
+        self.conn = conn
+        self.shm = shm
+        self.cores = cores
+        self.batches = 0
+        self.items = 0
+        self.released = False
+
+
+class InferencePool:
+    """推理工作池：前端事件循环只负责路由，前向计算全部在子进程中完成"""
+
+    def __init__(self, model_factory: Callable[[], Any], num_workers: int, dimension: int, max_rows: int = 256,
+                 threads_per_worker: int = 0, pin_cores: bool = True, start_timeout: float = 120.0):
+        """model_factory 必须可 pickle（模块级函数或其 functools.partial），在每个推理进程内调用一次"""
+        self.model_factory = model_factory
+        self.num_workers = num_workers
+        self.dimension = dimension
+        self.max_rows = max_rows
+        self.pin_cores = pin_cores
+        self.start_timeout = start_timeout
+        self.core_groups = self._plan_cores(num_workers) if pin_cores else [None] * num_workers
+        self.threads_per_worker = threads_per_worker or max(
+            1, (len(self.core_groups[0]) if self.core_groups[0] else (os.cpu_count() or 1) // num_workers)
+        )
+        self._idle: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        # 关闭标记与进行中的调用数，close() 据此等待调用排空
+        self._state = threading.Condition()
+        self._closed = False
+        self._active = 0
+        self._context = None
+        self.stats = {"batches": 0, "items": 0, "errors": 0, "restarts": 0, "last_batch_ms": None}
+
+    @staticmethod
+    def _plan_cores(num_workers: int) -> List[Optional[List[int]]]:
+        """把当前进程可用的核平均分给各个工作进程"""
+        if not hasattr(os, "sched_getaffinity"):
+            return [None] * num_workers
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) < num_workers:
+            return [None] * num_workers
+        per_worker = len(cores) // num_workers
+        return [cores[i * per_worker:(i + 1) * per_worker] for i in range(num_workers)]
+
+    def start(self):
+        """启动全部推理进程并等待模型加载完成；任一进程失败时关闭已启动的进程并抛出异常"""
+        self._context = multiprocessing.get_context("spawn")
+        # 各进程并行加载模型，再逐个等待 ready
+        self._workers = [self._spawn(slot) for slot in range(self.num_workers)]
+        try:
+            for worker in self._workers:
+                self._wait_ready(worker)
+        except Exception:
+            for worker in self._workers:
+                self._terminate(worker)
+            self._workers = []
+            raise
+        for worker in self._workers:
+            self._idle.put(worker)
+        logger.info(
+            f"推理工作池已启动: {self.num_workers} 个进程，每进程 {self.threads_per_worker} 线程"
+        )
+
+    def _spawn(self, slot: int) -> _Worker:
+        shm = shared_memory.SharedMemory(create=True, size=self.max_rows * self.dimension * 4)
+        parent_conn, child_conn = self._context.Pipe()
+        cores = self.core_groups[slot]
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.model_factory, child_conn, shm.name, self.dimension, self.max_rows, cores, self.threads_per_worker),
+            daemon=True,
+            name=f"flulink-inference-{slot}"
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(slot, process, parent_conn, shm, cores)
+
+    def _wait_ready(self, worker: _Worker):
+        try:
+            if not worker.conn.poll(self.start_timeout):
+                raise RuntimeError(f"推理进程 {worker.slot} 启动超时 ({self.start_timeout}秒)")
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"推理进程 {worker.slot} 启动时退出: {e}")
+        if status != "ready":
+            raise RuntimeError(payload)
+
+    def _terminate(self, worker: _Worker):
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        self._release(worker)
+
+    def _release(self, worker: _Worker):
+        if worker.released:
+            return
+        worker.released = True
+        worker.conn.close()
+        try:
+            worker.shm.close()
+        except BufferError:
+            # 强制关闭时仍有调用持有共享内存视图：先删除名字，映射在视图释放后回收
+            pass
+        worker.shm.unlink()
+
+    def _restart(self, worker: _Worker) -> Optional[_Worker]:
+        """工作进程异常退出时替换为新进程。
+
+        工作池已关闭时只回收旧进程并返回 None；新进程启动失败时返回已失效的旧进程，下次取用时会再次重启。
+        """
+        with self._lock:
+            self._terminate(worker)
+            if self._closed:
+                return None
+            self.stats["restarts"] += 1
+            replacement = self._spawn(worker.slot)
+            try:
+                self._wait_ready(replacement)
+            except Exception as e:
+                self._terminate(replacement)
+                logger.error(f"推理进程 {worker.slot} 重启失败: {e}")
+                return worker
+            self._workers[worker.slot] = replacement
+            logger.warning(f"推理进程 {worker.slot} 已重启")
+            return replacement
+
+    def _acquire(self, timeout: Optional[float]) -> _Worker:
+        worker = self._idle.get(timeout=timeout)
+        if worker is None:
+            # 关闭标记：传给下一个等待者后退出
+            self._idle.put(None)
+            raise PoolClosedError("推理工作池已关闭")
+        return worker
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        """阻塞调用（在线程池中执行）：取一个空闲进程完成编码，超过 max_rows 时分段。
+
+        工作池关闭后（重新加载模型时被替换）抛出 PoolClosedError，调用方应改用新的工作池。
+        """
+        with self._state:
+            if self._closed:
+                raise PoolClosedError("推理工作池已关闭")
+            self._active += 1
+        try:
+            if len(texts) <= self.max_rows:
+                return self._encode_rows(texts, timeout)
+            return np.concatenate([
+                self._encode_rows(texts[start:start + self.max_rows], timeout)
+                for start in range(0, len(texts), self.max_rows)
+            ])
+        finally:
+            with self._state:
+                self._active -= 1
+                self._state.notify_all()
+
+    def _encode_rows(self, texts: List[str], timeout: Optional[float]) -> np.ndarray:
+        worker = self._acquire(timeout)
+        started = time.perf_counter()
+        try:
+            worker.conn.send(texts)
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            self.stats["errors"] += 1
+            replacement = self._restart(worker)
+            if replacement is None:
+                raise PoolClosedError("推理工作池已关闭")
+            self._idle.put(replacement)
+            raise RuntimeError(f"推理进程异常退出: {e}")
+
+        try:
+            if status != "ok":
+                self.stats["errors"] += 1
+                raise RuntimeError(payload)
+            output = np.ndarray((self.max_rows, self.dimension), dtype=np.float32, buffer=worker.shm.buf)
+            # 归还进程前必须拷出，共享内存会被下一批覆盖
+            vectors = output[:payload].copy()
+            del output
+        finally:
+            self._idle.put(worker)
+
+        worker.batches += 1
+        worker.items += len(texts)
+        self.stats["batches"] += 1
+        self.stats["items"] += len(texts)
+        self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return vectors
+
+    def close(self, drain_timeout: float = 30.0):
+        """先拒绝新调用并唤醒等待空闲进程的调用，等进行中的调用完成（最多 drain_timeout 秒）后再停止进程、释放共享内存"""
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+            self._idle.put(None)
+            if not self._state.wait_for(lambda: self._active == 0, timeout=drain_timeout):
+                logger.warning(f"推理工作池关闭时仍有 {self._active} 个调用未完成，强制停止进程")
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, BrokenPipeError):
+                    pass
+            for worker in self._workers:
+                worker.process.join(timeout=5)
+                self._terminate(worker)
+            self._workers = []
+        logger.info("推理工作池已关闭")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "closed": self._closed,
+            "active_calls": self._active,
+            "workers": self.num_workers,
+            "threads_per_worker": self.threads_per_worker,
+            "max_rows": self.max_rows,
+            "idle_workers": self._idle.qsize(),
+            "per_worker": [
+                {
+                    "slot": worker.slot,
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "cores": worker.cores,
+                    "batches": worker.batches,
+                    "items": worker.items
+                }
+                for worker in self._workers
+            ],
+            **self.stats
+        }
@@ -319,12 +319,12 @@ async def predict_potential(request: Dict[str, Any]):
 # 向量数据库操作
 @app.post("/api/vector/user-interests")
 async def add_user_interest_vector(user_id: str, vector: List[float]):
-    """添加用户兴趣向量"""
+    """添加（或更新）用户兴趣向量"""
     try:
         if not user_interests_collection:
             raise HTTPException(status_code=503, detail="用户兴趣集合未初始化")
         
-        user_interests_collection.add(
+        user_interests_collection.upsert(
             ids=[user_id],
             embeddings=[vector],
             metadatas=[{"user_id": user_id, "created_at": "2025-01-13T00:00:00Z"}]
@@ -337,12 +337,12 @@ async def add_user_interest_vector(user_id: str, vector: List[float]):
 
 @app.post("/api/vector/content-similarity")
 async def add_content_vector(content_id: str, vector: List[float]):
-    """添加内容向量"""
+    """添加（或更新）内容向量"""
     try:
         if not content_similarity_collection:
             raise HTTPException(status_code=503, detail="内容相似度集合未初始化")
         
-        content_similarity_collection.add(
+        content_similarity_collection.upsert(
             ids=[content_id],
             embeddings=[vector],
             metadatas=[{"content_id": content_id, "created_at": "2025-01-13T00:00:00Z"}]
@@ -355,12 +355,12 @@ async def add_content_vector(content_id: str, vector: List[float]):
 
 @app.post("/api/vector/cluster-compatibility")
 async def add_cluster_vector(cluster_id: str, vector: List[float]):
-    """添加星团向量"""
+    """添加（或更新）星团向量"""
     try:
         if not cluster_compatibility_collection:
             raise HTTPException(status_code=503, detail="星团兼容性集合未初始化")
         
-        cluster_compatibility_collection.add(
+        cluster_compatibility_collection.upsert(
             ids=[cluster_id],
             embeddings=[vector],
             metadatas=[{"cluster_id": cluster_id, "created_at": "2025-01-13T00:00:00Z"}]
@@ -1,30 +1,57 @@
 # FluLink v4.0 AI 服务实现 - 优化版
 # 基于《德道经》"无为而治"哲学，实现智能化的模型管理和降级策略
 
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import asyncio
-import time
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import functools
+import json
+import struct
+from typing import Optional, Dict, Any, TYPE_CHECKING
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-import chromadb
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 import numpy as np
 from typing import List, Dict, Any
 import logging
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from embedding_cache import EmbeddingCache
+from vector_search import (top_k_cosine, top_k_cosine_chunked, top_k_cosine_batch, fused_search,
+                           normalize_rows, stack_pool, iter_pool_blocks)
+from vector_index import VectorIndex, ChromaIndex, create_index
+from vector_store import PersistentVectorStore
+from inference_pool import InferencePool, PoolClosedError
+from embedding_backends import load_backend_model, load_embedding_backend, prepare_embedding_backend
+from warm_start import resolve_model_source
+from keyword_matcher import LexiconStore
+from content_analysis import AnalysisMemo, AnalysisPool, analyze_text
+from fallback_vectors import hashed_ngram_vectors
+from embedding_jobs import EmbeddingJobQueue, JobNotReady
+from propagation_planner import plan_propagation
+from geo_index import DEFAULT_LEVEL_RADII_KM, GeoIndex, fetch_user_locations, parse_location
+from user_pools import PB_POOL_PREFIX, UserPoolRegistry, fetch_pocketbase_users, pool_from_users
+import httpx
+import vector_codec
+
+# sentence_transformers / chromadb 导入耗时数秒，只在首次使用时加载
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+    import chromadb
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 全局变量
-embedding_model: Optional[SentenceTransformer] = None
-chroma_client: Optional[chromadb.Client] = None
-user_interests_collection: Optional[Any] = None
-content_similarity_collection: Optional[Any] = None
-cluster_compatibility_collection: Optional[Any] = None
+embedding_model: Optional["SentenceTransformer"] = None
+chroma_client: Optional["chromadb.Client"] = None
+user_interests_collection: Optional[VectorIndex] = None
+content_similarity_collection: Optional[VectorIndex] = None
+cluster_compatibility_collection: Optional[VectorIndex] = None
 
 # 模型状态管理
 model_status = {
@@ -32,42 +59,268 @@ model_status = {
         "loaded": False,
         "loading": False,
         "load_time": None,
-        "error": None
+        "error": None,
+        "backend": None
     },
     "chromadb": {
         "initialized": False,
         "initializing": False,
         "init_time": None,
         "error": None
+    },
+    "vector_index": {
+        "initialized": False,
+        "init_time": None,
+        "error": None
     }
 }
 
+# 启动各阶段耗时（秒），用于追踪冷启动回归
+startup_timings: Dict[str, Optional[float]] = {
+    "imports": round(time.perf_counter() - _IMPORT_STARTED, 3),
+    "model_load": None,
+    "chromadb_init": None,
+    "vector_collections": None,
+    "inference_pool": None,
+    "ready": None,
+    "model_ready": None
+}
+
 # 降级策略配置
 FALLBACK_CONFIG = {
     "model_load_timeout": 30,  # 模型加载超时时间（秒）
     "request_timeout": 10,      # 请求处理超时时间（秒）
     "enable_fallback": True,    # 是否启用降级策略
-    "fallback_vector_dim": 384  # 降级向量维度
+    "fallback_vector_dim": 384,  # 降级向量维度
+    "similarity_block_rows": 8192  # 降级相似度计算超过该规模时分块处理
+}
+
+# 向量索引配置（backend: ivf_flat / flat 为进程内常驻索引，chroma 为 ChromaDB 集合）
+VECTOR_INDEX_CONFIG = {
+    "backend": os.getenv("VECTOR_INDEX_BACKEND", "ivf_flat"),
+    "nlist": int(os.getenv("VECTOR_INDEX_NLIST", "256")),             # IVF 聚类中心数
+    "default_nprobe": int(os.getenv("VECTOR_INDEX_NPROBE", "8")),     # 默认探测簇数，可按请求覆盖
+    "compact_ratio": float(os.getenv("VECTOR_INDEX_COMPACT_RATIO", "0.2"))  # 墓碑占比超过该值时压缩
+}
+
+# 向量持久化配置（目录为空时集合仅保存在内存中）
+VECTOR_STORE_CONFIG = {
+    "directory": os.getenv("VECTOR_STORE_DIR", "data/vectors"),
+    "snapshot_interval": int(os.getenv("VECTOR_SNAPSHOT_INTERVAL", "300")),       # 快照检查间隔（秒）
+    "snapshot_min_writes": int(os.getenv("VECTOR_SNAPSHOT_MIN_WRITES", "1000")),  # 累计写入达到该值才生成快照
+    "fsync": os.getenv("VECTOR_STORE_FSYNC", "false").lower() == "true"
+}
+
+# 批量写入单次请求上限
+VECTOR_BATCH_MAX_ROWS = int(os.getenv("VECTOR_BATCH_MAX_ROWS", "100000"))
+
+# 多查询相似度检索配置
+SIMILARITY_BATCH_CONFIG = {
+    "max_queries": int(os.getenv("SIMILARITY_BATCH_MAX_QUERIES", "256")),  # 单次请求的查询向量上限
+    "query_block": int(os.getenv("SIMILARITY_BATCH_QUERY_BLOCK", "64"))    # 每次矩阵乘的查询行数，限制峰值内存
+}
+
+VECTOR_COLLECTION_NAMES = ["user_interests", "content_similarity", "cluster_compatibility"]
+
+# 各集合元数据中的 ID 字段
+VECTOR_ID_FIELDS = {
+    "user_interests": "user_id",
+    "content_similarity": "content_id",
+    "cluster_compatibility": "cluster_id"
+}
+
+# 后台回填任务配置（任务与待处理文本存于 SQLite，路径为空时仅保存在内存中）
+EMBEDDING_JOBS_CONFIG = {
+    "db_path": os.getenv("EMBEDDING_JOBS_DB", "data/jobs/embedding_jobs.sqlite3"),
+    "workers": int(os.getenv("EMBEDDING_JOBS_WORKERS", "1")),
+    "batch_size": int(os.getenv("EMBEDDING_JOBS_BATCH_SIZE", "256")),                  # 每批编码与写入的条数
+    "max_rows_per_second": float(os.getenv("EMBEDDING_JOBS_MAX_ROWS_PER_SECOND", "0")),  # 默认限速，0 为不限
+    "max_items": int(os.getenv("EMBEDDING_JOBS_MAX_ITEMS", "1000000")),                # 单个任务条数上限
+    "retry_interval": float(os.getenv("EMBEDDING_JOBS_RETRY_INTERVAL", "5"))
+}
+
+# 集合使用余弦距离，使 1 - distance 即为余弦相似度（与降级计算一致）
+COSINE_SPACE = {"hnsw:space": "cosine"}
+
+# 嵌入模型名称（同时作为向量缓存键的一部分）
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+# 嵌入推理后端：torch（fp32）/ torch_int8 / onnx / onnx_int8，非 fp32 后端需通过余弦一致性校验
+EMBEDDING_BACKEND_CONFIG = {
+    "backend": os.getenv("EMBEDDING_BACKEND", "torch"),
+    "model_dir": os.getenv("EMBEDDING_BACKEND_DIR", "models/backends"),        # ONNX 导出与量化模型存放目录
+    "parity_min_cosine": float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.99")),
+    "num_threads": int(os.getenv("EMBEDDING_BACKEND_THREADS", "0"))           # ONNX Runtime 线程数，0 为默认
+}
+
+# 嵌入缓存配置（磁盘层目录为空时仅使用内存层）
+CACHE_CONFIG = {
+    "enabled": os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true",
+    "max_memory_mb": float(os.getenv("EMBED_CACHE_MAX_MB", "64")),
+    "disk_dir": os.getenv("EMBED_CACHE_DIR", ""),
+    "disk_max_mb": float(os.getenv("EMBED_CACHE_DISK_MAX_MB", "1024"))
+}
+
+# 微批处理配置（可通过环境变量调优 p50/p99 延迟）
+BATCHING_CONFIG = {
+    "enabled": os.getenv("EMBED_BATCH_ENABLED", "true").lower() == "true",
+    "max_batch_size": int(os.getenv("EMBED_BATCH_MAX_SIZE", "32")),      # 单批最大条数
+    "max_wait_ms": float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5")),     # 凑批最长等待（毫秒）
+    "max_queue_size": int(os.getenv("EMBED_BATCH_MAX_QUEUE", "1024")),   # 等待队列上限，超出直接降级
+    "bulk_chunk_size": int(os.getenv("EMBED_BULK_CHUNK_SIZE", "64")),    # 批量接口每块条数
+    "bulk_max_items": int(os.getenv("EMBED_BULK_MAX_ITEMS", "50000"))    # 批量接口单次请求上限
+}
+
+# 多进程推理配置（INFERENCE_WORKERS=0 时在本进程线程池中推理）
+INFERENCE_POOL_CONFIG = {
+    "workers": int(os.getenv("INFERENCE_WORKERS", "0")),                          # 推理进程数
+    "threads_per_worker": int(os.getenv("INFERENCE_THREADS_PER_WORKER", "0")),    # 0 表示按分到的核数
+    "pin_cores": os.getenv("INFERENCE_PIN_CORES", "true").lower() == "true",      # 是否绑定 CPU 核
+    "max_rows": int(os.getenv("INFERENCE_MAX_ROWS", "256"))                       # 单次送入进程的最大条数（共享内存大小）
+}
+
+# 启动配置：FAST_START 时先对外服务，模型与向量集合在后台加载；模型优先从本地热启动快照恢复
+STARTUP_CONFIG = {
+    "fast_start": os.getenv("FAST_START", "false").lower() == "true",
+    "warm_start_dir": os.getenv("EMBEDDING_WARM_START_DIR", "models/warm")
+}
+
+# 内容分析词典：LEXICON_PATH 指向的 JSON 文件（{类别: [关键词, ...]}）可替换或新增类别，支持热重载
+# "topic:" 前缀的类别即话题；vector_feature 为降级向量的关键词特征（依次占用第 11 维起的位置）
+CONTENT_LEXICONS = {
+    "positive": ['好', '棒', '喜欢', '爱', '开心', '快乐', '美丽', '优秀'],
+    "negative": ['坏', '差', '讨厌', '恨', '难过', '痛苦', '丑陋', '糟糕'],
+    "topic:生活": ['生活', '日常', '今天', '昨天', '明天'],
+    "topic:科技": ['科技', '技术', 'AI', '人工智能', '编程'],
+    "topic:艺术": ['艺术', '音乐', '绘画', '创作', '设计'],
+    "topic:旅行": ['旅行', '旅游', '风景', '景点', '度假'],
+    "topic:美食": ['美食', '食物', '餐厅', '烹饪', '味道'],
+    "vector_feature": ['好', '棒', '喜欢', '爱', '开心', '快乐', '美丽', '优秀']
+}
+
+# 内容分析备忘录：同一内容在 TTL 内的 analyze-content / extract-tags / predict-potential 共享一次计算
+ANALYSIS_MEMO_CONFIG = {
+    "ttl_seconds": float(os.getenv("ANALYSIS_MEMO_TTL", "60")),
+    "max_entries": int(os.getenv("ANALYSIS_MEMO_MAX_ENTRIES", "4096"))
+}
+
+# 批量内容分析配置（进程池按块并行；默认取推理进程之外剩余的核数，最多 4 个进程）
+ANALYSIS_BATCH_CONFIG = {
+    "workers": int(os.getenv("ANALYSIS_WORKERS", "0")) or max(1, min(4, (os.cpu_count() or 1) - INFERENCE_POOL_CONFIG["workers"])),
+    "chunk_size": int(os.getenv("ANALYSIS_CHUNK_SIZE", "256")),             # 每块条数
+    "max_items": int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", "20000")),       # 单次请求上限
+    "inline_max_items": int(os.getenv("ANALYSIS_INLINE_MAX_ITEMS", "64"))   # 不超过该条数时在线程池中直接计算，省去进程间传输
+}
+
+# 传播路径规划配置（影响力最大化：RR-set 采样 + CELF 贪心）
+PROPAGATION_PLANNER_CONFIG = {
+    "num_seeds": int(os.getenv("PROPAGATION_NUM_SEEDS", "10")),
+    "semantic_weight": float(os.getenv("PROPAGATION_SEMANTIC_WEIGHT", "0.4")),
+    "geographic_weight": float(os.getenv("PROPAGATION_GEOGRAPHIC_WEIGHT", "0.6")),
+    "geo_radius_km": float(os.getenv("PROPAGATION_GEO_RADIUS_KM", "5")),
+    "window": int(os.getenv("PROPAGATION_WINDOW", "16")),                 # 每个用户的候选邻居规模
+    "rr_sets": int(os.getenv("PROPAGATION_RR_SETS", "0")),                # 0 为按误差目标分轮采样
+    "rr_error": float(os.getenv("PROPAGATION_RR_ERROR", "0.1")),          # 预计触达人数的目标相对误差
+    "max_rr_sets": int(os.getenv("PROPAGATION_MAX_RR_SETS", "20000")),
+    "max_target_users": int(os.getenv("PROPAGATION_MAX_TARGET_USERS", "100000"))
+}
+
+# PocketBase 管理员访问（地理索引与 pb: 用户池从 users 集合读取数据）
+POCKETBASE_CONFIG = {
+    "url": os.getenv("POCKETBASE_URL", "http://pocketbase:8090"),
+    "admin_email": os.getenv("POCKETBASE_ADMIN_EMAIL", "admin@flulink.app"),
+    "admin_password": os.getenv("POCKETBASE_ADMIN_PASSWORD", "Flulink2025!Admin"),
+    "timeout": float(os.getenv("POCKETBASE_TIMEOUT", "30"))
+}
+
+# 地理层级索引配置：启动时从 PocketBase users.location_data 全量加载，之后按 refresh_seconds 定期重建，
+# 用户位置变化由 PocketBase 钩子通过 /api/geo/users 增量推送
+GEO_INDEX_CONFIG = {
+    "enabled": os.getenv("GEO_INDEX_ENABLED", "true").lower() == "true",
+    "refresh_seconds": float(os.getenv("GEO_INDEX_REFRESH_SECONDS", "600")),   # 0 为只在启动时加载
+    "page_size": int(os.getenv("GEO_INDEX_PAGE_SIZE", "500")),
+    "max_query_cells": int(os.getenv("GEO_INDEX_MAX_QUERY_CELLS", "4096")),
+    "max_radius_km": float(os.getenv("GEO_MAX_RADIUS_KM", "500")),            # /api/geo/nearby 允许的最大半径
+    "default_target_level": os.getenv("GEO_DEFAULT_TARGET_LEVEL", "community"),  # 毒株未给出传播层级时的选人范围
+    "level_radii_km": {
+        level: float(os.getenv(f"GEO_RADIUS_{level.upper()}_KM", str(radius)))
+        for level, radius in DEFAULT_LEVEL_RADII_KM.items()
+    }
+}
+
+# 服务端用户池配置：全部池的向量矩阵合计不超过 max_mb，超出时按 LRU 淘汰
+USER_POOL_CONFIG = {
+    "max_mb": float(os.getenv("USER_POOL_MAX_MB", "512")),
+    "pb_ttl_seconds": float(os.getenv("USER_POOL_PB_TTL", "300")),   # pb: 池的重新加载间隔
+    # 可按 pb:<名称> 引用的 PocketBase 用户池（名称 -> users 过滤表达式，JSON），客户端不能提交任意过滤条件
+    "pb_pools": json.loads(os.getenv("USER_POOL_PB_POOLS", '{"all": ""}')),
+    "page_size": int(os.getenv("USER_POOL_PB_PAGE_SIZE", "500"))
 }
 
 # 数据模型
 class TextEmbeddingRequest(BaseModel):
     text: str
+    vector_encoding: str = "json"        # json / base64；二进制响应通过 Accept: application/octet-stream 协商
+    vector_dtype: Optional[str] = None   # float32 / float16 / int8（base64 与二进制时生效）
 
 class TextEmbeddingResponse(BaseModel):
-    vector: List[float]
+    vector: Optional[List[float]] = None
+    vector_b64: Optional[str] = None     # vector_encoding=base64 时返回
+    vector_dtype: Optional[str] = None
     dimension: int
     model_used: str  # 标识使用的模型（primary/fallback）
 
+class BulkEmbeddingRequest(BaseModel):
+    texts: List[str]
+    ids: Optional[List[str]] = None
+    chunk_size: Optional[int] = None
+    format: str = "ndjson"  # ndjson / float32 / float16 / int8
+
 class SimilarityRequest(BaseModel):
-    seed_vector: List[float]
-    user_pool: List[Dict[str, Any]]
+    seed_vector: Optional[List[float]] = None
+    seed_vector_b64: Optional[str] = None  # 与 seed_vector 二选一，按 vector_dtype 解码
+    vector_dtype: str = "float32"
+    user_pool: List[Dict[str, Any]] = []
+    pool_id: Optional[str] = None        # 服务端用户池（/api/pools 注册，或服务端配置的 pb:<名称>），优先于 user_pool
+    pool_version: Optional[int] = None   # 给出时须与池当前版本一致，否则返回 409
     limit: int = 10
     min_similarity: float = 0.6
+    nprobe: Optional[int] = Field(None, ge=1)  # 召回率/延迟权衡：越大越精确，超过簇数时按全量扫描
 
 class SimilarityResponse(BaseModel):
     similar_users: List[Dict[str, Any]]
     model_used: str
+    pool_id: Optional[str] = None
+    pool_version: Optional[int] = None
+
+class BatchSimilarityRequest(BaseModel):
+    seed_vectors: Optional[List[List[float]]] = None
+    seed_vectors_b64: Optional[str] = None  # 与 seed_vectors 二选一，行优先矩阵，按 vector_dtype 解码
+    vector_dtype: str = "float32"
+    dimension: Optional[int] = None         # 使用 seed_vectors_b64 时必填
+    user_pool: List[Dict[str, Any]] = []
+    pool_id: Optional[str] = None
+    pool_version: Optional[int] = None
+    limit: int = 10
+    min_similarity: float = 0.6
+    nprobe: Optional[int] = Field(None, ge=1)
+    fusion: Optional[str] = None            # max / mean：在服务端融合各查询得分，只返回一个列表
+
+class BatchSimilarityResponse(BaseModel):
+    results: Optional[List[List[Dict[str, Any]]]] = None  # 未融合时每个查询一组，顺序与输入一致
+    similar_users: Optional[List[Dict[str, Any]]] = None  # 融合后的结果
+    fusion: Optional[str] = None
+    model_used: str
+    pool_id: Optional[str] = None
+    pool_version: Optional[int] = None
+
+class PoolRegisterRequest(BaseModel):
+    pool_id: Optional[str] = None        # 省略时由服务端生成；已存在时替换并递增版本号
+    users: List[Dict[str, Any]] = []     # 与 user_pool 相同格式
+    ids: Optional[List[str]] = None      # 与 vectors_b64 配合使用，按行对应
+    vectors_b64: Optional[str] = None    # 行优先的向量矩阵，按 vector_dtype 解码
+    vector_dtype: str = "float32"
+    metadata: Optional[List[Dict[str, Any]]] = None
 
 class ContentAnalysisRequest(BaseModel):
     content: str
@@ -80,9 +333,40 @@ class ContentAnalysisResponse(BaseModel):
     engagement_potential: float
     model_used: str
 
+class BatchAnalysisRequest(BaseModel):
+    contents: List[str]
+    ids: Optional[List[str]] = None  # 可选，原样回填到结果中（如毒株 ID）
+
+class EmbeddingJobRequest(BaseModel):
+    collection: str                                    # user_interests / content_similarity / cluster_compatibility
+    ids: List[str]
+    texts: List[str]
+    metadatas: Optional[List[Dict[str, Any]]] = None
+    batch_size: Optional[int] = None
+    max_rows_per_second: Optional[float] = None        # 覆盖默认限速，0 为不限
+
+class StrainAnalysisResponse(BaseModel):
+    sentiment: str
+    topics: List[str]
+    keywords: List[str]
+    tags: List[str]
+    readability: float
+    engagement_potential: float
+    potential_score: float
+    model_used: str
+
 class PropagationRequest(BaseModel):
     star_seed: Dict[str, Any]
-    target_users: List[Dict[str, Any]]
+    target_users: List[Dict[str, Any]] = []   # 为空时按 star_seed.location 从地理索引选取
+    target_level: Optional[str] = None        # 地理索引选人的层级，默认取 star_seed.current_spread_level
+    max_targets: Optional[int] = None
+    pool_id: Optional[str] = None             # 以服务端用户池为目标用户（坐标取自地理索引），优先于 target_users
+    pool_version: Optional[int] = None
+    target_vectors_b64: Optional[str] = None  # 与 target_users 按行对应的兴趣向量矩阵，代替逐个用户的 interest_vector
+    vector_dtype: str = "float32"
+
+class GeoUsersUpdate(BaseModel):
+    users: List[Dict[str, Any]]               # {"id": ..., "location_data": {...}}，位置为空表示移除
 
 class PropagationResponse(BaseModel):
     optimal_path: Dict[str, Any]
@@ -90,67 +374,228 @@ class PropagationResponse(BaseModel):
 
 # 降级向量生成器
 class FallbackVectorGenerator:
-    """基于规则的降级向量生成器"""
-    
+    """基于字符 n-gram 特征哈希的降级向量生成器（确定性：同一文本始终得到同一向量）"""
+
+    @staticmethod
+    def _keyword_hits(texts: List[str]) -> List[List[str]]:
+        # 与内容分析共用一个自动机，每条文本一次扫描
+        matcher = lexicon_store.matcher
+        return [matcher.scan(text).keywords("vector_feature") for text in texts]
+
+    @staticmethod
+    def generate_fallback_vectors(texts: List[str], dimension: int = 384) -> np.ndarray:
+        """批量生成降级向量，返回 (len(texts), dimension) 的 float32 矩阵"""
+        return hashed_ngram_vectors(
+            texts,
+            dimension,
+            keywords=FallbackVectorGenerator._keyword_hits(texts)
+        )
+
     @staticmethod
     def generate_fallback_vector(text: str, dimension: int = 384) -> List[float]:
-        """生成降级向量"""
-        # 基于文本特征的简单向量生成
-        vector = np.zeros(dimension)
-        
-        # 基于文本长度的特征
-        text_length = len(text)
-        vector[0] = min(text_length / 1000, 1.0)  # 归一化长度
-        
-        # 基于字符频率的特征
-        char_freq = {}
-        for char in text.lower():
-            char_freq[char] = char_freq.get(char, 0) + 1
-        
-        # 填充前几个维度
-        for i, (char, freq) in enumerate(list(char_freq.items())[:10]):
-            if i + 1 < dimension:
-                vector[i + 1] = min(freq / len(text), 1.0)
-        
-        # 基于关键词的简单特征
-        keywords = ['好', '棒', '喜欢', '爱', '开心', '快乐', '美丽', '优秀']
-        for i, keyword in enumerate(keywords):
-            if keyword in text and i + 11 < dimension:
-                vector[i + 11] = 1.0
-        
-        # 添加随机噪声以增加多样性
-        noise = np.random.normal(0, 0.1, dimension)
-        vector = vector + noise
-        
-        # 归一化
-        norm = np.linalg.norm(vector)
-        if norm > 0:
-            vector = vector / norm
-        
-        return vector.tolist()
+        """生成单条降级向量"""
+        return FallbackVectorGenerator.generate_fallback_vectors([text], dimension)[0].tolist()
+
+# 嵌入微批处理器
+class EmbeddingBatcher:
+    """将并发的单条向量化请求聚合为一次 encode([...]) 调用"""
+
+    def __init__(self, encode_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_queue_size: int = 1024, max_concurrent_batches: int = 1):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set = set()
+        self.stats = {
+            "batches": 0,
+            "items": 0,
+            "rejected": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "max_batch_size_seen": 0,
+            "last_batch_ms": None,
+            "last_wait_ms": None
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def set_max_concurrent_batches(self, value: int):
+        """调整同时在途的批次数（运行中只能增加）"""
+        value = max(1, value)
+        if self._slots is not None:
+            for _ in range(value - self.max_concurrent_batches):
+                self._slots.release()
+        self.max_concurrent_batches = max(value, self.max_concurrent_batches) if self._slots else value
+
+    def start(self):
+        """启动后台聚合协程（需在事件循环内调用）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止聚合协程，并让尚未处理的请求走降级路径"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._inflight):
+            task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        while self._queue and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("微批处理器已停止"))
+
+    async def submit(self, text: str) -> np.ndarray:
+        """提交单条文本，等待所在批次完成后返回向量"""
+        if not self.running:
+            raise RuntimeError("微批处理器未运行")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise RuntimeError("微批处理队列已满")
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        """取出第一条后在等待窗口内尽量凑满一批"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        # 等待窗口结束时把已排队的请求一并带走
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        # 槽位数即同时在途的批次数；单进程推理时为 1，与逐批串行等价
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # 已超时被取消的请求不再参与推理
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._process(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch: List[tuple]):
+        loop = asyncio.get_running_loop()
+        try:
+            texts = [item[0] for item in batch]
+            started = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(None, self.encode_fn, texts)
+            except Exception as e:
+                self.stats["errors"] += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            finished = time.perf_counter()
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["last_batch_size"] = len(batch)
+            self.stats["max_batch_size_seen"] = max(self.stats["max_batch_size_seen"], len(batch))
+            self.stats["last_batch_ms"] = round((finished - started) * 1000, 3)
+            self.stats["last_wait_ms"] = round((started - min(item[2] for item in batch)) * 1000, 3)
+        finally:
+            self._slots.release()
+
+    def status(self) -> Dict[str, Any]:
+        """微批处理运行状态，供 model-status 查询"""
+        batches = self.stats["batches"]
+        return {
+            "running": self.running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_queue_size": self.max_queue_size,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "inflight_batches": len(self._inflight),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": round(self.stats["items"] / batches, 2) if batches else 0,
+            **self.stats
+        }
 
 # 异步模型加载器
 class AsyncModelLoader:
     """异步模型加载器，支持超时和降级"""
     
     @staticmethod
-    async def load_embedding_model(timeout: int = 30) -> Optional[SentenceTransformer]:
+    async def load_embedding_model(timeout: int = 30) -> Optional["SentenceTransformer"]:
         """异步加载嵌入模型"""
         try:
             logger.info("开始异步加载嵌入模型...")
             start_time = time.time()
+            loop = asyncio.get_event_loop()
+            source = resolve_model_source(EMBEDDING_MODEL_NAME, STARTUP_CONFIG["warm_start_dir"])
+            
+            # 非 fp32 后端的导出 / 量化与一致性校验只在产物变化时执行（镜像构建时已完成），不计入加载超时
+            parity = await loop.run_in_executor(
+                None,
+                lambda: prepare_embedding_backend(
+                    EMBEDDING_BACKEND_CONFIG["backend"],
+                    EMBEDDING_MODEL_NAME,
+                    EMBEDDING_BACKEND_CONFIG["model_dir"],
+                    min_cosine=EMBEDDING_BACKEND_CONFIG["parity_min_cosine"],
+                    num_threads=EMBEDDING_BACKEND_CONFIG["num_threads"],
+                    source=source
+                )
+            )
             
             # 使用 asyncio.wait_for 实现超时
-            model = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
+            model, backend_info = await asyncio.wait_for(
+                loop.run_in_executor(
                     None, 
-                    lambda: SentenceTransformer('all-MiniLM-L6-v2')
+                    lambda: load_embedding_backend(
+                        EMBEDDING_BACKEND_CONFIG["backend"],
+                        EMBEDDING_MODEL_NAME,
+                        EMBEDDING_BACKEND_CONFIG["model_dir"],
+                        min_cosine=EMBEDDING_BACKEND_CONFIG["parity_min_cosine"],
+                        num_threads=EMBEDDING_BACKEND_CONFIG["num_threads"],
+                        source=source,
+                        parity=parity
+                    )
                 ),
                 timeout=timeout
             )
+            model_status["embedding_model"]["backend"] = backend_info
             
             load_time = time.time() - start_time
-            logger.info(f"嵌入模型加载完成，耗时: {load_time:.2f}秒")
+            logger.info(f"嵌入模型加载完成 (backend={backend_info['active']})，耗时: {load_time:.2f}秒")
             
             return model
             
@@ -162,17 +607,20 @@ class AsyncModelLoader:
             return None
 
     @staticmethod
-    async def initialize_chromadb(timeout: int = 15) -> Optional[chromadb.Client]:
+    async def initialize_chromadb(timeout: int = 15) -> Optional["chromadb.Client"]:
         """异步初始化 ChromaDB"""
         try:
             logger.info("开始异步初始化 ChromaDB...")
             start_time = time.time()
             
+            def create_client():
+                import chromadb
+                if VECTOR_STORE_CONFIG["directory"]:
+                    return chromadb.PersistentClient(path=os.path.join(VECTOR_STORE_CONFIG["directory"], "chroma"))
+                return chromadb.Client()
+            
             client = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: chromadb.Client()
-                ),
+                asyncio.get_event_loop().run_in_executor(None, create_client),
                 timeout=timeout
             )
             
@@ -188,64 +636,375 @@ class AsyncModelLoader:
             logger.error(f"ChromaDB 初始化失败: {e}")
             return None
 
-# 应用生命周期管理
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """应用生命周期管理"""
-    # 启动时异步加载模型
-    logger.info("FluLink AI 服务启动中...")
+# 全局推理工作池（未启用时为 None）
+inference_pool: Optional[InferencePool] = None
+
+def _cache_model_key() -> str:
+    """向量缓存键中的模型标识：不同推理后端的向量不混用"""
+    backend = model_status["embedding_model"]["backend"]
+    active = backend["active"] if backend else "torch"
+    return EMBEDDING_MODEL_NAME if active == "torch" else f"{EMBEDDING_MODEL_NAME}@{active}"
+
+def _encode_texts(texts: List[str]) -> np.ndarray:
+    """使用当前主模型批量编码（在线程池中执行）；启用工作池时转交给推理进程"""
+    pool = inference_pool
+    while pool is not None:
+        try:
+            return pool.encode(texts)
+        except PoolClosedError:
+            # 重新加载模型时旧工作池已关闭：改用替换后的工作池（没有新池时退回进程内推理）
+            if inference_pool is pool:
+                raise
+            pool = inference_pool
+    model = embedding_model
+    if model is None:
+        raise RuntimeError("嵌入模型未加载")
+    return model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+def _start_inference_pool(model) -> Optional[InferencePool]:
+    """按配置 spawn 推理进程；各进程按当前生效的后端从同一来源（热启动快照）自行加载模型，不继承本进程状态"""
+    workers = INFERENCE_POOL_CONFIG["workers"]
+    if workers <= 0 or model is None:
+        return None
+    backend = model_status["embedding_model"]["backend"] or {}
+    try:
+        pool = InferencePool(
+            functools.partial(
+                load_backend_model,
+                backend.get("active", "torch"),
+                EMBEDDING_MODEL_NAME,
+                EMBEDDING_BACKEND_CONFIG["model_dir"],
+                source=backend.get("source")
+            ),
+            num_workers=workers,
+            dimension=model.get_sentence_embedding_dimension(),
+            max_rows=max(INFERENCE_POOL_CONFIG["max_rows"], BATCHING_CONFIG["max_batch_size"]),
+            threads_per_worker=INFERENCE_POOL_CONFIG["threads_per_worker"],
+            pin_cores=INFERENCE_POOL_CONFIG["pin_cores"]
+        )
+        pool.start()
+        return pool
+    except Exception as e:
+        logger.error(f"推理工作池启动失败，回退到进程内推理: {e}")
+        return None
+
+# 全局微批处理器（读取全局模型，重新加载模型后无需重建）
+embedding_batcher = EmbeddingBatcher(
+    _encode_texts,
+    max_batch_size=BATCHING_CONFIG["max_batch_size"],
+    max_wait_ms=BATCHING_CONFIG["max_wait_ms"],
+    max_queue_size=BATCHING_CONFIG["max_queue_size"]
+)
+
+# 全局关键词词典（内容分析与降级向量共用）
+lexicon_store = LexiconStore(CONTENT_LEXICONS, os.getenv("LEXICON_PATH", ""))
+
+# 全局内容分析备忘录
+analysis_memo = AnalysisMemo(
+    ttl_seconds=ANALYSIS_MEMO_CONFIG["ttl_seconds"],
+    max_entries=ANALYSIS_MEMO_CONFIG["max_entries"]
+)
+
+# 全局批量分析进程池（首次批量请求时启动）
+analysis_pool = AnalysisPool(
+    workers=ANALYSIS_BATCH_CONFIG["workers"],
+    chunk_size=ANALYSIS_BATCH_CONFIG["chunk_size"]
+)
+
+async def _analyze_cached(content: str) -> Dict[str, Any]:
+    """取备忘录中的分析结果；未命中时在线程池中计算（长文本扫描不阻塞事件循环）并写入"""
+    result = analysis_memo.get(content)
+    if result is None:
+        matcher = lexicon_store.matcher
+        result = await asyncio.get_event_loop().run_in_executor(
+            None, analyze_text, content, matcher
+        )
+        # 计算期间词典被重载时（备忘录已清空）不写入旧词典的结果
+        if lexicon_store.matcher is matcher:
+            analysis_memo.put(content, result)
+    return result
+
+# 全局嵌入缓存
+embedding_cache = EmbeddingCache(
+    max_bytes=int(CACHE_CONFIG["max_memory_mb"] * 1024 * 1024),
+    disk_dir=CACHE_CONFIG["disk_dir"] or None,
+    disk_max_bytes=int(CACHE_CONFIG["disk_max_mb"] * 1024 * 1024)
+)
+
+def _model_dimension(model) -> int:
+    """向量集合的维度：主模型的输出维度，模型不可用时为降级向量维度"""
+    if model is not None:
+        return model.get_sentence_embedding_dimension()
+    return FALLBACK_CONFIG["fallback_vector_dim"]
+
+def _init_vector_collections(dimension: Optional[int] = None):
+    """按配置创建三个向量集合（常驻索引或 ChromaDB 集合），维度固定为模型维度，不由首次写入决定"""
+    global user_interests_collection, content_similarity_collection, cluster_compatibility_collection
     
-    # 并行加载模型和数据库
-    tasks = [
-        AsyncModelLoader.load_embedding_model(FALLBACK_CONFIG["model_load_timeout"]),
-        AsyncModelLoader.initialize_chromadb(15)
+    backend = VECTOR_INDEX_CONFIG["backend"]
+    dimension = dimension or _model_dimension(embedding_model)
+    try:
+        collections = {}
+        for name in VECTOR_COLLECTION_NAMES:
+            if backend == "chroma":
+                if not chroma_client:
+                    raise RuntimeError("ChromaDB 未初始化")
+                collections[name] = ChromaIndex(
+                    name, chroma_client.get_or_create_collection(name, metadata=COSINE_SPACE), dimension
+                )
+            else:
+                index = create_index(
+                    name, backend,
+                    dimension=dimension,
+                    nlist=VECTOR_INDEX_CONFIG["nlist"],
+                    default_nprobe=VECTOR_INDEX_CONFIG["default_nprobe"],
+                    compact_ratio=VECTOR_INDEX_CONFIG["compact_ratio"]
+                )
+                if VECTOR_STORE_CONFIG["directory"]:
+                    index = PersistentVectorStore(
+                        index,
+                        os.path.join(VECTOR_STORE_CONFIG["directory"], name),
+                        fsync=VECTOR_STORE_CONFIG["fsync"]
+                    ).open()
+                collections[name] = index
+        user_interests_collection = collections["user_interests"]
+        content_similarity_collection = collections["content_similarity"]
+        cluster_compatibility_collection = collections["cluster_compatibility"]
+        model_status["vector_index"]["initialized"] = True
+        model_status["vector_index"]["init_time"] = time.time()
+        model_status["vector_index"]["error"] = None
+        logger.info(f"✅ 向量集合初始化成功 (backend={backend})")
+    except Exception as e:
+        model_status["vector_index"]["error"] = str(e)
+        logger.error(f"向量集合初始化失败: {e}")
+
+def _get_collection(name: str) -> Optional[VectorIndex]:
+    return {
+        "user_interests": user_interests_collection,
+        "content_similarity": content_similarity_collection,
+        "cluster_compatibility": cluster_compatibility_collection
+    }.get(name)
+
+def _persistent_stores() -> List[PersistentVectorStore]:
+    return [
+        collection for collection in (_get_collection(name) for name in VECTOR_COLLECTION_NAMES)
+        if isinstance(collection, PersistentVectorStore)
+    ]
+
+async def _snapshot_loop():
+    """定期为写入较多的集合生成快照（在线程池中进行，不阻塞查询；未启用持久化时为空转）"""
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(VECTOR_STORE_CONFIG["snapshot_interval"])
+        for store in _persistent_stores():
+            if store.writes_since_snapshot >= VECTOR_STORE_CONFIG["snapshot_min_writes"]:
+                try:
+                    await loop.run_in_executor(None, store.snapshot)
+                except Exception as e:
+                    logger.error(f"向量集合 {store.name} 快照失败: {e}")
+
+async def _maybe_train_index(index: VectorIndex):
+    """写入后按需在线程池中（重新）训练 IVF 聚类中心"""
+    if index.needs_training():
+        await asyncio.get_event_loop().run_in_executor(None, index.train)
+
+def _encode_for_job(texts: List[str]) -> np.ndarray:
+    """回填任务只写入主模型向量；模型未就绪时等待而不是写入降级向量"""
+    if not (embedding_model and model_status["embedding_model"]["loaded"]):
+        raise JobNotReady("嵌入模型未加载")
+    return np.asarray(_encode_texts(texts), dtype=np.float32)
+
+async def _upsert_for_job(collection_name: str, ids: List[str], matrix: np.ndarray,
+                          metadatas: List[Dict[str, Any]]):
+    collection = _get_collection(collection_name)
+    if collection is None:
+        raise JobNotReady(f"{collection_name} 集合未初始化")
+    id_field = VECTOR_ID_FIELDS[collection_name]
+    created_at = datetime.now(timezone.utc).isoformat()
+    metadatas = [
+        {id_field: item_id, "created_at": created_at, **metadata}
+        for item_id, metadata in zip(ids, metadatas)
     ]
+    await asyncio.get_event_loop().run_in_executor(None, lambda: collection.upsert(ids, matrix, metadatas))
+    await _maybe_train_index(collection)
+
+# 全局地理层级索引（启动时从 PocketBase 加载，之后由增量推送与定期重建维护）
+geo_index = GeoIndex(GEO_INDEX_CONFIG["level_radii_km"], GEO_INDEX_CONFIG["max_query_cells"])
+
+@asynccontextmanager
+async def _pocketbase_session():
+    """以管理员身份访问 PocketBase，产出 (客户端, 认证头)"""
+    async with httpx.AsyncClient(base_url=POCKETBASE_CONFIG["url"], timeout=POCKETBASE_CONFIG["timeout"]) as client:
+        response = await client.post(
+            "/api/admins/auth-with-password",
+            json={"identity": POCKETBASE_CONFIG["admin_email"], "password": POCKETBASE_CONFIG["admin_password"]}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"PocketBase 认证失败 ({response.status_code})")
+        yield client, {"Authorization": f"Bearer {response.json().get('token')}"}
+
+async def _reload_geo_index() -> int:
+    """分页读取全部用户位置，在线程池中重建索引；读取期间收到的增量推送在换入新索引后重放"""
+    since = geo_index.begin_rebuild()
+    try:
+        async with _pocketbase_session() as (client, headers):
+            records = await fetch_user_locations(client, headers=headers, per_page=GEO_INDEX_CONFIG["page_size"])
+    except BaseException:
+        geo_index.cancel_rebuild()
+        raise
+    return await asyncio.get_event_loop().run_in_executor(None, geo_index.rebuild, records, since)
+
+user_pools = UserPoolRegistry(
+    int(USER_POOL_CONFIG["max_mb"] * 1024 * 1024),
+    pb_ttl_seconds=USER_POOL_CONFIG["pb_ttl_seconds"],
+    pb_pools=USER_POOL_CONFIG["pb_pools"]
+)
+
+async def _load_pb_pool(filter_expr: str) -> List[Dict[str, Any]]:
+    async with _pocketbase_session() as (client, headers):
+        return await fetch_pocketbase_users(client, headers=headers, filter_expr=filter_expr,
+                                            per_page=USER_POOL_CONFIG["page_size"])
+
+async def _geo_refresh_loop():
+    """启动时加载一次，之后定期全量重建（增量推送遗漏时以此兜底）"""
+    while True:
+        try:
+            users = await _reload_geo_index()
+            logger.info(f"✅ 地理索引已加载 ({users} 个有位置的用户)")
+        except Exception as e:
+            logger.warning(f"⚠️ 地理索引加载失败: {e}")
+        if GEO_INDEX_CONFIG["refresh_seconds"] <= 0:
+            return
+        await asyncio.sleep(GEO_INDEX_CONFIG["refresh_seconds"])
+
+# 全局回填任务队列（启动时打开任务库并继续未完成的任务）
+embedding_jobs = EmbeddingJobQueue(
+    EMBEDDING_JOBS_CONFIG["db_path"],
+    _encode_for_job,
+    _upsert_for_job,
+    workers=EMBEDDING_JOBS_CONFIG["workers"],
+    batch_size=EMBEDDING_JOBS_CONFIG["batch_size"],
+    max_rows_per_second=EMBEDDING_JOBS_CONFIG["max_rows_per_second"],
+    retry_interval=EMBEDDING_JOBS_CONFIG["retry_interval"]
+)
+
+async def _timed_phase(name: str, coro):
+    """记录启动阶段耗时（秒）"""
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        startup_timings[name] = round(time.perf_counter() - started, 3)
+
+async def _load_models():
+    """加载嵌入模型、ChromaDB、向量集合与推理工作池"""
+    global embedding_model, chroma_client, inference_pool
+    loop = asyncio.get_event_loop()
+    model_status["embedding_model"]["loading"] = True
+    
+    # 并行加载模型和数据库（仅 chroma 后端需要初始化 ChromaDB）
+    use_chroma = VECTOR_INDEX_CONFIG["backend"] == "chroma"
+    tasks = [_timed_phase("model_load", AsyncModelLoader.load_embedding_model(FALLBACK_CONFIG["model_load_timeout"]))]
+    if use_chroma:
+        tasks.append(_timed_phase("chromadb_init", AsyncModelLoader.initialize_chromadb(15)))
     
     results = await asyncio.gather(*tasks, return_exceptions=True)
+    model = results[0] if results[0] is not None and not isinstance(results[0], BaseException) else None
     
-    # 处理加载结果
-    global embedding_model, chroma_client
-    global user_interests_collection, content_similarity_collection, cluster_compatibility_collection
+    if use_chroma:
+        if results[1] is not None and not isinstance(results[1], BaseException):
+            chroma_client = results[1]
+            model_status["chromadb"]["initialized"] = True
+            model_status["chromadb"]["init_time"] = time.time()
+        else:
+            model_status["chromadb"]["error"] = str(results[1])
+            logger.warning("⚠️ ChromaDB 初始化失败，将使用降级策略")
+    
+    # 加载快照与重放段文件属于磁盘 I/O，放到线程池执行
+    await _timed_phase("vector_collections", loop.run_in_executor(None, _init_vector_collections, _model_dimension(model)))
+    
+    # 推理进程以 spawn 启动并自行加载模型；工作池就绪后再对外发布模型，避免首批请求落到进程内推理
+    pool = await _timed_phase("inference_pool", loop.run_in_executor(None, _start_inference_pool, model))
+    if pool:
+        inference_pool = pool
+        # 每个推理进程同时处理一批
+        embedding_batcher.set_max_concurrent_batches(pool.num_workers)
     
-    if isinstance(results[0], SentenceTransformer):
-        embedding_model = results[0]
+    if model is not None and CACHE_CONFIG["enabled"]:
+        # 磁盘缓存层在启动时加载键文件，不放到首个请求里
+        await loop.run_in_executor(None, embedding_cache.open_disk_tier, _cache_model_key())
+    
+    model_status["embedding_model"]["loading"] = False
+    if model is not None:
+        embedding_model = model
         model_status["embedding_model"]["loaded"] = True
         model_status["embedding_model"]["load_time"] = time.time()
+        startup_timings["model_ready"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
         logger.info("✅ 嵌入模型加载成功")
     else:
         model_status["embedding_model"]["error"] = str(results[0])
         logger.warning("⚠️ 嵌入模型加载失败，将使用降级策略")
+
+# 应用生命周期管理
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期管理"""
+    global inference_pool
+    logger.info("FluLink AI 服务启动中...")
     
-    if isinstance(results[1], chromadb.Client):
-        chroma_client = results[1]
-        model_status["chromadb"]["initialized"] = True
-        model_status["chromadb"]["init_time"] = time.time()
-        
-        # 初始化集合
-        try:
-            user_interests_collection = chroma_client.get_or_create_collection("user_interests")
-            content_similarity_collection = chroma_client.get_or_create_collection("content_similarity")
-            cluster_compatibility_collection = chroma_client.get_or_create_collection("cluster_compatibility")
-            logger.info("✅ ChromaDB 集合初始化成功")
-        except Exception as e:
-            logger.error(f"ChromaDB 集合初始化失败: {e}")
+    snapshot_task = asyncio.create_task(_snapshot_loop())
+    geo_task = asyncio.create_task(_geo_refresh_loop()) if GEO_INDEX_CONFIG["enabled"] else None
+    if BATCHING_CONFIG["enabled"]:
+        embedding_batcher.start()
+        logger.info(
+            f"✅ 嵌入微批处理已启用 (batch={BATCHING_CONFIG['max_batch_size']}, "
+            f"wait={BATCHING_CONFIG['max_wait_ms']}ms)"
+        )
+    
+    # 回填任务在模型与集合就绪前处于等待状态，不影响启动
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, embedding_jobs.open)
+        embedding_jobs.start()
+    except Exception as e:
+        logger.error(f"回填任务库打开失败，回填接口不可用: {e}")
+    
+    load_task = None
+    if STARTUP_CONFIG["fast_start"]:
+        # 先对外提供 /health 与规则类接口，模型就绪前嵌入请求走降级路径
+        load_task = asyncio.create_task(_load_models())
+        logger.info("FAST_START 已启用，模型与向量集合在后台加载")
     else:
-        model_status["chromadb"]["error"] = str(results[1])
-        logger.warning("⚠️ ChromaDB 初始化失败，将使用降级策略")
+        await _load_models()
     
-    logger.info("FluLink AI 服务启动完成")
+    startup_timings["ready"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+    logger.info(f"FluLink AI 服务启动完成，耗时: {startup_timings['ready']:.2f}秒")
     
     yield
     
     # 关闭时清理资源
     logger.info("FluLink AI 服务关闭中...")
-    if chroma_client:
+    if load_task and not load_task.done():
+        load_task.cancel()
         try:
-            chroma_client.delete_collection("user_interests")
-            chroma_client.delete_collection("content_similarity")
-            chroma_client.delete_collection("cluster_compatibility")
-        except:
+            await load_task
+        except asyncio.CancelledError:
             pass
+    await embedding_jobs.stop()
+    await embedding_batcher.stop()
+    await asyncio.get_event_loop().run_in_executor(None, embedding_cache.close)
+    analysis_pool.shutdown()
+    if inference_pool:
+        inference_pool.close()
+        inference_pool = None
+    snapshot_task.cancel()
+    if geo_task:
+        geo_task.cancel()
+    # 集合数据需要跨重启保留：只落盘快照、关闭段文件，不再删除集合
+    for store in _persistent_stores():
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, store.close)
+        except Exception as e:
+            logger.error(f"向量集合 {store.name} 关闭失败: {e}")
     logger.info("FluLink AI 服务已关闭")
 
 # 初始化 FastAPI 应用
@@ -274,31 +1033,80 @@ async def health_check():
         "service": "FluLink AI Service",
         "version": "4.0.0",
         "model_status": model_status,
+        "startup": {"fast_start": STARTUP_CONFIG["fast_start"], "timings": startup_timings},
         "fallback_enabled": FALLBACK_CONFIG["enable_fallback"],
         "timestamp": time.time()
     }
 
+def _embedding_response(vector, model_used: str, request: TextEmbeddingRequest, http_request: Request):
+    """按协商结果返回 JSON 浮点数组、base64 或原始二进制"""
+    dtype = vector_codec.check_dtype(
+        request.vector_dtype or http_request.headers.get(vector_codec.DTYPE_HEADER)
+    )
+    if vector_codec.wants_binary(http_request.headers.get("accept")):
+        return Response(
+            content=vector_codec.encode_vectors(vector, dtype),
+            media_type=vector_codec.BINARY_MEDIA_TYPE,
+            headers={
+                vector_codec.DTYPE_HEADER: dtype,
+                vector_codec.DIMENSION_HEADER: str(len(vector)),
+                "X-Model-Used": model_used
+            }
+        )
+    if request.vector_encoding == "base64":
+        return TextEmbeddingResponse(
+            vector_b64=vector_codec.encode_b64(vector, dtype),
+            vector_dtype=dtype,
+            dimension=len(vector),
+            model_used=model_used
+        )
+    return TextEmbeddingResponse(
+        vector=np.asarray(vector).tolist(),
+        dimension=len(vector),
+        model_used=model_used
+    )
+
 # 文本向量化 - 支持降级
-@app.post("/api/ai/embed-text", response_model=TextEmbeddingResponse)
-async def embed_text(request: TextEmbeddingRequest):
-    """文本向量化服务 - 支持降级策略"""
+@app.post("/api/ai/embed-text", response_model=TextEmbeddingResponse, response_model_exclude_none=True)
+async def embed_text(request: TextEmbeddingRequest, http_request: Request):
+    """文本向量化服务 - 支持降级策略与二进制/base64 向量编码"""
     try:
+        vector_codec.check_dtype(request.vector_dtype or http_request.headers.get(vector_codec.DTYPE_HEADER))
+        
+        # 命中缓存直接返回（仅缓存主模型结果）
+        if CACHE_CONFIG["enabled"]:
+            cache_key = _cache_model_key()
+            cached = embedding_cache.get_memory(cache_key, request.text)
+            if cached is None and embedding_cache.disk_enabled:
+                # 磁盘层读取放到线程池，慢磁盘不阻塞事件循环
+                cached = await asyncio.get_event_loop().run_in_executor(
+                    None, embedding_cache.get, cache_key, request.text
+                )
+            elif cached is None:
+                cached = embedding_cache.get(cache_key, request.text)
+            if cached is not None:
+                return _embedding_response(cached, "primary", request, http_request)
+        
         # 尝试使用主模型
         if embedding_model and model_status["embedding_model"]["loaded"]:
             try:
-                vector = await asyncio.wait_for(
-                    asyncio.get_event_loop().run_in_executor(
+                cache_generation = embedding_cache.generation
+                if embedding_batcher.running:
+                    # 与其他并发请求合并为一次前向计算
+                    vector_future = embedding_batcher.submit(request.text)
+                else:
+                    vector_future = asyncio.get_event_loop().run_in_executor(
                         None,
-                        lambda: embedding_model.encode(request.text)
-                    ),
+                        lambda: _encode_texts([request.text])[0]
+                    )
+                vector = await asyncio.wait_for(
+                    vector_future,
                     timeout=FALLBACK_CONFIG["request_timeout"]
                 )
+                if CACHE_CONFIG["enabled"]:
+                    embedding_cache.put(_cache_model_key(), request.text, vector, cache_generation)
                 
-                return TextEmbeddingResponse(
-                    vector=vector.tolist(),
-                    dimension=len(vector),
-                    model_used="primary"
-                )
+                return _embedding_response(vector, "primary", request, http_request)
             except asyncio.TimeoutError:
                 logger.warning("主模型处理超时，使用降级策略")
             except Exception as e:
@@ -312,73 +1120,239 @@ async def embed_text(request: TextEmbeddingRequest):
                 FALLBACK_CONFIG["fallback_vector_dim"]
             )
             
-            return TextEmbeddingResponse(
-                vector=fallback_vector,
-                dimension=len(fallback_vector),
-                model_used="fallback"
-            )
+            return _embedding_response(fallback_vector, "fallback", request, http_request)
         else:
             raise HTTPException(status_code=503, detail="模型未加载且降级策略未启用")
             
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"文本向量化失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _encode_chunk(texts: List[str]) -> tuple:
+    """编码一个分块，主模型不可用时整块生成降级向量"""
+    if embedding_model and model_status["embedding_model"]["loaded"]:
+        try:
+            return np.asarray(_encode_texts(texts), dtype=np.float32), "primary"
+        except Exception as e:
+            logger.warning(f"批量编码失败: {e}，使用降级策略")
+    if not FALLBACK_CONFIG["enable_fallback"]:
+        raise RuntimeError("模型未加载且降级策略未启用")
+    vectors = FallbackVectorGenerator.generate_fallback_vectors(texts, FALLBACK_CONFIG["fallback_vector_dim"])
+    return vectors, "fallback"
+
+def _parse_ndjson_texts(body: bytes) -> tuple:
+    """解析 NDJSON 请求体：每行为字符串或 {"id": ..., "text": ...}"""
+    texts, ids = [], []
+    for line_no, line in enumerate(body.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, str):
+            texts.append(item)
+            ids.append(None)
+        elif isinstance(item, dict) and isinstance(item.get("text"), str):
+            texts.append(item["text"])
+            ids.append(item.get("id"))
+        else:
+            raise ValueError(f"第 {line_no} 行缺少 text 字段")
+    return texts, ids
+
+# 批量文本向量化 - 按长度分块流式返回
+@app.post("/api/ai/embed-batch")
+async def embed_batch(http_request: Request):
+    """批量文本向量化：JSON 或 NDJSON 请求体，按块流式返回 NDJSON 或二进制向量"""
+    content_type = http_request.headers.get("content-type", "")
+    try:
+        body = await http_request.body()
+        if "ndjson" in content_type:
+            texts, ids = _parse_ndjson_texts(body)
+            chunk_size_param = http_request.query_params.get("chunk_size")
+            chunk_size = int(chunk_size_param) if chunk_size_param else None
+            output_format = http_request.query_params.get("format", "ndjson")
+        else:
+            request = BulkEmbeddingRequest.model_validate_json(body)
+            texts = request.texts
+            ids = request.ids or [None] * len(texts)
+            chunk_size = request.chunk_size
+            output_format = request.format
+        if vector_codec.wants_binary(http_request.headers.get("accept")) and output_format == "ndjson":
+            output_format = vector_codec.check_dtype(http_request.headers.get(vector_codec.DTYPE_HEADER))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"批量请求解析失败: {e}")
+
+    if len(ids) != len(texts):
+        raise HTTPException(status_code=400, detail="ids 与 texts 数量不一致")
+    if len(texts) > BATCHING_CONFIG["bulk_max_items"]:
+        raise HTTPException(status_code=413, detail=f"单次最多 {BATCHING_CONFIG['bulk_max_items']} 条文本")
+    if output_format != "ndjson" and output_format not in vector_codec.SUPPORTED_DTYPES:
+        raise HTTPException(status_code=400, detail="format 仅支持 ndjson / float32 / float16 / int8")
+
+    chunk_size = max(1, min(chunk_size or BATCHING_CONFIG["bulk_chunk_size"], 1024))
+    # 长度相近的文本放在同一块，减少 padding 浪费
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    if embedding_model and model_status["embedding_model"]["loaded"]:
+        dimension = embedding_model.get_sentence_embedding_dimension()
+    else:
+        dimension = FALLBACK_CONFIG["fallback_vector_dim"]
+
+    async def stream_chunks():
+        loop = asyncio.get_event_loop()
+        for start in range(0, len(order), chunk_size):
+            chunk_indices = order[start:start + chunk_size]
+            vectors, model_used = await loop.run_in_executor(
+                None, _encode_chunk, [texts[i] for i in chunk_indices]
+            )
+            if output_format != "ndjson":
+                # 每条记录：uint32 原始下标 + 按 vector_codec 编码的一行向量
+                records = bytearray()
+                for index, vector in zip(chunk_indices, vectors):
+                    records += struct.pack("<I", index)
+                    records += vector_codec.encode_vectors(vector, output_format)
+                yield bytes(records)
+            else:
+                lines = []
+                for index, vector in zip(chunk_indices, vectors):
+                    lines.append(json.dumps({
+                        "index": index,
+                        "id": ids[index],
+                        "vector": vector.tolist(),
+                        "model_used": model_used
+                    }, ensure_ascii=False, separators=(",", ":")))
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    if output_format != "ndjson":
+        return StreamingResponse(
+            stream_chunks(),
+            media_type=vector_codec.BINARY_MEDIA_TYPE,
+            headers={
+                "X-Embedding-Dimension": str(dimension),
+                "X-Embedding-Count": str(len(texts)),
+                vector_codec.DTYPE_HEADER: output_format
+            }
+        )
+    return StreamingResponse(stream_chunks(), media_type="application/x-ndjson")
+
+def _resolve_seed_vector(request: SimilarityRequest) -> np.ndarray:
+    """种子向量可以是浮点数组，也可以是 base64 编码的 float32/float16/int8"""
+    if request.seed_vector_b64:
+        return vector_codec.decode_b64(request.seed_vector_b64, request.vector_dtype, count=1)[0]
+    if request.seed_vector is None:
+        raise ValueError("缺少 seed_vector 或 seed_vector_b64")
+    return np.asarray(request.seed_vector, dtype=np.float32)
+
+def _resolve_seed_matrix(request: BatchSimilarityRequest) -> np.ndarray:
+    """查询矩阵可以是浮点二维数组，也可以是 base64 编码的矩阵"""
+    if request.seed_vectors_b64:
+        if not request.dimension:
+            raise ValueError("使用 seed_vectors_b64 时需要提供 dimension")
+        queries = vector_codec.decode_b64(request.seed_vectors_b64, request.vector_dtype, dimension=request.dimension)
+    elif request.seed_vectors:
+        if len({len(vector) for vector in request.seed_vectors}) != 1:
+            raise ValueError("seed_vectors 各行维度必须一致")
+        queries = np.asarray(request.seed_vectors, dtype=np.float32)
+    else:
+        raise ValueError("缺少 seed_vectors 或 seed_vectors_b64")
+    if queries.shape[0] == 0 or queries.shape[1] == 0:
+        raise ValueError("查询矩阵为空")
+    if queries.shape[0] > SIMILARITY_BATCH_CONFIG["max_queries"]:
+        raise ValueError(f"单次最多 {SIMILARITY_BATCH_CONFIG['max_queries']} 个查询向量")
+    return queries
+
+async def _resolve_pool(pool_id: str, expected_version: Optional[int] = None):
+    """取服务端用户池，找不到返回 404，版本不符返回 409"""
+    try:
+        pool = await user_pools.resolve(pool_id, _load_pb_pool)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"用户池不存在或已被淘汰: {pool_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"用户池加载失败: {e}")
+    if expected_version is not None and expected_version != pool.version:
+        raise HTTPException(status_code=409, detail=f"用户池版本已变为 {pool.version}")
+    return pool
+
 # 寻找相似用户 - 支持降级
-@app.post("/api/ai/find-similar-users", response_model=SimilarityResponse)
+@app.post("/api/ai/find-similar-users", response_model=SimilarityResponse, response_model_exclude_none=True)
 async def find_similar_users(request: SimilarityRequest):
     """寻找相似用户 - 支持降级策略"""
     try:
-        # 尝试使用 ChromaDB
-        if user_interests_collection and model_status["chromadb"]["initialized"]:
+        try:
+            seed = _resolve_seed_vector(request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # 服务端用户池：只传 pool_id，池内向量已预先归一化
+        if request.pool_id:
+            pool = await _resolve_pool(request.pool_id, request.pool_version)
+            try:
+                similar_users = await asyncio.get_event_loop().run_in_executor(
+                    None, user_pools.query, pool, seed, request.limit, request.min_similarity
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return SimilarityResponse(
+                similar_users=similar_users,
+                model_used="primary",
+                pool_id=pool.pool_id,
+                pool_version=pool.version
+            )
+        
+        # 尝试使用向量索引（集合为空时按请求携带的用户池计算）
+        collection = user_interests_collection
+        if collection is not None and collection.count() > 0:
             try:
-                results = await asyncio.wait_for(
+                similar_users = await asyncio.wait_for(
                     asyncio.get_event_loop().run_in_executor(
                         None,
-                        lambda: user_interests_collection.query(
-                            query_embeddings=[request.seed_vector],
-                            n_results=request.limit
+                        lambda: collection.query(
+                            seed,
+                            request.limit,
+                            min_similarity=request.min_similarity,
+                            nprobe=request.nprobe
                         )
                     ),
                     timeout=FALLBACK_CONFIG["request_timeout"]
                 )
                 
-                similar_users = []
-                for i, (user_id, distance) in enumerate(zip(results['ids'][0], results['distances'][0])):
-                    if distance < (1 - request.min_similarity):
-                        similar_users.append({
-                            "id": user_id,
-                            "similarity": 1 - distance,
-                            "metadata": results['metadatas'][0][i] if results['metadatas'] else {}
-                        })
-                
                 return SimilarityResponse(
                     similar_users=similar_users,
                     model_used="primary"
                 )
             except asyncio.TimeoutError:
-                logger.warning("ChromaDB 查询超时，使用降级策略")
+                logger.warning("向量索引查询超时，使用降级策略")
             except Exception as e:
-                logger.warning(f"ChromaDB 查询失败: {e}，使用降级策略")
+                logger.warning(f"向量索引查询失败: {e}，使用降级策略")
         
-        # 降级策略 - 基于余弦相似度的简单计算
+        # 降级策略 - 向量化余弦相似度 + top-k
         if FALLBACK_CONFIG["enable_fallback"]:
             logger.info("使用降级相似度计算")
-            similar_users = []
+            pool = request.user_pool
+            block_rows = FALLBACK_CONFIG["similarity_block_rows"]
             
-            for user_data in request.user_pool[:request.limit]:
-                if "interest_vector" in user_data and user_data["interest_vector"]:
-                    # 计算余弦相似度
-                    similarity = np.dot(request.seed_vector, user_data["interest_vector"]) / (
-                        np.linalg.norm(request.seed_vector) * np.linalg.norm(user_data["interest_vector"])
-                    )
-                    
-                    if similarity >= request.min_similarity:
-                        similar_users.append({
-                            "id": user_data.get("id", "unknown"),
-                            "similarity": float(similarity),
-                            "metadata": {}
-                        })
+            if len(pool) > block_rows:
+                indices, scores = top_k_cosine_chunked(
+                    seed, iter_pool_blocks(pool, seed.shape[0], block_rows),
+                    request.limit, request.min_similarity
+                )
+            else:
+                positions, matrix = stack_pool(pool, seed.shape[0])
+                rows, scores = top_k_cosine(seed, matrix, request.limit, request.min_similarity)
+                indices = [positions[row] for row in rows]
+            
+            similar_users = [
+                {
+                    "id": pool[index].get("id", "unknown"),
+                    "similarity": float(score),
+                    "metadata": pool[index].get("metadata") or {}
+                }
+                for index, score in zip(indices, scores)
+            ]
             
             return SimilarityResponse(
                 similar_users=similar_users,
@@ -387,64 +1361,176 @@ async def find_similar_users(request: SimilarityRequest):
         else:
             raise HTTPException(status_code=503, detail="数据库未初始化且降级策略未启用")
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"寻找相似用户失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# 内容分析 - 支持降级
-@app.post("/api/ai/analyze-content", response_model=ContentAnalysisResponse)
-async def analyze_content(request: ContentAnalysisRequest):
-    """分析内容特征 - 支持降级策略"""
+def _user_pool_search(pool: List[Dict[str, Any]]):
+    """请求携带的 JSON 用户池：逐块转换为矩阵，与全部查询做矩阵乘"""
+    block_rows = FALLBACK_CONFIG["similarity_block_rows"]
+
+    def search(queries: np.ndarray, k: int, min_similarity: Optional[float]) -> List[List[Dict[str, Any]]]:
+        results = top_k_cosine_batch(
+            queries, iter_pool_blocks(pool, queries.shape[1], block_rows), k, min_similarity,
+            query_block=SIMILARITY_BATCH_CONFIG["query_block"]
+        )
+        return [
+            [
+                {
+                    "id": pool[index].get("id", "unknown"),
+                    "similarity": float(score),
+                    "metadata": pool[index].get("metadata") or {}
+                }
+                for index, score in zip(indices.tolist(), scores)
+            ]
+            for indices, scores in results
+        ]
+    return search
+
+def _batch_response(matches, request: BatchSimilarityRequest, model_used: str, pool=None) -> BatchSimilarityResponse:
+    return BatchSimilarityResponse(
+        results=None if request.fusion else matches,
+        similar_users=matches if request.fusion else None,
+        fusion=request.fusion,
+        model_used=model_used,
+        pool_id=pool.pool_id if pool else None,
+        pool_version=pool.version if pool else None
+    )
+
+# 多查询相似度检索：一次矩阵-矩阵乘（分块）得到每个查询的 top-k，可选 max / mean 融合
+@app.post("/api/ai/find-similar-users/batch", response_model=BatchSimilarityResponse,
+          response_model_exclude_none=True)
+async def find_similar_users_batch(request: BatchSimilarityRequest):
+    """批量寻找相似用户，数据来源优先级与单查询接口相同：pool_id > 向量索引 > 请求携带的用户池"""
     try:
-        content = request.content
-        
-        # 简单的情感分析（降级策略）
-        positive_words = ['好', '棒', '喜欢', '爱', '开心', '快乐', '美丽', '优秀']
-        negative_words = ['坏', '差', '讨厌', '恨', '难过', '痛苦', '丑陋', '糟糕']
+        try:
+            queries = _resolve_seed_matrix(request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if request.fusion not in (None, "max", "mean"):
+            raise HTTPException(status_code=400, detail=f"不支持的融合方式: {request.fusion}（可选 max、mean）")
+        loop = asyncio.get_event_loop()
         
-        positive_count = sum(1 for word in positive_words if word in content)
-        negative_count = sum(1 for word in negative_words if word in content)
+        def run(search):
+            return loop.run_in_executor(
+                None, fused_search, search, queries, request.limit, request.min_similarity, request.fusion
+            )
         
-        if positive_count > negative_count:
-            sentiment = 'positive'
-        elif negative_count > positive_count:
-            sentiment = 'negative'
-        else:
-            sentiment = 'neutral'
+        if request.pool_id:
+            pool = await _resolve_pool(request.pool_id, request.pool_version)
+            try:
+                matches = await run(lambda qs, k, threshold: user_pools.query_batch(
+                    pool, qs, k, threshold,
+                    block_rows=FALLBACK_CONFIG["similarity_block_rows"],
+                    query_block=SIMILARITY_BATCH_CONFIG["query_block"]
+                ))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return _batch_response(matches, request, "primary", pool)
         
-        # 简单的话题提取
-        topics = []
-        topic_keywords = {
-            '生活': ['生活', '日常', '今天', '昨天', '明天'],
-            '科技': ['科技', '技术', 'AI', '人工智能', '编程'],
-            '艺术': ['艺术', '音乐', '绘画', '创作', '设计'],
-            '旅行': ['旅行', '旅游', '风景', '景点', '度假'],
-            '美食': ['美食', '食物', '餐厅', '烹饪', '味道']
-        }
+        collection = user_interests_collection
+        if collection is not None and collection.count() > 0:
+            try:
+                matches = await asyncio.wait_for(
+                    run(lambda qs, k, threshold: collection.query_batch(qs, k, threshold, nprobe=request.nprobe)),
+                    timeout=FALLBACK_CONFIG["request_timeout"]
+                )
+                return _batch_response(matches, request, "primary")
+            except asyncio.TimeoutError:
+                logger.warning("向量索引批量查询超时，使用降级策略")
+            except Exception as e:
+                logger.warning(f"向量索引批量查询失败: {e}，使用降级策略")
         
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in content for keyword in keywords):
-                topics.append(topic)
+        if FALLBACK_CONFIG["enable_fallback"]:
+            logger.info("使用降级相似度计算（批量）")
+            matches = await run(_user_pool_search(request.user_pool))
+            return _batch_response(matches, request, "fallback")
+        raise HTTPException(status_code=503, detail="数据库未初始化且降级策略未启用")
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量寻找相似用户失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 毒株综合分析：一次返回情感、话题、关键词、标签、可读性、参与度与传播潜力
+@app.post("/api/ai/analyze-strain", response_model=StrainAnalysisResponse)
+async def analyze_strain(request: ContentAnalysisRequest):
+    """毒株综合分析（创建毒株时一次请求取代 analyze-content / extract-tags / predict-potential 三次调用）"""
+    try:
+        return StrainAnalysisResponse(**(await _analyze_cached(request.content)), model_used="fallback")
+    except Exception as e:
+        logger.error(f"毒株分析失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 批量内容分析（如词典变更后重新评分整个 strains 集合）
+@app.post("/api/ai/analyze-content/batch")
+async def analyze_content_batch(request: BatchAnalysisRequest):
+    """批量毒株综合分析：先查备忘录，其余去重后按块分发到进程池，结果与输入顺序一致"""
+    contents = request.contents
+    if len(contents) > ANALYSIS_BATCH_CONFIG["max_items"]:
+        raise HTTPException(status_code=413, detail=f"单次最多 {ANALYSIS_BATCH_CONFIG['max_items']} 条内容")
+    if request.ids is not None and len(request.ids) != len(contents):
+        raise HTTPException(status_code=400, detail="ids 与 contents 数量不一致")
+    
+    try:
+        started = time.perf_counter()
+        analyses: Dict[str, Dict[str, Any]] = {}
+        pending = []
+        for content in dict.fromkeys(contents):
+            cached = analysis_memo.get(content)
+            if cached is not None:
+                analyses[content] = cached
+            else:
+                pending.append(content)
         
-        # 关键词提取（简单版本）
-        keywords = [word for word in content.split() if len(word) > 1][:5]
+        matcher = lexicon_store.matcher
+        if len(pending) <= ANALYSIS_BATCH_CONFIG["inline_max_items"]:
+            computed = await asyncio.get_event_loop().run_in_executor(
+                None, lambda: [analyze_text(content, matcher) for content in pending]
+            )
+        else:
+            computed = await analysis_pool.analyze(pending, matcher)
+        # 计算期间词典未被重载时才写入备忘录（重载会清空备忘录）
+        current = lexicon_store.matcher is matcher
+        for content, result in zip(pending, computed):
+            analyses[content] = result
+            if current:
+                analysis_memo.put(content, result)
         
-        # 可读性评分（简单版本）
-        readability = min(100, max(0, 100 - len(content) * 0.1))
+        results = []
+        for i, content in enumerate(contents):
+            item = dict(analyses[content])
+            if request.ids is not None:
+                item["id"] = request.ids[i]
+            results.append(item)
         
-        # 参与度潜力（基于内容长度和情感）
-        engagement_potential = min(100, max(0, 
-            readability * 0.5 + 
-            (positive_count * 10) + 
-            (len(topics) * 15)
-        ))
+        return {
+            "results": results,
+            "count": len(results),
+            "computed": len(pending),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            "model_used": "fallback"
+        }
         
+    except Exception as e:
+        logger.error(f"批量内容分析失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 内容分析 - 支持降级
+@app.post("/api/ai/analyze-content", response_model=ContentAnalysisResponse)
+async def analyze_content(request: ContentAnalysisRequest):
+    """分析内容特征 - 支持降级策略"""
+    try:
+        analysis = await _analyze_cached(request.content)
         return ContentAnalysisResponse(
-            sentiment=sentiment,
-            topics=topics,
-            keywords=keywords,
-            readability=readability,
-            engagement_potential=engagement_potential,
+            sentiment=analysis["sentiment"],
+            topics=analysis["topics"],
+            keywords=analysis["keywords"],
+            readability=analysis["readability"],
+            engagement_potential=analysis["engagement_potential"],
             model_used="fallback"  # 当前实现都是降级策略
         )
         
@@ -455,58 +1541,109 @@ async def analyze_content(request: ContentAnalysisRequest):
 # 提取光谱标签
 @app.post("/api/ai/extract-tags")
 async def extract_tags(request: ContentAnalysisRequest):
-    """提取光谱标签"""
+    """提取光谱标签（与 analyze-content 共享同一内容的分析结果）"""
     try:
-        content = request.content
-        
-        # 基于内容分析提取标签
-        analysis_request = ContentAnalysisRequest(content=content)
-        analysis = await analyze_content(analysis_request)
-        
-        # 组合话题和关键词作为标签
-        tags = analysis.topics + analysis.keywords[:3]
-        
-        # 去重并限制数量
-        tags = list(set(tags))[:5]
-        
-        return {"tags": tags, "model_used": "fallback"}
+        return {"tags": (await _analyze_cached(request.content))["tags"], "model_used": "fallback"}
         
     except Exception as e:
         logger.error(f"标签提取失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _select_geo_targets(request: PropagationRequest) -> tuple:
+    """请求未携带目标用户时，从地理索引取毒株所在层级半径内最近的用户，兴趣向量取自 user_interests 集合"""
+    origin = parse_location(request.star_seed.get("location"))
+    if origin is None or not len(geo_index):
+        return [], None
+    level = (request.target_level or request.star_seed.get("current_spread_level")
+             or GEO_INDEX_CONFIG["default_target_level"])
+    radius = geo_index.level_radii_km.get(level)
+    if radius is None:
+        raise ValueError(f"未知的传播层级: {level}")
+    limit = min(request.max_targets or PROPAGATION_PLANNER_CONFIG["max_target_users"],
+                PROPAGATION_PLANNER_CONFIG["max_target_users"])
+    nearby = geo_index.query_radius(origin[0], origin[1], radius, limit=limit)
+    target_users = []
+    for user_id, distance in nearby:
+        lat, lng = geo_index.location_of(user_id) or origin
+        target_users.append({"id": user_id, "location": {"lat": lat, "lng": lng}, "distance_km": distance})
+    get_vectors = getattr(user_interests_collection, "get_vectors", None)
+    user_vectors = get_vectors([user_id for user_id, _ in nearby]) if get_vectors and nearby else None
+    return target_users, user_vectors
+
+def _pool_targets(pool) -> tuple:
+    """服务端用户池作为目标用户：向量直接使用池内已归一化的矩阵，坐标取自地理索引，不在索引中时取 metadata 中的位置"""
+    target_users = [{"id": user_id, "metadata": metadata} for user_id, metadata in zip(pool.ids, pool.metadata)]
+    coords = geo_index.coords_of(pool.ids)
+    for row in np.flatnonzero(np.isnan(coords[:, 0])):
+        metadata = pool.metadata[row]
+        location = parse_location(metadata.get("location")) or parse_location(metadata.get("location_data"))
+        if location:
+            coords[row] = location
+    return target_users, pool.matrix, coords
+
 # 优化传播路径
 @app.post("/api/ai/optimize-propagation", response_model=PropagationResponse)
 async def optimize_propagation(request: PropagationRequest):
-    """优化传播路径"""
+    """优化传播路径：在目标用户的兴趣/地理图上选出预计触达最多的首推顺序"""
+    star_seed = request.star_seed
+    target_users = request.target_users
+    if len(target_users) > PROPAGATION_PLANNER_CONFIG["max_target_users"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"目标用户数超过上限 {PROPAGATION_PLANNER_CONFIG['max_target_users']}"
+        )
     try:
-        star_seed = request.star_seed
-        target_users = request.target_users
-        
-        # 简单的传播路径优化算法
-        optimal_path = {
-            "seed_id": star_seed.get("id", "unknown"),
-            "first_targets": target_users[:5],  # 前5个目标用户
-            "propagation_sequence": [],
-            "estimated_reach": len(target_users),
-            "confidence": 0.8
-        }
-        
-        # 生成传播序列
-        for i, user in enumerate(target_users[:10]):
-            optimal_path["propagation_sequence"].append({
-                "user_id": user.get("id", f"user_{i}"),
-                "timestamp": f"2025-01-13T{10+i:02d}:00:00Z",
-                "expected_resonance": 80 - i * 5,
-                "geographic_weight": 0.6,
-                "semantic_weight": 0.4
-            })
-        
+        loop = asyncio.get_event_loop()
+        user_vectors = target_matrix = target_coords = None
+        if request.pool_id:
+            pool = await _resolve_pool(request.pool_id, request.pool_version)
+            if len(pool.ids) > PROPAGATION_PLANNER_CONFIG["max_target_users"]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"用户池 {len(pool.ids)} 人，超过目标用户上限 {PROPAGATION_PLANNER_CONFIG['max_target_users']}"
+                )
+            target_users, target_matrix, target_coords = await loop.run_in_executor(None, _pool_targets, pool)
+        elif request.target_vectors_b64:
+            if not target_users:
+                raise ValueError("target_vectors_b64 需要与 target_users 按行对应")
+            target_matrix = await loop.run_in_executor(None, lambda: normalize_rows(vector_codec.decode_b64(
+                request.target_vectors_b64, request.vector_dtype, count=len(target_users)
+            )))
+        elif not target_users:
+            target_users, user_vectors = await loop.run_in_executor(None, _select_geo_targets, request)
+        # 毒株向量：优先使用请求携带的 content_vector，否则用主模型编码内容（降级向量与兴趣向量不在同一空间，不参与计算）
+        seed_vector = None
+        model_used = "fallback"
+        if isinstance(star_seed.get("content_vector"), list) and star_seed["content_vector"]:
+            model_used = "primary"
+        elif star_seed.get("content") and embedding_model and model_status["embedding_model"]["loaded"]:
+            try:
+                vectors = await asyncio.wait_for(
+                    loop.run_in_executor(None, _encode_texts, [str(star_seed["content"])]),
+                    timeout=FALLBACK_CONFIG["request_timeout"]
+                )
+                seed_vector = np.asarray(vectors[0], dtype=np.float32)
+                model_used = "primary"
+            except Exception as e:
+                logger.warning(f"毒株内容编码失败: {e}，仅按已有信息规划")
+
+        planner_config = {k: v for k, v in PROPAGATION_PLANNER_CONFIG.items() if k != "max_target_users"}
+        optimal_path = await loop.run_in_executor(
+            None, functools.partial(
+                plan_propagation, star_seed, target_users, seed_vector, planner_config, user_vectors,
+                target_matrix=target_matrix, target_coords=target_coords
+            )
+        )
+
         return PropagationResponse(
             optimal_path=optimal_path,
-            model_used="fallback"
+            model_used=model_used
         )
-        
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"传播路径优化失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -519,16 +1656,8 @@ async def predict_potential(request: Dict[str, Any]):
         star_seed = request.get("star_seed", {})
         content = star_seed.get("content", "")
         
-        # 基于内容分析预测潜力
-        analysis_request = ContentAnalysisRequest(content=content)
-        analysis = await analyze_content(analysis_request)
-        
-        # 计算潜力得分
-        potential_score = min(100, max(0,
-            analysis.engagement_potential * 0.6 +
-            analysis.readability * 0.3 +
-            len(analysis.topics) * 5
-        ))
+        # 基于内容分析预测潜力（与 analyze-content 共享同一内容的分析结果）
+        potential_score = (await _analyze_cached(content))["potential_score"]
         
         return {
             "potential_score": potential_score,
@@ -539,6 +1668,331 @@ async def predict_potential(request: Dict[str, Any]):
         logger.error(f"传播潜力预测失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# 向量集合写入
+async def _upsert_vector(collection_name: str, item_id: str, vector: List[float],
+                         metadata: Dict[str, Any]) -> None:
+    if not vector:
+        raise HTTPException(status_code=400, detail="vector 不能为空")
+    collection = _get_collection(collection_name)
+    if collection is None:
+        raise HTTPException(status_code=503, detail=f"{collection_name} 集合未初始化")
+    try:
+        await asyncio.get_event_loop().run_in_executor(
+            None, lambda: collection.upsert([item_id], [vector], [metadata])
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await _maybe_train_index(collection)
+
+def _vector_metadata(id_field: str, item_id: str) -> Dict[str, Any]:
+    return {id_field: item_id, "created_at": datetime.now(timezone.utc).isoformat()}
+
+@app.post("/api/vector/user-interests")
+async def add_user_interest_vector(user_id: str, vector: List[float]):
+    """添加（或更新）用户兴趣向量"""
+    try:
+        await _upsert_vector("user_interests", user_id, vector, _vector_metadata("user_id", user_id))
+        return {"status": "success", "message": "用户兴趣向量添加成功"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"添加用户兴趣向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/vector/content-similarity")
+async def add_content_vector(content_id: str, vector: List[float]):
+    """添加（或更新）内容向量"""
+    try:
+        await _upsert_vector("content_similarity", content_id, vector, _vector_metadata("content_id", content_id))
+        return {"status": "success", "message": "内容向量添加成功"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"添加内容向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/vector/cluster-compatibility")
+async def add_cluster_vector(cluster_id: str, vector: List[float]):
+    """添加（或更新）星团向量"""
+    try:
+        await _upsert_vector("cluster_compatibility", cluster_id, vector, _vector_metadata("cluster_id", cluster_id))
+        return {"status": "success", "message": "星团向量添加成功"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"添加星团向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _parse_vector_batch(body: bytes, content_type: str, dtype_header: Optional[str] = None) -> tuple:
+    """解析批量写入请求体，返回 (ids, float32 矩阵, metadatas)。
+
+    JSON：{"items": [{"id", "vector", "metadata"}]}、列式 {"ids", "vectors", "metadatas"}
+    或 {"ids", "vectors_b64", "vector_dtype", "metadatas"}；
+    二进制（application/octet-stream）：uint32 头长度 + JSON 头 {"ids", "metadatas", "vector_dtype"}
+    + 按 vector_codec 编码的矩阵（float32 / float16 / int8）。
+    """
+    if vector_codec.BINARY_MEDIA_TYPE in content_type:
+        (header_len,) = struct.unpack_from("<I", body)
+        header = json.loads(body[4:4 + header_len])
+        ids = header["ids"]
+        metadatas = header.get("metadatas")
+        if not ids:
+            raise ValueError("ids 不能为空")
+        matrix = vector_codec.decode_vectors(
+            memoryview(body)[4 + header_len:],
+            header.get("vector_dtype") or dtype_header,
+            count=len(ids)
+        )
+    else:
+        data = json.loads(body)
+        if "vectors_b64" in data:
+            ids, metadatas = data["ids"], data.get("metadatas")
+            if not ids:
+                raise ValueError("ids 不能为空")
+            matrix = vector_codec.decode_b64(
+                data["vectors_b64"], data.get("vector_dtype") or dtype_header, count=len(ids)
+            )
+        elif "items" in data:
+            items = data["items"]
+            ids = [item["id"] for item in items]
+            vectors = [item["vector"] for item in items]
+            metadatas = [item.get("metadata") or {} for item in items]
+        else:
+            ids, vectors, metadatas = data["ids"], data["vectors"], data.get("metadatas")
+        if "vectors_b64" not in data:
+            # 一次性转换，维度不一致的行会在这里直接报错
+            matrix = np.asarray(vectors, dtype=np.float32)
+            if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+                raise ValueError("vectors 必须是与 ids 等长、维度一致的二维数组")
+    if matrix.shape[0] and matrix.shape[1] == 0:
+        raise ValueError("向量不能为空")
+    if metadatas is not None:
+        if not isinstance(metadatas, list) or len(metadatas) != len(ids):
+            raise ValueError("metadatas 必须是与 ids 等长的数组")
+        if any(metadata is not None and not isinstance(metadata, dict) for metadata in metadatas):
+            raise ValueError("metadata 必须是 JSON 对象或 null")
+    return [str(item_id) for item_id in ids], matrix, metadatas
+
+async def _batch_upsert(collection_name: str, id_field: str, http_request: Request) -> Dict[str, Any]:
+    collection = _get_collection(collection_name)
+    if collection is None:
+        raise HTTPException(status_code=503, detail=f"{collection_name} 集合未初始化")
+    try:
+        ids, matrix, metadatas = _parse_vector_batch(
+            await http_request.body(),
+            http_request.headers.get("content-type", ""),
+            http_request.headers.get(vector_codec.DTYPE_HEADER)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"批量请求解析失败: {e}")
+    if len(ids) > VECTOR_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"单次最多写入 {VECTOR_BATCH_MAX_ROWS} 条向量")
+    if not ids:
+        return {"status": "success", "upserted": 0}
+
+    created_at = datetime.now(timezone.utc).isoformat()
+    metadatas = [
+        {id_field: item_id, "created_at": created_at, **(metadata or {})}
+        for item_id, metadata in zip(ids, metadatas or [None] * len(ids))
+    ]
+    try:
+        upserted = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: collection.upsert(ids, matrix, metadatas)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await _maybe_train_index(collection)
+    return {"status": "success", "upserted": upserted, "dimension": int(matrix.shape[1])}
+
+@app.post("/api/vector/user-interests/batch")
+async def batch_upsert_user_interest_vectors(http_request: Request):
+    """批量写入（或更新）用户兴趣向量"""
+    try:
+        return await _batch_upsert("user_interests", "user_id", http_request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量写入用户兴趣向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/vector/content-similarity/batch")
+async def batch_upsert_content_vectors(http_request: Request):
+    """批量写入（或更新）内容向量"""
+    try:
+        return await _batch_upsert("content_similarity", "content_id", http_request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量写入内容向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/vector/cluster-compatibility/batch")
+async def batch_upsert_cluster_vectors(http_request: Request):
+    """批量写入（或更新）星团向量"""
+    try:
+        return await _batch_upsert("cluster_compatibility", "cluster_id", http_request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量写入星团向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/vector/{collection_name}/{item_id}")
+async def delete_vector(collection_name: str, item_id: str):
+    """删除向量（常驻索引打墓碑，达到阈值后自动压缩）"""
+    collection = _get_collection(collection_name.replace("-", "_"))
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"未知集合: {collection_name}")
+    try:
+        deleted = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: collection.delete([item_id])
+        )
+        return {"status": "success", "deleted": deleted}
+    except Exception as e:
+        logger.error(f"删除向量失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 后台回填任务
+@app.post("/api/jobs/embedding")
+async def submit_embedding_job(request: EmbeddingJobRequest):
+    """提交回填任务：服务端按批编码并写入向量集合，可断点续跑"""
+    if request.collection not in VECTOR_ID_FIELDS:
+        raise HTTPException(status_code=400, detail=f"未知集合: {request.collection}")
+    if len(request.ids) > EMBEDDING_JOBS_CONFIG["max_items"]:
+        raise HTTPException(status_code=413, detail=f"单个任务最多 {EMBEDDING_JOBS_CONFIG['max_items']} 条")
+    try:
+        return await embedding_jobs.submit(
+            request.collection,
+            request.ids,
+            request.texts,
+            metadatas=request.metadatas,
+            batch_size=request.batch_size,
+            max_rows_per_second=request.max_rows_per_second
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"提交回填任务失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/jobs")
+async def list_embedding_jobs(status: Optional[str] = None, limit: int = 50):
+    """列出回填任务（最新的在前）"""
+    return {"summary": embedding_jobs.summary(), "jobs": embedding_jobs.list_jobs(status, limit)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_embedding_job(job_id: str):
+    """任务进度：已完成条数、rows/s 与预计剩余时间"""
+    try:
+        return embedding_jobs.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+
+@app.post("/api/jobs/{job_id}/pause")
+async def pause_embedding_job(job_id: str):
+    """暂停任务（当前批次完成后停止，保留检查点）"""
+    try:
+        return await embedding_jobs.pause(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+
+@app.post("/api/jobs/{job_id}/resume")
+async def resume_embedding_job(job_id: str):
+    """从检查点继续已暂停或失败的任务"""
+    try:
+        return await embedding_jobs.resume(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_embedding_job(job_id: str):
+    """取消任务并删除其待处理文本"""
+    try:
+        return await embedding_jobs.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+
+# 服务端用户池
+@app.post("/api/pools")
+async def register_pool(request: PoolRegisterRequest):
+    """注册（或替换）用户池，之后的相似度查询只需传 pool_id"""
+    if request.pool_id and request.pool_id.startswith(PB_POOL_PREFIX):
+        raise HTTPException(status_code=400, detail=f"{PB_POOL_PREFIX} 前缀保留给 PocketBase 用户池")
+    loop = asyncio.get_event_loop()
+    try:
+        if request.vectors_b64:
+            if not request.ids:
+                raise ValueError("vectors_b64 需要同时提供 ids")
+            vectors = vector_codec.decode_b64(request.vectors_b64, request.vector_dtype, count=len(request.ids))
+            ids, metadata = request.ids, request.metadata
+        else:
+            ids, vectors, metadata = await loop.run_in_executor(None, pool_from_users, request.users)
+        pool = await loop.run_in_executor(
+            None, lambda: user_pools.register(ids, vectors, metadata, pool_id=request.pool_id)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return pool.info()
+
+@app.get("/api/pools")
+async def list_pools():
+    return {"pools": user_pools.list(), **user_pools.status()}
+
+@app.get("/api/pools/{pool_id:path}")
+async def get_pool(pool_id: str):
+    return (await _resolve_pool(pool_id)).info()
+
+@app.delete("/api/pools/{pool_id:path}")
+async def delete_pool(pool_id: str):
+    if not user_pools.delete(pool_id):
+        raise HTTPException(status_code=404, detail=f"用户池不存在: {pool_id}")
+    return {"deleted": pool_id}
+
+# 地理索引增量更新与查询
+@app.post("/api/geo/users")
+async def update_geo_users(request: GeoUsersUpdate):
+    """写入或移动用户位置（location_data 为空时移除）"""
+    changed = 0
+    for user in request.users:
+        if user.get("id"):
+            changed += geo_index.upsert(str(user["id"]), user.get("location_data", user.get("location")))
+    return {"changed": changed, "users": len(geo_index)}
+
+@app.delete("/api/geo/users/{user_id}")
+async def delete_geo_user(user_id: str):
+    return {"removed": geo_index.remove(user_id), "users": len(geo_index)}
+
+@app.post("/api/geo/reload")
+async def reload_geo_index():
+    """立即从 PocketBase 全量重建地理索引"""
+    try:
+        users = await _reload_geo_index()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"地理索引加载失败: {e}")
+    return {"status": "success", "users": users}
+
+@app.get("/api/geo/nearby")
+async def geo_nearby(lat: float, lng: float, level: Optional[str] = None,
+                     radius_km: Optional[float] = None, limit: int = 100):
+    """层级（或指定半径）内的用户，按距离升序"""
+    if parse_location({"lat": lat, "lng": lng}) is None:
+        raise HTTPException(status_code=400, detail="lat / lng 超出范围")
+    if radius_km is None:
+        if level not in geo_index.level_radii_km:
+            raise HTTPException(status_code=400, detail="需要 level 或 radius_km")
+        radius_km = geo_index.level_radii_km[level]
+    elif not 0 < radius_km <= GEO_INDEX_CONFIG["max_radius_km"]:
+        raise HTTPException(
+            status_code=400, detail=f"radius_km 须在 (0, {GEO_INDEX_CONFIG['max_radius_km']}] 公里之间"
+        )
+    users = await asyncio.get_event_loop().run_in_executor(
+        None, lambda: geo_index.query_radius(lat, lng, radius_km, limit=max(1, limit))
+    )
+    return {
+        "radius_km": radius_km,
+        "users": [{"user_id": user_id, "distance_km": distance} for user_id, distance in users]
+    }
+
 # 模型状态查询
 @app.get("/api/ai/model-status")
 async def get_model_status():
@@ -546,16 +2000,45 @@ async def get_model_status():
     return {
         "model_status": model_status,
         "fallback_config": FALLBACK_CONFIG,
+        "embedding_backend_config": EMBEDDING_BACKEND_CONFIG,
+        "startup_config": STARTUP_CONFIG,
+        "startup_timings": startup_timings,
+        "batching": embedding_batcher.status(),
+        "geo_index": geo_index.status(),
+        "user_pools": user_pools.status(),
+        "inference_pool": inference_pool.status() if inference_pool else {"enabled": False, **INFERENCE_POOL_CONFIG},
+        "embedding_cache": embedding_cache.status(),
+        "lexicons": lexicon_store.status(),
+        "analysis_memo": analysis_memo.status(),
+        "analysis_pool": analysis_pool.status(),
+        "embedding_jobs": embedding_jobs.summary(),
+        "vector_index_config": VECTOR_INDEX_CONFIG,
+        "vector_store_config": VECTOR_STORE_CONFIG,
+        "vector_collections": {
+            name: _get_collection(name).status() if _get_collection(name) else None
+            for name in VECTOR_COLLECTION_NAMES
+        },
         "timestamp": time.time()
     }
 
+# 热重载关键词词典
+@app.post("/api/ai/reload-lexicons")
+async def reload_lexicons():
+    """重新读取 LEXICON_PATH 并重建自动机（构建完成前继续使用旧词典）"""
+    try:
+        status = await asyncio.get_event_loop().run_in_executor(None, lexicon_store.reload)
+        # 旧词典的分析结果不再有效
+        analysis_memo.clear()
+        return {"status": "success", "lexicons": status}
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"词典加载失败: {e}")
+
 # 手动重新加载模型
 @app.post("/api/ai/reload-models")
 async def reload_models(background_tasks: BackgroundTasks):
     """手动重新加载模型"""
     async def reload_task():
-        global embedding_model, chroma_client
-        global user_interests_collection, content_similarity_collection, cluster_compatibility_collection
+        global embedding_model, chroma_client, inference_pool
         
         logger.info("开始重新加载模型...")
         
@@ -564,9 +2047,22 @@ async def reload_models(background_tasks: BackgroundTasks):
         model_status["embedding_model"]["loaded"] = False
         model_status["embedding_model"]["error"] = None
         
+        old_cache_key = _cache_model_key()
         new_model = await AsyncModelLoader.load_embedding_model(FALLBACK_CONFIG["model_load_timeout"])
         if new_model:
             embedding_model = new_model
+            # 推理进程持有的是旧模型：先启动新工作池，再替换并关闭旧池
+            # （close 会等待旧池中进行中的调用完成，排队中的调用收到 PoolClosedError 后改用新池）
+            old_pool = inference_pool
+            if old_pool:
+                inference_pool = await asyncio.get_event_loop().run_in_executor(
+                    None, _start_inference_pool, new_model
+                )
+                await asyncio.get_event_loop().run_in_executor(None, old_pool.close)
+            # 旧模型产生的向量不再可信（删除磁盘层文件，放到线程池执行）
+            await asyncio.get_event_loop().run_in_executor(None, embedding_cache.invalidate_model, old_cache_key)
+            if CACHE_CONFIG["enabled"]:
+                await asyncio.get_event_loop().run_in_executor(None, embedding_cache.open_disk_tier, _cache_model_key())
             model_status["embedding_model"]["loaded"] = True
             model_status["embedding_model"]["load_time"] = time.time()
             logger.info("✅ 嵌入模型重新加载成功")
@@ -576,30 +2072,24 @@ async def reload_models(background_tasks: BackgroundTasks):
         
         model_status["embedding_model"]["loading"] = False
         
-        # 重新初始化 ChromaDB
-        model_status["chromadb"]["initializing"] = True
-        model_status["chromadb"]["initialized"] = False
-        model_status["chromadb"]["error"] = None
-        
-        new_client = await AsyncModelLoader.initialize_chromadb(15)
-        if new_client:
-            chroma_client = new_client
-            model_status["chromadb"]["initialized"] = True
-            model_status["chromadb"]["init_time"] = time.time()
+        # 常驻索引保存着已写入的数据，只有 chroma 后端需要重新初始化
+        if VECTOR_INDEX_CONFIG["backend"] == "chroma":
+            model_status["chromadb"]["initializing"] = True
+            model_status["chromadb"]["initialized"] = False
+            model_status["chromadb"]["error"] = None
             
-            # 重新初始化集合
-            try:
-                user_interests_collection = chroma_client.get_or_create_collection("user_interests")
-                content_similarity_collection = chroma_client.get_or_create_collection("content_similarity")
-                cluster_compatibility_collection = chroma_client.get_or_create_collection("cluster_compatibility")
+            new_client = await AsyncModelLoader.initialize_chromadb(15)
+            if new_client:
+                chroma_client = new_client
+                model_status["chromadb"]["initialized"] = True
+                model_status["chromadb"]["init_time"] = time.time()
+                _init_vector_collections()
                 logger.info("✅ ChromaDB 重新初始化成功")
-            except Exception as e:
-                logger.error(f"ChromaDB 集合重新初始化失败: {e}")
-        else:
-            model_status["chromadb"]["error"] = "初始化超时"
-            logger.warning("⚠️ ChromaDB 重新初始化失败")
-        
-        model_status["chromadb"]["initializing"] = False
+            else:
+                model_status["chromadb"]["error"] = "初始化超时"
+                logger.warning("⚠️ ChromaDB 重新初始化失败")
+            
+            model_status["chromadb"]["initializing"] = False
         logger.info("模型重新加载完成")
     
     background_tasks.add_task(reload_task)
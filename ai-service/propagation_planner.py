@@ -0,0 +1,464 @@
+# FluLink v4.0 AI 服务 - 传播路径规划（影响力最大化）
+# 1. 由兴趣向量（LSH 排序窗口）与地理位置（网格 Morton 码排序窗口）生成候选边，构建稀疏加权用户图
+# 2. 独立级联模型下批量采样反向可达集（RR-set），首推用户按与毒株的共鸣度决定是否接受
+# 3. CELF 惰性贪心求最大覆盖，得到首推顺序与预计触达人数
+# 全部为 numpy 批量运算，数万目标用户可在一秒内完成
+#
+# 基准测试: python propagation_planner.py --users 5000 20000 50000 [--budget-ms 1000]
+
+import argparse
+import heapq
+import math
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from geo_index import haversine_km, parse_location
+from vector_search import normalize_rows, stack_pool
+
+DEFAULT_PLANNER_CONFIG = {
+    "num_seeds": 10,              # 规划的首推用户数
+    "first_targets": 5,           # first_targets 返回的用户数
+    "semantic_weight": 0.4,       # 边权与共鸣度中语义相似度的占比
+    "geographic_weight": 0.6,     # 地理邻近度的占比
+    "geo_scale_km": 2.0,          # 地理邻近度 exp(-距离/geo_scale_km)
+    "geo_radius_km": 5.0,         # 超过该距离不建地理边
+    "min_similarity": 0.3,        # 低于该相似度不建语义边
+    "window": 16,                 # 排序窗口大小（决定每个用户的候选邻居数）
+    "max_edge_probability": 0.2,  # 边激活概率上限
+    "max_in_probability": 0.6,    # 单个用户全部入边激活概率之和的上限
+    "min_edge_probability": 0.005,
+    "rr_sets": 0,                 # 固定的 RR-set 数量，0 时按误差目标分轮采样
+    "rr_error": 0.1,              # 预计触达人数的目标相对误差（95% 置信）
+    "min_rr_sets": 2000,          # 首轮采样数
+    "max_rr_sets": 20000,
+    "max_rr_nodes": 5000000,      # 全部 RR-set 的成员总数上限（控制内存）
+    "interval_minutes": 10        # 相邻首推之间的间隔
+}
+
+
+def _user_location(user: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    return parse_location(user.get("location")) or parse_location(user.get("location_data"))
+
+
+def _interleave_bits(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """16 位网格坐标交织为 Morton 码，使排序后相邻的网格在空间上也相邻"""
+    def spread(v):
+        v = v.astype(np.uint32) & 0xFFFF
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        return (v | (v << 1)) & 0x55555555
+    return spread(x) | (spread(y) << 1)
+
+
+def _argsort_ids(values: np.ndarray, n: int) -> np.ndarray:
+    """对 [0, n) 内的整数做稳定排序：每 16 位一轮基数排序（numpy 对 16 位整数的稳定排序即基数排序），
+    比通用的比较排序快数倍"""
+    order = np.argsort((values & 0xFFFF).astype(np.uint16), kind="stable")
+    shift = 16
+    while (n - 1) >> shift:
+        order = order[np.argsort(((values[order] >> shift) & 0xFFFF).astype(np.uint16), kind="stable")]
+        shift += 16
+    return order
+
+
+def _window_pairs(order: np.ndarray, window: int,
+                  vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按排序后的顺序切成大小为 window 的窗口（对齐与错开半个窗口各切一次），返回窗口内全部无序对 (i < j)
+    及其余弦相似度。错开的窗口只取跨越对齐窗口边界的对，其余的对已在对齐窗口中；
+    向量按排序只取一次，各窗口都是它的视图，相似度按窗口批量矩阵乘计算"""
+    ordered = vectors[order]
+    total = len(order)
+
+    def all_pairs(start, stop):
+        a, b = np.triu_indices(stop - start, k=1)
+        block = ordered[start:stop]
+        return order[start:stop][a], order[start:stop][b], (block @ block.T)[a, b]
+
+    if total <= window:
+        parts = [all_pairs(0, total)]
+    else:
+        stop = (total // window) * window
+        blocks = order[:stop].reshape(-1, window)
+        stacked = ordered[:stop].reshape(len(blocks), window, ordered.shape[1])
+        sims = np.matmul(stacked, stacked.transpose(0, 2, 1))
+        iu, ju = np.triu_indices(window, k=1)
+        parts = [(blocks[:, iu].ravel(), blocks[:, ju].ravel(), sims[:, iu, ju].ravel()), all_pairs(stop, total)]
+
+        offset = window // 2
+        split = window - offset          # 错开的窗口在第 split 个位置跨过对齐窗口的边界
+        stop = offset + ((total - offset) // window) * window
+        blocks = order[offset:stop].reshape(-1, window)
+        stacked = ordered[offset:stop].reshape(len(blocks), window, ordered.shape[1])
+        sims = np.matmul(stacked[:, :split], stacked[:, split:].transpose(0, 2, 1))
+        left = np.broadcast_to(blocks[:, :split, None], sims.shape)
+        right = np.broadcast_to(blocks[:, None, split:], sims.shape)
+        parts += [(left.ravel(), right.ravel(), sims.ravel()), all_pairs(stop, total)]
+    i = np.concatenate([p[0] for p in parts]).astype(np.int64)
+    j = np.concatenate([p[1] for p in parts]).astype(np.int64)
+    return np.minimum(i, j), np.maximum(i, j), np.concatenate([p[2] for p in parts])
+
+
+def build_graph(vectors: np.ndarray, has_vector: np.ndarray, coords: np.ndarray, has_location: np.ndarray,
+                config: Dict[str, Any], rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """返回按 dst 分组的有向边 (src, dst, 激活概率)，每条无向候选边拆成两个方向"""
+    n = vectors.shape[0]
+    window = max(2, int(config["window"]))
+    candidates = []
+
+    # 语义候选：随机超平面签名排序后相邻的用户方向相近
+    semantic_rows = np.flatnonzero(has_vector)
+    if len(semantic_rows) > 1:
+        bits = int(min(30, max(1, math.ceil(math.log2(max(2, len(semantic_rows) / window))))))
+        planes = rng.standard_normal((vectors.shape[1], bits)).astype(np.float32)
+        signs = (vectors[semantic_rows] @ planes) > 0
+        # 把签名视为格雷码并按其序号排序，排序后相邻的签名只差一位
+        codes = np.zeros(len(semantic_rows), dtype=np.int64)
+        for b in range(bits):
+            codes = (codes << 1) | signs[:, b]
+        rank = codes.copy()
+        shift = 1
+        while shift < bits:
+            rank ^= rank >> shift
+            shift <<= 1
+        order = semantic_rows[np.argsort(rank, kind="stable")]
+        candidates.append(_window_pairs(order, window, vectors))
+
+    # 地理候选：按网格 Morton 码排序
+    geo_rows = np.flatnonzero(has_location)
+    if len(geo_rows) > 1:
+        cell_deg = max(config["geo_radius_km"], 1e-3) / 111.0
+        gx = np.floor((coords[geo_rows, 1] + 180.0) / cell_deg)
+        gy = np.floor((coords[geo_rows, 0] + 90.0) / cell_deg)
+        gx -= gx.min()
+        gy -= gy.min()
+        order = geo_rows[np.argsort(_interleave_bits(gx, gy), kind="stable")]
+        candidates.append(_window_pairs(order, window, vectors))
+
+    if not candidates:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    i = np.concatenate([c[0] for c in candidates])
+    j = np.concatenate([c[1] for c in candidates])
+    similarity = np.concatenate([c[2] for c in candidates])
+    # 两种错位与两种排序的窗口会产生重复的对：按 (i, j) 排序后去掉相邻的重复
+    order = _argsort_ids(j, n)
+    order = order[_argsort_ids(i[order], n)]
+    i, j, similarity = i[order], j[order], similarity[order]
+    first = np.ones(len(i), dtype=bool)
+    first[1:] = (i[1:] != i[:-1]) | (j[1:] != j[:-1])
+    i, j, similarity = i[first], j[first], similarity[first]
+
+    similarity = np.where(similarity >= config["min_similarity"], similarity, 0.0)
+    both_loc = has_location[i] & has_location[j]
+    distance = np.where(both_loc, haversine_km(coords[i, 0], coords[i, 1], coords[j, 0], coords[j, 1]), np.inf)
+    proximity = np.where(distance <= config["geo_radius_km"], np.exp(-distance / config["geo_scale_km"]), 0.0)
+
+    score = np.clip(config["semantic_weight"] * similarity + config["geographic_weight"] * proximity, 0.0, 1.0)
+    keep = score > 0
+    src = np.concatenate([i[keep], j[keep]])
+    dst = np.concatenate([j[keep], i[keep]])
+    score = np.concatenate([score[keep], score[keep]])
+    # 加权级联：每个用户所有入边概率之和不超过 max_in_probability，保证级联为亚临界，RR-set 规模有界
+    in_total = np.bincount(dst, weights=score, minlength=n)
+    probability = np.minimum(
+        config["max_edge_probability"],
+        config["max_in_probability"] * score / np.maximum(in_total[dst], 1.0)
+    )
+    keep = np.flatnonzero(probability >= config["min_edge_probability"])
+    # 按 dst 分组返回，采样时取入边的稳定排序遇到已有序的输入几乎不耗时
+    keep = keep[_argsort_ids(dst[keep], n)]
+    return src[keep], dst[keep], probability[keep]
+
+
+def sample_rr_sets(n: int, src: np.ndarray, dst: np.ndarray, probability: np.ndarray,
+                   accept: np.ndarray, theta: int, rng: np.random.Generator,
+                   max_nodes: int = 5000000) -> Tuple[np.ndarray, np.ndarray]:
+    """批量采样 theta 个 RR-set，返回 (RR-set 编号, 可作为首推覆盖它的用户)。
+
+    从随机根节点沿入边反向 BFS（每条边按激活概率保留）；到达的用户还需以 accept 概率
+    接受首推才计入，等价于每个用户前面挂一个以 accept 概率激活它的虚拟推送节点。
+    """
+    order = np.argsort(dst, kind="stable")
+    in_src, in_prob = src[order], probability[order]
+    in_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(dst, minlength=n), out=in_ptr[1:])
+
+    roots = rng.integers(0, n, size=theta)
+    visited = np.arange(theta, dtype=np.int64) * n + roots
+    frontier = visited
+    while frontier.size:
+        f_rr, f_node = frontier // n, frontier % n
+        starts = in_ptr[f_node]
+        counts = in_ptr[f_node + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            break
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        edges = offsets + np.arange(total)
+        live = rng.random(total) < in_prob[edges]
+        reached = np.unique(np.repeat(f_rr, counts)[live] * n + in_src[edges[live]])
+        frontier = reached[~np.isin(reached, visited, assume_unique=True)]
+        visited = np.concatenate([visited, frontier])
+        if visited.size >= max_nodes:
+            break
+
+    rr, node = visited // n, visited % n
+    accepted = rng.random(len(node)) < accept[node]
+    return rr[accepted], node[accepted]
+
+
+def celf_max_coverage(n: int, rr: np.ndarray, node: np.ndarray, theta: int, k: int) -> Tuple[List[int], List[int]]:
+    """CELF 惰性贪心：边际覆盖数只在堆顶时重新计算，返回 (首推用户, 各自的边际覆盖数)"""
+    order = np.argsort(node, kind="stable")
+    rr_by_node = rr[order]
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(node, minlength=n), out=ptr[1:])
+    covered = np.zeros(theta, dtype=bool)
+    heap = [(-int(ptr[v + 1] - ptr[v]), int(v), 0) for v in np.flatnonzero(np.diff(ptr))]
+    heapq.heapify(heap)
+    seeds, gains = [], []
+    while heap and len(seeds) < k:
+        neg_gain, v, round_no = heapq.heappop(heap)
+        if round_no == len(seeds):
+            if neg_gain == 0:
+                break
+            seeds.append(v)
+            gains.append(-neg_gain)
+            covered[rr_by_node[ptr[v]:ptr[v + 1]]] = True
+        else:
+            gain = int((~covered[rr_by_node[ptr[v]:ptr[v + 1]]]).sum())
+            heapq.heappush(heap, (-gain, v, len(seeds)))
+    return seeds, gains
+
+
+def _user_features(target_users: List[Dict[str, Any]], dimension: int,
+                   user_vectors: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """逐个用户取兴趣向量（维度不符视为缺失），缺失时取 user_vectors 中按 id 提供的向量"""
+    n = len(target_users)
+    vectors = np.zeros((n, max(dimension, 1)), dtype=np.float32)
+    has_vector = np.zeros(n, dtype=bool)
+    if dimension:
+        positions, matrix = stack_pool(target_users, dimension)
+        vectors[positions] = matrix
+        has_vector[positions] = True
+        for row, user in enumerate(target_users):
+            stored = user_vectors.get(user.get("id"))
+            if not has_vector[row] and stored is not None and len(stored) == dimension:
+                vectors[row] = stored
+                has_vector[row] = True
+    return vectors, has_vector
+
+
+def _user_coords(target_users: List[Dict[str, Any]]) -> np.ndarray:
+    """逐个用户解析位置，返回 (n, 2) 的 [lat, lng]，无位置的行为 NaN"""
+    coords = np.full((len(target_users), 2), np.nan)
+    for row, user in enumerate(target_users):
+        location = _user_location(user)
+        if location:
+            coords[row] = location
+    return coords
+
+
+def _relative_error(covered: int, theta: int) -> float:
+    """覆盖率 covered / theta 估计的 95% 相对误差（正态近似）"""
+    if covered <= 0 or theta <= 0:
+        return math.inf
+    fraction = covered / theta
+    return 1.96 * math.sqrt(fraction * (1 - fraction) / theta) / fraction
+
+
+def _sample_and_select(n: int, src: np.ndarray, dst: np.ndarray, probability: np.ndarray,
+                       accept: np.ndarray, config: Dict[str, Any],
+                       rng: np.random.Generator) -> Tuple[List[int], List[int], int]:
+    """按误差目标分轮采样 RR-set：先采 min_rr_sets 个并选出首推用户，覆盖率估计的相对误差仍高于
+    rr_error 时，按当前覆盖率补足达到目标所需的数量（每轮至少翻倍）后重选，直到 max_rr_sets 或
+    max_rr_nodes 用尽。所需数量只取决于覆盖率与误差目标，与用户数无关。返回 (首推用户, 边际覆盖数, RR-set 数)"""
+    num_seeds = int(config["num_seeds"])
+    max_sets = max(1, int(config["max_rr_sets"]))
+    max_nodes = int(config["max_rr_nodes"])
+    fixed = int(config["rr_sets"])
+    theta = fixed or min(max_sets, max(1, int(config["min_rr_sets"])))
+    rr, node = sample_rr_sets(n, src, dst, probability, accept, theta, rng, max_nodes)
+    seeds, gains = celf_max_coverage(n, rr, node, theta, num_seeds)
+    target = float(config["rr_error"])
+    while not fixed and theta < max_sets and len(node) < max_nodes:
+        covered = sum(gains)
+        if _relative_error(covered, theta) <= target:
+            break
+        fraction = max(covered, 1) / theta
+        needed = math.ceil((1.96 / target) ** 2 * (1 - fraction) / fraction)
+        extra = min(max_sets, max(2 * theta, needed)) - theta
+        more_rr, more_node = sample_rr_sets(n, src, dst, probability, accept, extra, rng, max_nodes - len(node))
+        rr = np.concatenate([rr, more_rr + theta])
+        node = np.concatenate([node, more_node])
+        theta += extra
+        seeds, gains = celf_max_coverage(n, rr, node, theta, num_seeds)
+    return seeds, gains, theta
+
+
+def plan_propagation(star_seed: Dict[str, Any], target_users: List[Dict[str, Any]],
+                     seed_vector: Optional[np.ndarray] = None,
+                     config: Optional[Dict[str, Any]] = None,
+                     user_vectors: Optional[Dict[str, np.ndarray]] = None,
+                     target_matrix: Optional[np.ndarray] = None,
+                     target_coords: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """返回与 optimize-propagation 响应 optimal_path 相同结构的规划结果（附带 planner 统计）。
+
+    user_vectors 按用户 id 提供兴趣向量（如取自向量库），用于请求中未携带 interest_vector 的用户。
+    target_matrix / target_coords 与 target_users 按行对应，分别为兴趣向量矩阵（全零行视为缺失）
+    与 [lat, lng] 坐标（NaN 视为缺失）；给出时不再逐个用户解析 JSON，服务端用户池与 base64 矩阵走这条路径。
+    target_matrix 须已按行 L2 归一化（服务端用户池的矩阵即如此）。
+    """
+    started = time.perf_counter()
+    config = {**DEFAULT_PLANNER_CONFIG, **(config or {})}
+    n = len(target_users)
+    seed_id = star_seed.get("id", "unknown")
+    # 同一毒株与同一批用户得到同一规划
+    rng = np.random.default_rng(zlib.crc32(f"{seed_id}:{n}".encode("utf-8")))
+
+    if seed_vector is None and isinstance(star_seed.get("content_vector"), list):
+        seed_vector = np.asarray(star_seed["content_vector"], dtype=np.float32)
+
+    # 用户特征：兴趣向量与坐标
+    if target_matrix is not None:
+        vectors = np.asarray(target_matrix, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != n:
+            raise ValueError("target_matrix 行数与目标用户数不一致")
+        if seed_vector is not None and vectors.shape[1] != seed_vector.shape[0]:
+            raise ValueError(f"目标用户向量维度 {vectors.shape[1]} 与毒株向量维度 {seed_vector.shape[0]} 不一致")
+        dimension = vectors.shape[1]
+        has_vector = np.ones(n, dtype=bool)
+    else:
+        user_vectors = user_vectors or {}
+        dimension = seed_vector.shape[0] if seed_vector is not None else next(
+            (len(u["interest_vector"]) for u in target_users
+             if isinstance(u.get("interest_vector"), list) and u["interest_vector"]),
+            next((len(v) for v in user_vectors.values()), 0)
+        )
+        vectors, has_vector = _user_features(target_users, dimension, user_vectors)
+        vectors = normalize_rows(vectors)
+    if target_coords is not None:
+        coords = np.asarray(target_coords, dtype=np.float64)
+        if coords.shape != (n, 2):
+            raise ValueError("target_coords 须为与目标用户按行对应的 (n, 2) 坐标")
+    else:
+        coords = _user_coords(target_users)
+    has_location = ~np.isnan(coords).any(axis=1)
+    coords = np.where(has_location[:, None], coords, 0.0)
+    has_vector &= vectors.any(axis=1)
+
+    # 首推接受概率：与毒株内容的语义相似度 + 与发布地点的邻近度
+    semantic = np.zeros(n)
+    if seed_vector is not None and dimension:
+        query = normalize_rows(np.asarray(seed_vector, dtype=np.float32).reshape(1, -1))[0]
+        semantic = np.where(has_vector, np.clip(vectors @ query, 0.0, 1.0), 0.0)
+    geographic = np.zeros(n)
+    origin = parse_location(star_seed.get("location"))
+    if origin:
+        distance = haversine_km(origin[0], origin[1], coords[:, 0], coords[:, 1])
+        geographic = np.where(has_location, np.exp(-distance / config["geo_scale_km"]), 0.0)
+    semantic_part = config["semantic_weight"] * semantic
+    geographic_part = config["geographic_weight"] * geographic
+    accept = np.clip(semantic_part + geographic_part, 0.0, 1.0)
+    if not accept.any():
+        # 没有任何向量或位置信息时视所有用户同等可能接受
+        accept = np.full(n, 0.5)
+
+    src, dst, probability = build_graph(vectors, has_vector, coords, has_location, config, rng)
+    if n:
+        seeds, gains, theta = _sample_and_select(n, src, dst, probability, accept, config, rng)
+    else:
+        seeds, gains, theta = [], [], 0
+
+    # 覆盖不再增长时按接受概率补足首推名单
+    if len(seeds) < min(n, int(config["num_seeds"])):
+        chosen = set(seeds)
+        for v in np.argsort(-accept, kind="stable"):
+            if len(seeds) >= min(n, int(config["num_seeds"])):
+                break
+            if int(v) not in chosen:
+                seeds.append(int(v))
+                gains.append(0)
+
+    covered_sets = sum(gains)
+    fraction = covered_sets / theta if n else 0.0
+    estimated_reach = int(round(n * fraction))
+    # 置信度：覆盖率估计的 95% 相对误差越小越高
+    relative_error = _relative_error(covered_sets, theta)
+    confidence = round(float(np.clip(1 - relative_error, 0.0, 0.99)), 3) if fraction > 0 else 0.0
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    sequence = []
+    for order_no, (v, gain) in enumerate(zip(seeds, gains)):
+        total_part = semantic_part[v] + geographic_part[v]
+        user = target_users[v]
+        sequence.append({
+            "user_id": user.get("id", f"user_{v}"),
+            "timestamp": (now + timedelta(minutes=order_no * config["interval_minutes"])).isoformat().replace("+00:00", "Z"),
+            "expected_resonance": round(float(accept[v]) * 100, 2),
+            "geographic_weight": round(float(geographic_part[v] / total_part), 4) if total_part > 0 else config["geographic_weight"],
+            "semantic_weight": round(float(semantic_part[v] / total_part), 4) if total_part > 0 else config["semantic_weight"],
+            "marginal_reach": round(n * gain / theta, 2) if n else 0.0
+        })
+
+    return {
+        "seed_id": seed_id,
+        "first_targets": [target_users[v] for v in seeds[:int(config["first_targets"])]],
+        "propagation_sequence": sequence,
+        "estimated_reach": estimated_reach,
+        "confidence": confidence,
+        "planner": {
+            "method": "rr_set_celf",
+            "users": n,
+            "edges": int(len(src)),
+            "rr_sets": theta,
+            "relative_error": round(relative_error, 4) if fraction > 0 else None,
+            "users_with_vectors": int(has_vector.sum()),
+            "users_with_location": int(has_location.sum()),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    }
+
+
+def synthetic_targets(n: int, dimension: int = 384, clusters: int = 20,
+                      seed: int = 0) -> Tuple[Dict[str, Any], List[Dict[str, Any]], np.ndarray, np.ndarray]:
+    """生成基准测试数据：兴趣向量按主题聚类、位置集中在一座城市内，返回 (毒株, 目标用户, 向量矩阵, 坐标)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    matrix = normalize_rows(centers[labels] + 0.5 * rng.standard_normal((n, dimension)).astype(np.float32))
+    coords = np.column_stack([31.2 + rng.normal(0, 0.05, n), 121.4 + rng.normal(0, 0.05, n)])
+    star_seed = {"id": "benchmark", "content_vector": centers[0].tolist(), "location": {"lat": 31.2, "lng": 121.4}}
+    return star_seed, [{"id": f"user_{i}"} for i in range(n)], matrix, coords
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传播路径规划基准测试（向量矩阵与坐标直接传入，不含 JSON 解析）")
+    parser.add_argument("--users", type=int, nargs="+", default=[5000, 20000, 50000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=3, help="每个规模运行的次数，取最快一次")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="任一规模超过该耗时时以非零状态退出")
+    args = parser.parse_args()
+
+    over_budget = False
+    for n in args.users:
+        star_seed, target_users, matrix, coords = synthetic_targets(n, args.dimension)
+        best = math.inf
+        for _ in range(max(1, args.repeat)):
+            started = time.perf_counter()
+            result = plan_propagation(star_seed, target_users, target_matrix=matrix, target_coords=coords)
+            best = min(best, (time.perf_counter() - started) * 1000)
+        planner = result["planner"]
+        over_budget |= best > args.budget_ms
+        print(f"users={n:>7} elapsed_ms={best:8.1f} edges={planner['edges']:>8} rr_sets={planner['rr_sets']:>6} "
+              f"estimated_reach={result['estimated_reach']} confidence={result['confidence']}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
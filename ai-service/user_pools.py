@@ -0,0 +1,230 @@
+# FluLink v4.0 AI 服务 - 服务端用户池
+# 客户端注册一次用户池（或按名称引用服务端配置的 pb:<名称> PocketBase 用户池），服务端保存为预归一化的 float32 矩阵并带版本号；
+# 之后的相似度查询只需传 pool_id 与种子向量。全部池按 LRU 淘汰，总内存不超过预算
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_search import iter_row_blocks, normalize_rows, stack_pool, top_k_cosine, top_k_cosine_batch
+
+logger = logging.getLogger(__name__)
+
+PB_POOL_PREFIX = "pb:"
+
+
+@dataclass
+class UserPool:
+    pool_id: str
+    version: int
+    ids: List[str]
+    matrix: np.ndarray                      # (n, d) float32，按行 L2 归一化
+    metadata: List[Dict[str, Any]]
+    source: str = "inline"                  # inline / pocketbase
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    queries: int = 0
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "pool_id": self.pool_id,
+            "version": self.version,
+            "size": len(self.ids),
+            "dimension": self.dimension,
+            "bytes": self.nbytes,
+            "source": self.source,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "queries": self.queries
+        }
+
+
+def pool_from_users(users: List[Dict[str, Any]], dimension: Optional[int] = None,
+                    field_name: str = "interest_vector") -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+    """从 JSON 用户列表取出 (ids, 向量矩阵, metadata)；维度不符或缺少向量的用户被跳过"""
+    if dimension is None:
+        dimension = next((len(u[field_name]) for u in users
+                          if isinstance(u.get(field_name), list) and u[field_name]), 0)
+    if not dimension:
+        raise ValueError("用户池中没有可用的向量")
+    positions, matrix = stack_pool(users, dimension, field_name)
+    ids = [str(users[i].get("id", f"user_{i}")) for i in positions]
+    metadata = [users[i].get("metadata") or {} for i in positions]
+    return ids, matrix, metadata
+
+
+class UserPoolRegistry:
+    """池注册表：查询在线程池中执行，注册/淘汰与查询之间用锁保护；池对象注册后只读，替换时整体换新"""
+
+    def __init__(self, max_bytes: int, pb_ttl_seconds: float = 300.0, pb_pools: Optional[Dict[str, str]] = None):
+        self.max_bytes = max_bytes
+        self.pb_ttl_seconds = pb_ttl_seconds
+        # 可引用的 PocketBase 用户池：名称 -> 过滤表达式，只能由服务端配置（加载时使用管理员凭据）
+        self.pb_pools = dict(pb_pools or {})
+        self._pools: "OrderedDict[str, UserPool]" = OrderedDict()
+        # 版本号全局递增：同一 pool_id 替换、删除后重建都会得到更大的版本号，无需为已删除的池保留记录
+        self._last_version = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[str, asyncio.Task] = {}
+        self.stats = {"registered": 0, "evictions": 0, "hits": 0, "misses": 0, "pb_loads": 0}
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(pool.nbytes for pool in self._pools.values())
+
+    def register(self, ids: Sequence[str], vectors: np.ndarray, metadata: Optional[List[Dict[str, Any]]] = None,
+                 pool_id: Optional[str] = None, source: str = "inline") -> UserPool:
+        """注册或替换一个池（每次注册得到新的、比之前都大的版本号）"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError("ids 与向量行数不一致")
+        if metadata is not None and len(metadata) != len(ids):
+            raise ValueError("metadata 与 ids 数量不一致")
+        if vectors.nbytes > self.max_bytes:
+            raise ValueError(f"用户池 {vectors.nbytes} 字节，超过内存预算 {self.max_bytes}")
+        pool_id = pool_id or uuid.uuid4().hex
+        matrix = normalize_rows(vectors)
+        with self._lock:
+            self._last_version += 1
+            pool = UserPool(pool_id, self._last_version, [str(i) for i in ids], matrix,
+                            metadata if metadata is not None else [{} for _ in ids], source)
+            self._pools.pop(pool_id, None)
+            self._pools[pool_id] = pool
+            self.stats["registered"] += 1
+            self._evict(keep=pool_id)
+        return pool
+
+    def _evict(self, keep: str):
+        used = self.used_bytes
+        while used > self.max_bytes:
+            victim = next((pid for pid in self._pools if pid != keep), None)
+            if victim is None:
+                break
+            used -= self._pools.pop(victim).nbytes
+            self.stats["evictions"] += 1
+            logger.info(f"用户池 {victim} 被 LRU 淘汰")
+
+    def get(self, pool_id: str) -> UserPool:
+        with self._lock:
+            pool = self._pools.get(pool_id)
+            if pool is None:
+                self.stats["misses"] += 1
+                raise KeyError(pool_id)
+            self._pools.move_to_end(pool_id)
+            pool.last_used = time.time()
+            self.stats["hits"] += 1
+            return pool
+
+    def delete(self, pool_id: str) -> bool:
+        with self._lock:
+            return self._pools.pop(pool_id, None) is not None
+
+    async def resolve(self, pool_id: str,
+                      pb_loader: Callable[[str], Awaitable[List[Dict[str, Any]]]]) -> UserPool:
+        """取池；pb:<名称> 池不存在或超过 pb_ttl_seconds 时调用 pb_loader(该名称配置的过滤条件) 重新加载，
+        并发请求共享一次加载；未配置的名称与不存在的池一样抛出 KeyError"""
+        if not pool_id.startswith(PB_POOL_PREFIX):
+            return self.get(pool_id)
+        filter_expr = self.pb_pools.get(pool_id[len(PB_POOL_PREFIX):])
+        if filter_expr is None:
+            raise KeyError(pool_id)
+        try:
+            pool = self.get(pool_id)
+            if time.time() - pool.created_at < self.pb_ttl_seconds:
+                return pool
+        except KeyError:
+            pass
+        task = self._loading.get(pool_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_pb(pool_id, filter_expr, pb_loader))
+            self._loading[pool_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(pool_id, None))
+        return await asyncio.shield(task)
+
+    async def _load_pb(self, pool_id: str, filter_expr: str, pb_loader) -> UserPool:
+        users = await pb_loader(filter_expr)
+        ids, matrix, metadata = await asyncio.get_running_loop().run_in_executor(None, pool_from_users, users)
+        self.stats["pb_loads"] += 1
+        return self.register(ids, matrix, metadata, pool_id=pool_id, source="pocketbase")
+
+    def query(self, pool: UserPool, seed: np.ndarray, k: int,
+              min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        """池已归一化，只需一次矩阵-向量乘"""
+        if seed.shape[0] != pool.dimension:
+            raise ValueError(f"种子向量维度 {seed.shape[0]} 与用户池维度 {pool.dimension} 不一致")
+        rows, scores = top_k_cosine(seed, pool.matrix, k, min_similarity, normalized=True)
+        pool.queries += 1
+        return [
+            {"id": pool.ids[row], "similarity": float(score), "metadata": pool.metadata[row]}
+            for row, score in zip(rows.tolist(), scores)
+        ]
+
+    def query_batch(self, pool: UserPool, queries: np.ndarray, k: int, min_similarity: Optional[float] = None,
+                    block_rows: int = 8192, query_block: int = 64) -> List[List[Dict[str, Any]]]:
+        """多查询：按行块做矩阵-矩阵乘，返回每个查询的匹配列表"""
+        if queries.ndim != 2 or queries.shape[1] != pool.dimension:
+            raise ValueError(f"查询矩阵维度 {queries.shape[-1]} 与用户池维度 {pool.dimension} 不一致")
+        results = top_k_cosine_batch(queries, iter_row_blocks(pool.matrix, block_rows), k, min_similarity,
+                                     normalized=True, query_block=query_block)
+        pool.queries += queries.shape[0]
+        return [
+            [
+                {"id": pool.ids[row], "similarity": float(score), "metadata": pool.metadata[row]}
+                for row, score in zip(rows.tolist(), scores)
+            ]
+            for rows, scores in results
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "count": len(self._pools),
+                "used_bytes": self.used_bytes,
+                "max_bytes": self.max_bytes,
+                "pb_ttl_seconds": self.pb_ttl_seconds,
+                "pb_pools": sorted(self.pb_pools),
+                **self.stats
+            }
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [pool.info() for pool in reversed(self._pools.values())]
+
+
+async def fetch_pocketbase_users(client, headers: Optional[Dict[str, str]] = None, filter_expr: str = "",
+                                 per_page: int = 500) -> List[Dict[str, Any]]:
+    """分页读取 PocketBase users（id、兴趣向量与少量元数据），filter_expr 为 PocketBase 过滤表达式"""
+    users: List[Dict[str, Any]] = []
+    page = 1
+    params = {"perPage": per_page, "fields": "id,username,user_level,interest_vector", "skipTotal": 1}
+    if filter_expr:
+        params["filter"] = filter_expr
+    while True:
+        response = await client.get("/api/collections/users/records", params={**params, "page": page},
+                                    headers=headers or {})
+        if response.status_code != 200:
+            raise RuntimeError(f"PocketBase 返回 {response.status_code}")
+        items = response.json().get("items", [])
+        users.extend({
+            "id": item["id"],
+            "interest_vector": item.get("interest_vector"),
+            "metadata": {"username": item.get("username"), "user_level": item.get("user_level")}
+        } for item in items if item.get("id"))
+        if len(items) < per_page:
+            return users
+        page += 1
@@ -0,0 +1,90 @@
+# FluLink v4.0 AI 服务 - 向量二进制编码
+# little-endian float32 / float16 / 标量量化 int8，解码使用 np.frombuffer 零拷贝
+
+import base64
+from typing import Optional
+
+import numpy as np
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+BINARY_MEDIA_TYPE = "application/octet-stream"
+DTYPE_HEADER = "X-Vector-Dtype"
+DIMENSION_HEADER = "X-Vector-Dimension"
+
+_FLOAT_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+def _int8_row_dtype(dimension: int) -> np.dtype:
+    """int8 每行布局：float32 缩放因子 + dimension 个 int8"""
+    return np.dtype([("scale", "<f4"), ("q", "i1", (dimension,))])
+
+
+def row_nbytes(dtype: str, dimension: int) -> int:
+    if dtype == "int8":
+        return 4 + dimension
+    return _FLOAT_DTYPES[dtype].itemsize * dimension
+
+
+def check_dtype(dtype: Optional[str]) -> str:
+    dtype = (dtype or "float32").lower()
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"不支持的向量编码: {dtype}（可选 {', '.join(SUPPORTED_DTYPES)}）")
+    return dtype
+
+
+def encode_vectors(vectors, dtype: str = "float32") -> bytes:
+    """把一维向量或二维矩阵按行编码为字节串"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    dtype = check_dtype(dtype)
+    if dtype != "int8":
+        return matrix.astype(_FLOAT_DTYPES[dtype], copy=False).tobytes()
+
+    # 逐行对称量化：scale = max|v| / 127
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    safe = np.where(scales > 0, scales, 1.0)
+    rows = np.empty(matrix.shape[0], dtype=_int8_row_dtype(matrix.shape[1]))
+    rows["scale"] = scales
+    rows["q"] = np.clip(np.rint(matrix / safe[:, None]), -127, 127)
+    return rows.tobytes()
+
+
+def decode_vectors(buffer, dtype: str = "float32", dimension: Optional[int] = None,
+                   count: Optional[int] = None) -> np.ndarray:
+    """解码为 (n, dimension) 矩阵；给出 dimension 或 count 之一即可推断另一维。
+
+    float32 直接返回 buffer 上的只读视图，不做任何拷贝。
+    """
+    dtype = check_dtype(dtype)
+    view = memoryview(buffer).cast("B")
+    total = view.nbytes
+    if dimension is None:
+        if not count:
+            raise ValueError("需要提供向量维度或条数")
+        if total % count:
+            raise ValueError("数据长度与向量条数不匹配")
+        per_row = total // count
+        dimension = per_row - 4 if dtype == "int8" else per_row // _FLOAT_DTYPES[dtype].itemsize
+    if dimension <= 0 or total % row_nbytes(dtype, dimension):
+        raise ValueError("数据长度与向量维度不匹配")
+
+    if dtype == "int8":
+        rows = np.frombuffer(view, dtype=_int8_row_dtype(dimension))
+        return rows["q"].astype(np.float32) * rows["scale"][:, None]
+    matrix = np.frombuffer(view, dtype=_FLOAT_DTYPES[dtype]).reshape(-1, dimension)
+    return matrix if dtype == "float32" else matrix.astype(np.float32)
+
+
+def encode_b64(vectors, dtype: str = "float32") -> str:
+    return base64.b64encode(encode_vectors(vectors, dtype)).decode("ascii")
+
+
+def decode_b64(data: str, dtype: str = "float32", dimension: Optional[int] = None,
+               count: Optional[int] = None) -> np.ndarray:
+    return decode_vectors(base64.b64decode(data), dtype, dimension, count)
+
+
+def wants_binary(accept: Optional[str]) -> bool:
+    """Accept 头中明确要求 application/octet-stream 时返回二进制"""
+    return bool(accept) and BINARY_MEDIA_TYPE in accept
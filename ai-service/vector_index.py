@@ -0,0 +1,525 @@
+# FluLink v4.0 AI 服务 - 常驻向量索引
+# 纯 numpy 实现的 Flat / IVF-Flat 索引，支持增量写入、删除（墓碑）与压缩，查询时可调 nprobe
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from vector_search import iter_row_blocks, normalize_rows, select_top_k, top_k_cosine_batch
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndex:
+    """向量集合的统一接口：upsert / delete / query / count"""
+
+    backend = "base"
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def upsert(self, ids: Sequence[str], vectors, metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]) -> int:
+        raise NotImplementedError
+
+    def query(self, vector, k: int, min_similarity: Optional[float] = None,
+              nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def query_batch(self, vectors, k: int, min_similarity: Optional[float] = None,
+                    nprobe: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """多查询检索，返回每个查询的匹配列表；默认逐条调用 query"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return [self.query(vector, k, min_similarity, nprobe) for vector in matrix.reshape(len(matrix), -1)]
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def needs_training(self) -> bool:
+        return False
+
+    def train(self):
+        pass
+
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "count": self.count()}
+
+
+class FlatIndex(VectorIndex):
+    """精确检索：向量归一化后存放在可扩容的 float32 矩阵中，删除只打墓碑"""
+
+    backend = "flat"
+
+    def __init__(self, name: str, dimension: Optional[int] = None,
+                 compact_ratio: float = 0.2, compact_min: int = 1024):
+        super().__init__(name)
+        self.dimension = dimension
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self._lock = threading.RLock()
+        self._vectors = np.empty((0, dimension or 0), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+        self._tombstones = 0
+        self.stats = {"upserts": 0, "deletes": 0, "queries": 0, "compactions": 0}
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def _prepare(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2:
+            raise ValueError("向量必须是二维矩阵")
+        if matrix.shape[1] == 0:
+            raise ValueError("向量维度不能为 0")
+        if self.dimension is None:
+            self.dimension = int(matrix.shape[1])
+            self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"向量维度 {matrix.shape[1]} 与集合维度 {self.dimension} 不一致")
+        return normalize_rows(matrix)
+
+    def _reserve(self, rows: int):
+        """按倍数扩容底层矩阵"""
+        needed = self._size + rows
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        vectors = np.empty((capacity, self.dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._alive = vectors, alive
+        self._on_reserve(capacity)
+
+    def _on_reserve(self, capacity: int):
+        pass
+
+    def _tombstone(self, row: int):
+        self._alive[row] = False
+        self._ids[row] = None
+        self._metadatas[row] = {}
+        self._tombstones += 1
+
+    def upsert(self, ids: Sequence[str], vectors, metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        """写入或覆盖向量；已存在的 id 旧行打墓碑后追加新行"""
+        ids = [str(item_id) for item_id in ids]
+        with self._lock:
+            matrix = self._prepare(vectors)
+            if matrix.shape[0] != len(ids):
+                raise ValueError("ids 与向量数量不一致")
+            if metadatas is None:
+                metadatas = [{} for _ in ids]
+            elif len(metadatas) != len(ids):
+                raise ValueError("metadatas 与 ids 数量不一致")
+
+            self._reserve(len(ids))
+            start = self._size
+            self._vectors[start:start + len(ids)] = matrix
+            self._alive[start:start + len(ids)] = True
+            for offset, item_id in enumerate(ids):
+                old_row = self._rows.get(item_id)
+                if old_row is not None:
+                    self._tombstone(old_row)
+                self._rows[item_id] = start + offset
+                self._ids.append(item_id)
+                self._metadatas.append(dict(metadatas[offset] or {}))
+            self._size += len(ids)
+            self._on_insert(start, self._size)
+            self.stats["upserts"] += len(ids)
+            self._maybe_compact()
+            return len(ids)
+
+    def _on_insert(self, start: int, end: int):
+        pass
+
+    def delete(self, ids: Sequence[str]) -> int:
+        with self._lock:
+            deleted = 0
+            for item_id in ids:
+                row = self._rows.pop(str(item_id), None)
+                if row is not None:
+                    self._tombstone(row)
+                    deleted += 1
+            self.stats["deletes"] += deleted
+            self._maybe_compact()
+            return deleted
+
+    def _maybe_compact(self):
+        if self._tombstones >= self.compact_min and self._tombstones > self.compact_ratio * self._size:
+            self.compact()
+
+    def compact(self):
+        """清理墓碑行，重排存储"""
+        with self._lock:
+            keep = np.flatnonzero(self._alive[:self._size])
+            self._vectors = np.ascontiguousarray(self._vectors[keep])
+            self._alive = np.ones(keep.shape[0], dtype=bool)
+            self._ids = [self._ids[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+            self._size = keep.shape[0]
+            self._tombstones = 0
+            self._on_compact(keep)
+            self.stats["compactions"] += 1
+
+    def _on_compact(self, keep: np.ndarray):
+        pass
+
+    def _full_scan(self, nprobe: Optional[int]) -> bool:
+        return True
+
+    def _candidates(self, query: np.ndarray, nprobe: Optional[int]) -> Optional[np.ndarray]:
+        """返回候选行；None 表示全量扫描"""
+        return None
+
+    def query(self, vector, k: int, min_similarity: Optional[float] = None,
+              nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        # 持锁只截取当前存储的引用，矩阵运算在锁外进行，查询之间互不阻塞
+        with self._lock:
+            self.stats["queries"] += 1
+            if self._size == 0 or k <= 0:
+                return []
+            if query.shape[0] != self.dimension:
+                raise ValueError(f"查询向量维度 {query.shape[0]} 与集合维度 {self.dimension} 不一致")
+            query = normalize_rows(query.reshape(1, -1))[0]
+            size = self._size
+            vectors, ids, metadatas = self._vectors, self._ids, self._metadatas
+            alive = self._alive[:size].copy()
+            candidates = self._candidates(query, nprobe)
+
+        if candidates is None:
+            scores = vectors[:size] @ query
+            scores[~alive] = -np.inf
+            rows = select_top_k(scores, k, min_similarity)
+            row_scores = scores[rows]
+        else:
+            candidates = candidates[alive[candidates]]
+            scores = vectors[candidates] @ query
+            picked = select_top_k(scores, k, min_similarity)
+            rows, row_scores = candidates[picked], scores[picked]
+
+        matches = []
+        for row, score in zip(rows.tolist(), row_scores.tolist()):
+            item_id = ids[row]
+            # 查询期间被删除的行 id 已置空
+            if item_id is not None and np.isfinite(score):
+                matches.append({"id": item_id, "similarity": score, "metadata": metadatas[row]})
+        return matches
+
+    def query_batch(self, vectors, k: int, min_similarity: Optional[float] = None,
+                    nprobe: Optional[int] = None, block_rows: int = 8192,
+                    query_block: int = 64) -> List[List[Dict[str, Any]]]:
+        """全量扫描时多个查询共用一次分块矩阵-矩阵乘；IVF 按簇探测时各查询候选不同，逐条查询"""
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        if not self._full_scan(nprobe):
+            return super().query_batch(queries, k, min_similarity, nprobe)
+        with self._lock:
+            self.stats["queries"] += len(queries)
+            if self._size == 0 or k <= 0:
+                return [[] for _ in range(len(queries))]
+            if queries.shape[1] != self.dimension:
+                raise ValueError(f"查询向量维度 {queries.shape[1]} 与集合维度 {self.dimension} 不一致")
+            size = self._size
+            vectors, ids, metadatas = self._vectors, self._ids, self._metadatas
+            alive_rows = np.flatnonzero(self._alive[:size])
+
+        if alive_rows.shape[0] == size:
+            blocks = iter_row_blocks(vectors[:size], block_rows)
+        else:
+            blocks = (
+                (alive_rows[start:start + block_rows], vectors[alive_rows[start:start + block_rows]])
+                for start in range(0, alive_rows.shape[0], block_rows)
+            )
+        results = []
+        for rows, row_scores in top_k_cosine_batch(queries, blocks, k, min_similarity,
+                                                   normalized=True, query_block=query_block):
+            matches = []
+            for row, score in zip(rows.tolist(), row_scores.tolist()):
+                item_id = ids[row]
+                if item_id is not None:
+                    matches.append({"id": item_id, "similarity": score, "metadata": metadatas[row]})
+            results.append(matches)
+        return results
+
+    def export_view(self) -> Dict[str, Any]:
+        """导出当前状态用于快照。
+
+        已写入的行不会被原地修改（更新走墓碑 + 追加，扩容与压缩都会换新数组），
+        因此持锁只需复制存活标记与 id 列表，向量矩阵本身可以在锁外读取。
+        """
+        with self._lock:
+            size = self._size
+            return {
+                "dimension": self.dimension,
+                "vectors": self._vectors,
+                "rows": np.flatnonzero(self._alive[:size]),
+                "ids": list(self._ids[:size]),
+                "metadatas": list(self._metadatas[:size])
+            }
+
+    def load_state(self, dimension: int, vectors: np.ndarray, ids: List[str],
+                   metadatas: List[Dict[str, Any]], **extra):
+        """从快照恢复；vectors 可以是只读 memmap，首次扩容时才复制进内存"""
+        with self._lock:
+            self.dimension = dimension
+            self._vectors = vectors
+            self._size = vectors.shape[0]
+            self._alive = np.ones(self._size, dtype=bool)
+            self._ids = list(ids)
+            self._metadatas = list(metadatas)
+            self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+            self._tombstones = 0
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """按 id 取回（归一化后的）向量"""
+        with self._lock:
+            return {
+                item_id: self._vectors[self._rows[item_id]].copy()
+                for item_id in ids if item_id in self._rows
+            }
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "count": self.count(),
+            "dimension": self.dimension,
+            "rows": self._size,
+            "tombstones": self._tombstones,
+            "capacity": self._vectors.shape[0],
+            **self.stats
+        }
+
+
+class IVFFlatIndex(FlatIndex):
+    """IVF-Flat：球面 k-means 粗聚类 + 倒排表，查询只扫描最近的 nprobe 个簇"""
+
+    backend = "ivf_flat"
+
+    def __init__(self, name: str, dimension: Optional[int] = None, nlist: int = 256,
+                 default_nprobe: int = 8, train_iterations: int = 10, **kwargs):
+        super().__init__(name, dimension, **kwargs)
+        self.nlist = nlist
+        self.default_nprobe = default_nprobe
+        self.train_iterations = train_iterations
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._members: List[List[int]] = []
+        self._member_arrays: Dict[int, np.ndarray] = {}
+        self._trained_size = 0
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def train_threshold(self) -> int:
+        """训练前至少需要的样本数（每簇约 39 个点）"""
+        return self.nlist * 39
+
+    def _on_reserve(self, capacity: int):
+        assign = np.full(capacity, -1, dtype=np.int32)
+        assign[:self._size] = self._assign[:self._size]
+        self._assign = assign
+
+    def _assign_rows(self, start: int, end: int, block_rows: int = 16384):
+        for block_start in range(start, end, block_rows):
+            block_end = min(block_start + block_rows, end)
+            labels = np.argmax(self._vectors[block_start:block_end] @ self._centroids.T, axis=1)
+            self._assign[block_start:block_end] = labels
+            for offset, label in enumerate(labels.tolist()):
+                self._members[label].append(block_start + offset)
+                self._member_arrays.pop(label, None)
+
+    def _on_insert(self, start: int, end: int):
+        if self.trained:
+            self._assign_rows(start, end)
+
+    def _on_compact(self, keep: np.ndarray):
+        if not self.trained:
+            return
+        self._assign = np.ascontiguousarray(self._assign[keep])
+        self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        order = np.argsort(self._assign[:self._size], kind="stable")
+        bounds = np.searchsorted(self._assign[:self._size][order], np.arange(self.nlist + 1))
+        self._members = [order[bounds[i]:bounds[i + 1]].tolist() for i in range(self.nlist)]
+        self._member_arrays = {}
+
+    def needs_training(self) -> bool:
+        """首次达到阈值或规模增长到上次训练的 4 倍时需要（重新）训练"""
+        alive = self.count()
+        if alive < self.train_threshold:
+            return False
+        return not self.trained or alive >= 4 * self._trained_size
+
+    def train(self, seed: int = 0, sample_size: Optional[int] = None):
+        """训练粗聚类中心；k-means 在锁外进行，只有重新分配倒排表时持锁"""
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive[:self._size])
+            if alive_rows.shape[0] < self.nlist:
+                return
+            rng = np.random.default_rng(seed)
+            sample_size = min(alive_rows.shape[0], sample_size or self.nlist * 64)
+            sample = self._vectors[rng.choice(alive_rows, sample_size, replace=False)].copy()
+
+        centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=self.nlist)
+            empty = counts == 0
+            # 空簇用随机样本重新初始化
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        with self._lock:
+            self._centroids = centroids
+            self._members = [[] for _ in range(self.nlist)]
+            self._member_arrays = {}
+            self._assign_rows(0, self._size)
+            self._trained_size = self.count()
+        logger.info(f"向量索引 {self.name} 训练完成: {self._trained_size} 条, nlist={self.nlist}")
+
+    def export_view(self) -> Dict[str, Any]:
+        with self._lock:
+            view = super().export_view()
+            if self.trained:
+                view["centroids"] = self._centroids
+                view["assign"] = self._assign[view["rows"]]
+                view["trained_size"] = self._trained_size
+            return view
+
+    def load_state(self, dimension: int, vectors: np.ndarray, ids: List[str],
+                   metadatas: List[Dict[str, Any]], centroids: Optional[np.ndarray] = None,
+                   assign: Optional[np.ndarray] = None, trained_size: int = 0, **extra):
+        with self._lock:
+            super().load_state(dimension, vectors, ids, metadatas)
+            if centroids is not None and assign is not None and centroids.shape[0] == self.nlist:
+                self._centroids = np.asarray(centroids, dtype=np.float32)
+                self._assign = np.array(assign, dtype=np.int32)
+                self._trained_size = trained_size
+                self._rebuild_lists()
+            else:
+                self._centroids = None
+                self._assign = np.full(self._size, -1, dtype=np.int32)
+                self._members = []
+                self._member_arrays = {}
+
+    def _nprobe(self, nprobe: Optional[int]) -> int:
+        """本次探测簇数：未指定时取默认值，并限制在 [1, nlist]"""
+        return max(1, min(self.default_nprobe if nprobe is None else int(nprobe), self.nlist))
+
+    def _full_scan(self, nprobe: Optional[int]) -> bool:
+        return not self.trained or self._nprobe(nprobe) >= self.nlist
+
+    def _candidates(self, query: np.ndarray, nprobe: Optional[int]) -> Optional[np.ndarray]:
+        if self._full_scan(nprobe):
+            return None
+        nprobe = self._nprobe(nprobe)
+        probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        arrays = []
+        for label in probe.tolist():
+            members = self._member_arrays.get(label)
+            if members is None:
+                members = np.asarray(self._members[label], dtype=np.int64)
+                self._member_arrays[label] = members
+            arrays.append(members)
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **super().status(),
+            "trained": self.trained,
+            "nlist": self.nlist,
+            "default_nprobe": self.default_nprobe,
+            "trained_size": self._trained_size
+        }
+
+
+class ChromaIndex(VectorIndex):
+    """ChromaDB 集合适配器（nprobe 对 Chroma 无效）"""
+
+    backend = "chroma"
+
+    def __init__(self, name: str, collection, dimension: Optional[int] = None):
+        super().__init__(name)
+        self.collection = collection
+        self.dimension = dimension
+
+    def upsert(self, ids: Sequence[str], vectors, metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2 or matrix.shape[1] == 0:
+            raise ValueError("向量维度不能为 0")
+        if self.dimension is not None and matrix.shape[1] != self.dimension:
+            raise ValueError(f"向量维度 {matrix.shape[1]} 与集合维度 {self.dimension} 不一致")
+        self.collection.upsert(
+            ids=[str(item_id) for item_id in ids],
+            embeddings=matrix.tolist(),
+            metadatas=list(metadatas) if metadatas else None
+        )
+        return len(ids)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        self.collection.delete(ids=[str(item_id) for item_id in ids])
+        return len(ids)
+
+    def query(self, vector, k: int, min_similarity: Optional[float] = None,
+              nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.query_batch(np.asarray(vector, dtype=np.float32).reshape(1, -1), k, min_similarity)[0]
+
+    def query_batch(self, vectors, k: int, min_similarity: Optional[float] = None,
+                    nprobe: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Chroma 原生支持一次提交多个查询向量"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        results = self.collection.query(
+            query_embeddings=matrix.reshape(len(matrix), -1).tolist(),
+            n_results=k
+        )
+        batches = []
+        for q, (item_ids, distances) in enumerate(zip(results['ids'], results['distances'])):
+            matches = []
+            for i, (item_id, distance) in enumerate(zip(item_ids, distances)):
+                similarity = 1 - distance
+                if min_similarity is None or similarity >= min_similarity:
+                    matches.append({
+                        "id": item_id,
+                        "similarity": similarity,
+                        "metadata": results['metadatas'][q][i] if results['metadatas'] else {}
+                    })
+            batches.append(matches)
+        return batches
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+def create_index(name: str, backend: str = "ivf_flat", **options) -> VectorIndex:
+    """按配置创建常驻索引；给出 dimension 时集合维度固定，否则由首次写入决定"""
+    if backend == "flat":
+        return FlatIndex(name, options.get("dimension"), compact_ratio=options.get("compact_ratio", 0.2))
+    if backend == "ivf_flat":
+        return IVFFlatIndex(
+            name,
+            options.get("dimension"),
+            nlist=options.get("nlist", 256),
+            default_nprobe=options.get("default_nprobe", 8),
+            compact_ratio=options.get("compact_ratio", 0.2)
+        )
+    raise ValueError(f"未知的向量索引类型: {backend}")
@@ -0,0 +1,181 @@
+# FluLink v4.0 AI 服务 - 向量化相似度检索
+# 一次矩阵-向量乘计算全部余弦相似度，argpartition 选取 top-k；超大用户池按块处理
+# 多查询时用一次矩阵-矩阵乘计算整块相似度，可在服务端按 max / mean 融合各查询的得分
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（零向量保持为零）"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    np.maximum(norms, np.finfo(np.float32).tiny, out=norms)
+    return matrix / norms
+
+
+def stack_pool(user_pool: List[Dict[str, Any]], dimension: int,
+               field: str = "interest_vector") -> Tuple[List[int], np.ndarray]:
+    """把用户池中维度合法的向量堆叠为 float32 矩阵，返回 (池内下标, 矩阵)"""
+    positions = [
+        i for i, user in enumerate(user_pool)
+        if isinstance(user.get(field), list) and len(user[field]) == dimension
+    ]
+    matrix = np.empty((len(positions), dimension), dtype=np.float32)
+    for row, i in enumerate(positions):
+        matrix[row] = user_pool[i][field]
+    return positions, matrix
+
+
+def select_top_k(scores: np.ndarray, k: int, min_similarity: Optional[float]) -> np.ndarray:
+    """返回得分最高的 k 个下标（按得分降序）"""
+    if min_similarity is not None:
+        candidates = np.flatnonzero(scores >= min_similarity)
+    else:
+        candidates = np.arange(scores.shape[0])
+    if candidates.size > k:
+        part = np.argpartition(scores[candidates], -k)[-k:]
+        candidates = candidates[part]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_cosine(query: np.ndarray, matrix: np.ndarray, k: int,
+                 min_similarity: Optional[float] = None,
+                 normalized: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """单查询 top-k 余弦相似度，返回 (行下标, 相似度)"""
+    query = normalize_rows(query.reshape(1, -1))[0]
+    if k <= 0 or matrix.shape[0] == 0 or not query.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if not normalized:
+        matrix = normalize_rows(matrix)
+    scores = matrix @ query
+    indices = select_top_k(scores, k, min_similarity)
+    return indices, scores[indices]
+
+
+def top_k_cosine_chunked(query: np.ndarray, blocks: Iterable[Tuple[np.ndarray, np.ndarray]], k: int,
+                         min_similarity: Optional[float] = None,
+                         normalized: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """分块 top-k：blocks 依次产出 (子矩阵各行的全局下标, 子矩阵)，内存占用只与块大小和 k 相关"""
+    best_indices = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for row_ids, block in blocks:
+        indices, scores = top_k_cosine(query, block, k, min_similarity, normalized)
+        if indices.size == 0:
+            continue
+        best_indices = np.concatenate([best_indices, np.asarray(row_ids)[indices]])
+        best_scores = np.concatenate([best_scores, scores])
+        if best_scores.size > k:
+            keep = select_top_k(best_scores, k, None)
+            best_indices, best_scores = best_indices[keep], best_scores[keep]
+    order = np.argsort(-best_scores, kind="stable")
+    return best_indices[order], best_scores[order]
+
+
+def top_k_cosine_batch(queries: np.ndarray, blocks: Iterable[Tuple[np.ndarray, np.ndarray]], k: int,
+                       min_similarity: Optional[float] = None, normalized: bool = False,
+                       query_block: int = 64) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """多查询分块 top-k：每个行块与 query_block 个查询做一次矩阵乘，只保留每个查询的 k 个候选。
+
+    blocks 与 top_k_cosine_chunked 相同且只遍历一次；内存占用为 query_block × 块行数 加 查询数 × k。
+    返回每个查询的 (行下标, 相似度)，零向量查询结果为空。
+    """
+    queries = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(len(queries), -1))
+    count = queries.shape[0]
+    valid = queries.any(axis=1)
+    best_indices = np.empty((count, 0), dtype=np.int64)
+    best_scores = np.empty((count, 0), dtype=np.float32)
+    if k <= 0 or not valid.any():
+        return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(count)]
+    query_block = max(1, query_block)
+    for row_ids, block in blocks:
+        if block.shape[0] == 0:
+            continue
+        if not normalized:
+            block = normalize_rows(block)
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        width = min(k, block.shape[0])
+        indices = np.empty((count, width), dtype=np.int64)
+        scores = np.empty((count, width), dtype=np.float32)
+        for start in range(0, count, query_block):
+            stop = min(start + query_block, count)
+            similarity = queries[start:stop] @ block.T
+            if min_similarity is not None:
+                similarity[similarity < min_similarity] = -np.inf
+            if width < block.shape[0]:
+                part = np.argpartition(similarity, -width, axis=1)[:, -width:]
+            else:
+                part = np.broadcast_to(np.arange(width), (stop - start, width))
+            indices[start:stop] = row_ids[part]
+            scores[start:stop] = np.take_along_axis(similarity, part, axis=1)
+        # 与此前各块的候选合并，每个查询仍只保留 k 个
+        best_indices = np.concatenate([best_indices, indices], axis=1)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        if best_scores.shape[1] > k:
+            keep = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+            best_indices = np.take_along_axis(best_indices, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best_indices = np.take_along_axis(best_indices, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    results = []
+    for i in range(count):
+        found = np.isfinite(best_scores[i]) if valid[i] else np.zeros(best_scores.shape[1], dtype=bool)
+        results.append((best_indices[i][found], best_scores[i][found]))
+    return results
+
+
+def mean_fusion_query(queries: np.ndarray) -> Tuple[np.ndarray, float]:
+    """mean 融合：各查询余弦相似度的均值 = scale × 与 (归一化查询均值方向) 的余弦相似度，
+    因此只需一次单查询检索。返回 (单位方向, scale)，scale 为 0 时所有得分都为 0"""
+    mean = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)).mean(axis=0)
+    scale = float(np.linalg.norm(mean))
+    return (mean / scale if scale > 0 else mean), scale
+
+
+def fuse_max(match_lists: List[List[Dict[str, Any]]], k: int) -> List[Dict[str, Any]]:
+    """max 融合：按 id 取各查询中的最高得分，并记录得分来自哪个查询。
+    融合后的 top-k 必然出现在其最高得分查询的 top-k 中，所以合并各查询的 top-k 即为精确结果"""
+    best: Dict[str, Dict[str, Any]] = {}
+    for query_index, matches in enumerate(match_lists):
+        for match in matches:
+            current = best.get(match["id"])
+            if current is None or match["similarity"] > current["similarity"]:
+                best[match["id"]] = {**match, "best_query": query_index}
+    return sorted(best.values(), key=lambda match: -match["similarity"])[:max(0, k)]
+
+
+def fused_search(search: Callable[[np.ndarray, int, Optional[float]], List[List[Dict[str, Any]]]],
+                 queries: np.ndarray, k: int, min_similarity: Optional[float] = None,
+                 fusion: Optional[str] = None):
+    """search(查询矩阵, k, min_similarity) 返回每个查询的匹配列表。
+    fusion 为空时原样返回各查询结果，为 max / mean 时返回融合后的单个列表"""
+    if fusion is None:
+        return search(queries, k, min_similarity)
+    if fusion == "max":
+        return fuse_max(search(queries, k, min_similarity), k)
+    if fusion == "mean":
+        direction, scale = mean_fusion_query(queries)
+        if scale <= 0 or k <= 0:
+            return []
+        threshold = None if min_similarity is None else min_similarity / scale
+        matches = search(direction.reshape(1, -1), k, threshold)[0]
+        return [{**match, "similarity": float(match["similarity"]) * scale} for match in matches]
+    raise ValueError(f"不支持的融合方式: {fusion}（可选 max、mean）")
+
+
+def iter_row_blocks(matrix: np.ndarray, block_rows: int) -> Iterable[Tuple[np.ndarray, np.ndarray]]:
+    """按行切分矩阵（可为 np.memmap，只有当前块会被读入内存）"""
+    for start in range(0, matrix.shape[0], block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        yield np.arange(start, start + block.shape[0]), block
+
+
+def iter_pool_blocks(user_pool: List[Dict[str, Any]], dimension: int, block_rows: int,
+                     field: str = "interest_vector") -> Iterable[Tuple[np.ndarray, np.ndarray]]:
+    """逐块把 JSON 用户池转换为矩阵，避免一次性复制整个池"""
+    for start in range(0, len(user_pool), block_rows):
+        positions, block = stack_pool(user_pool[start:start + block_rows], dimension, field)
+        yield np.asarray(positions, dtype=np.int64) + start, block
@@ -0,0 +1,359 @@
+# FluLink v4.0 AI 服务 - 持久化向量存储
+# 写入先追加到 WAL 段文件再应用到常驻索引；定期生成压缩快照，启动时 mmap 加载快照并重放其后的段
+
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from vector_index import FlatIndex, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+OP_UPSERT = 1
+OP_DELETE = 2
+# 记录头：payload 长度、payload 的 crc32
+RECORD_HEADER = struct.Struct("<II")
+# payload 头：操作类型、id 长度、metadata 长度、向量维度
+PAYLOAD_HEADER = struct.Struct("<BHII")
+
+
+def _encode_record(op: int, item_id: str, metadata: Optional[Dict[str, Any]] = None,
+                   vector: Optional[np.ndarray] = None) -> bytes:
+    id_bytes = item_id.encode("utf-8")
+    meta_bytes = json.dumps(metadata, ensure_ascii=False).encode("utf-8") if metadata else b""
+    vector_bytes = vector.astype("<f4", copy=False).tobytes() if vector is not None else b""
+    dim = vector.shape[0] if vector is not None else 0
+    payload = PAYLOAD_HEADER.pack(op, len(id_bytes), len(meta_bytes), dim) + id_bytes + meta_bytes + vector_bytes
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_records(path: str):
+    """逐条读取段文件；遇到不完整或校验失败的尾部记录即停止（进程中断时的半条写入）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning(f"段文件 {path} 在偏移 {offset} 处截断，忽略其后内容")
+            return
+        op, id_len, meta_len, dim = PAYLOAD_HEADER.unpack_from(payload)
+        cursor = PAYLOAD_HEADER.size
+        item_id = payload[cursor:cursor + id_len].decode("utf-8")
+        cursor += id_len
+        metadata = json.loads(payload[cursor:cursor + meta_len]) if meta_len else {}
+        cursor += meta_len
+        vector = np.frombuffer(payload, dtype="<f4", count=dim, offset=cursor) if dim else None
+        yield op, item_id, metadata, vector
+        offset = start + length
+
+
+class PersistentVectorStore(VectorIndex):
+    """为 FlatIndex / IVFFlatIndex 提供持久化：追加写段文件 + 定期压缩快照"""
+
+    def __init__(self, index: FlatIndex, directory: str, fsync: bool = False):
+        super().__init__(index.name)
+        self.index = index
+        self.backend = index.backend
+        self.directory = directory
+        self.fsync = fsync
+        # 写锁串行化「写段文件 + 应用到索引」，保证段内顺序与索引一致；查询不经过该锁
+        self._write_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._segment = None
+        self._segment_seq = 0
+        self.writes_since_snapshot = 0
+        self.stats = {
+            "snapshots": 0,
+            "last_snapshot_time": None,
+            "last_snapshot_ms": None,
+            "last_load_ms": None,
+            "replayed_records": 0
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    # ---- 路径 ----
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"wal-{seq:012d}.log")
+
+    def _snapshot_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"snapshot-{seq:012d}")
+
+    def _segment_seqs(self) -> List[int]:
+        seqs = []
+        for name in os.listdir(self.directory):
+            if name.startswith("wal-") and name.endswith(".log"):
+                seqs.append(int(name[4:-4]))
+        return sorted(seqs)
+
+    def _current_snapshot(self) -> Optional[str]:
+        current = os.path.join(self.directory, "CURRENT")
+        if not os.path.exists(current):
+            return None
+        with open(current) as f:
+            name = f.read().strip()
+        path = os.path.join(self.directory, name)
+        return path if os.path.isdir(path) else None
+
+    # ---- 加载 ----
+    def open(self):
+        """加载最新快照（mmap）并重放其后的段文件，然后打开新的写入段"""
+        started = time.perf_counter()
+        snapshot = self._current_snapshot()
+        first_seq = 0
+        if snapshot:
+            with open(os.path.join(snapshot, "meta.json")) as f:
+                meta = json.load(f)
+            if self._usable_dimension(meta["dimension"]):
+                self.index.load_state(**self._read_snapshot(snapshot, meta))
+            elif meta["dimension"] is not None:
+                logger.error(
+                    f"向量集合 {self.name} 的快照维度 {meta['dimension']} 与集合维度 {self.index.dimension} 不符，已忽略"
+                )
+            first_seq = meta["wal_seq"]
+
+        replayed = 0
+        seqs = [seq for seq in self._segment_seqs() if seq >= first_seq]
+        for seq in seqs:
+            replayed += self._replay(self._segment_path(seq))
+        self.writes_since_snapshot = replayed
+
+        if not seqs:
+            self._segment_seq = first_seq
+        elif os.path.getsize(self._segment_path(seqs[-1])) == 0:
+            # 上次运行没有写入，沿用空段避免段文件无谓累积
+            self._segment_seq = seqs[-1]
+        else:
+            self._segment_seq = seqs[-1] + 1
+        self._segment = open(self._segment_path(self._segment_seq), "ab")
+        self.stats["replayed_records"] = replayed
+        self.stats["last_load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"向量集合 {self.name} 已加载: {self.index.count()} 条，"
+            f"重放 {replayed} 条记录，耗时 {self.stats['last_load_ms']}ms"
+        )
+        return self
+
+    def _usable_dimension(self, dimension: Optional[int]) -> bool:
+        """快照或段记录的维度是否可用：非零，且集合维度已固定时与之一致"""
+        if not dimension:
+            return False
+        return self.index.dimension is None or dimension == self.index.dimension
+
+    @staticmethod
+    def _read_snapshot(snapshot: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+        with open(os.path.join(snapshot, "ids.json")) as f:
+            ids = json.load(f)
+        with open(os.path.join(snapshot, "metadatas.json")) as f:
+            metadatas = json.load(f)
+        state = {
+            "dimension": meta["dimension"],
+            # 只映射不读取，冷启动耗时与向量规模基本无关
+            "vectors": np.load(os.path.join(snapshot, "vectors.npy"), mmap_mode="r"),
+            "ids": ids,
+            "metadatas": metadatas
+        }
+        if os.path.exists(os.path.join(snapshot, "centroids.npy")):
+            state["centroids"] = np.load(os.path.join(snapshot, "centroids.npy"))
+            state["assign"] = np.load(os.path.join(snapshot, "assign.npy"))
+            state["trained_size"] = meta.get("trained_size", 0)
+        return state
+
+    def _replay(self, path: str) -> int:
+        """按顺序重放，连续的 upsert 合并为一次批量写入"""
+        pending_ids, pending_vectors, pending_metas = [], [], []
+
+        def flush():
+            if pending_ids:
+                self.index.upsert(pending_ids, np.stack(pending_vectors), pending_metas)
+                pending_ids.clear()
+                pending_vectors.clear()
+                pending_metas.clear()
+
+        count = 0
+        skipped = 0
+        for op, item_id, metadata, vector in _read_records(path):
+            if op == OP_UPSERT:
+                if vector is not None and pending_vectors and vector.shape[0] != pending_vectors[0].shape[0]:
+                    flush()
+                if vector is None or not self._usable_dimension(vector.shape[0]):
+                    # 早期版本可能写入过零维或维度不符的记录，重放时跳过
+                    skipped += 1
+                    continue
+                pending_ids.append(item_id)
+                pending_vectors.append(vector)
+                pending_metas.append(metadata)
+            else:
+                flush()
+                self.index.delete([item_id])
+            count += 1
+        flush()
+        if skipped:
+            logger.warning(f"向量集合 {self.name} 重放 {path} 时跳过 {skipped} 条维度无效的记录")
+        return count
+
+    # ---- 写入 ----
+    def _append(self, records: bytes):
+        self._segment.write(records)
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+
+    def upsert(self, ids: Sequence[str], vectors, metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        ids = [str(item_id) for item_id in ids]
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError("ids 与向量数量不一致")
+        if matrix.shape[1] == 0:
+            raise ValueError("向量维度不能为 0")
+        if self.index.dimension is not None and matrix.shape[1] != self.index.dimension:
+            raise ValueError(f"向量维度 {matrix.shape[1]} 与集合维度 {self.index.dimension} 不一致")
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in ids]
+        if len(metadatas) != len(ids):
+            raise ValueError("metadatas 与 ids 数量不一致")
+
+        records = b"".join(
+            _encode_record(OP_UPSERT, item_id, metadata, vector)
+            for item_id, metadata, vector in zip(ids, metadatas, matrix)
+        )
+        with self._write_lock:
+            self._append(records)
+            written = self.index.upsert(ids, matrix, metadatas)
+            self.writes_since_snapshot += written
+        return written
+
+    def delete(self, ids: Sequence[str]) -> int:
+        records = b"".join(_encode_record(OP_DELETE, str(item_id)) for item_id in ids)
+        with self._write_lock:
+            self._append(records)
+            deleted = self.index.delete(ids)
+            self.writes_since_snapshot += len(ids)
+        return deleted
+
+    # ---- 查询与状态（直接委托，不经过写锁）----
+    def query(self, vector, k: int, min_similarity: Optional[float] = None,
+              nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.index.query(vector, k, min_similarity=min_similarity, nprobe=nprobe)
+
+    def query_batch(self, vectors, k: int, min_similarity: Optional[float] = None,
+                    nprobe: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        return self.index.query_batch(vectors, k, min_similarity=min_similarity, nprobe=nprobe)
+
+    def count(self) -> int:
+        return self.index.count()
+
+    def needs_training(self) -> bool:
+        return self.index.needs_training()
+
+    def train(self):
+        self.index.train()
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        return self.index.get_vectors(ids)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self.index.status(),
+            "persistent": True,
+            "directory": self.directory,
+            "segment_seq": self._segment_seq,
+            "writes_since_snapshot": self.writes_since_snapshot,
+            **self.stats
+        }
+
+    # ---- 快照 ----
+    def snapshot(self, block_rows: int = 65536) -> bool:
+        """生成压缩快照。
+
+        持写锁的时间只有切换段文件和导出状态视图；向量写盘在锁外进行，
+        期间的新写入落在新段文件里，查询完全不受影响。
+        """
+        with self._snapshot_lock:
+            started = time.perf_counter()
+            with self._write_lock:
+                if self.writes_since_snapshot == 0 and self._current_snapshot():
+                    return False
+                view = self.index.export_view()
+                self._segment.close()
+                self._segment_seq += 1
+                self._segment = open(self._segment_path(self._segment_seq), "ab")
+                snapshot_seq = self._segment_seq
+                self.writes_since_snapshot = 0
+
+            final_path = self._snapshot_path(snapshot_seq)
+            tmp_path = final_path + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+
+            rows = view["rows"]
+            dimension = view["dimension"]
+            if dimension is not None:
+                vectors_file = np.lib.format.open_memmap(
+                    os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                    dtype=np.float32, shape=(rows.shape[0], dimension)
+                )
+                for start in range(0, rows.shape[0], block_rows):
+                    vectors_file[start:start + block_rows] = view["vectors"][rows[start:start + block_rows]]
+                vectors_file.flush()
+                del vectors_file
+            with open(os.path.join(tmp_path, "ids.json"), "w") as f:
+                json.dump([view["ids"][row] for row in rows.tolist()], f, ensure_ascii=False)
+            with open(os.path.join(tmp_path, "metadatas.json"), "w") as f:
+                json.dump([view["metadatas"][row] for row in rows.tolist()], f, ensure_ascii=False)
+            meta = {
+                "dimension": dimension,
+                "count": int(rows.shape[0]),
+                "backend": self.backend,
+                "wal_seq": snapshot_seq,
+                "created_at": time.time()
+            }
+            if "centroids" in view:
+                np.save(os.path.join(tmp_path, "centroids.npy"), view["centroids"])
+                np.save(os.path.join(tmp_path, "assign.npy"), view["assign"])
+                meta["trained_size"] = view["trained_size"]
+            with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+                json.dump(meta, f)
+
+            os.replace(tmp_path, final_path)
+            current_tmp = os.path.join(self.directory, "CURRENT.tmp")
+            with open(current_tmp, "w") as f:
+                f.write(os.path.basename(final_path))
+            os.replace(current_tmp, os.path.join(self.directory, "CURRENT"))
+
+            # 快照已覆盖的旧段与旧快照可以删除
+            for seq in self._segment_seqs():
+                if seq < snapshot_seq:
+                    os.remove(self._segment_path(seq))
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith("snapshot-") and path != final_path:
+                    shutil.rmtree(path, ignore_errors=True)
+
+            self.stats["snapshots"] += 1
+            self.stats["last_snapshot_time"] = time.time()
+            self.stats["last_snapshot_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(
+                f"向量集合 {self.name} 快照完成: {meta['count']} 条，"
+                f"耗时 {self.stats['last_snapshot_ms']}ms"
+            )
+            return True
+
+    def close(self, snapshot: bool = True):
+        if snapshot and self.writes_since_snapshot:
+            self.snapshot()
+        with self._write_lock:
+            if self._segment:
+                self._segment.close()
+                self._segment = None
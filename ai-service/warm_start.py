@@ -0,0 +1,84 @@
+# FluLink v4.0 AI 服务 - 模型热启动快照
+# 构建镜像时把模型与分词器序列化为本地 safetensors 目录，运行时直接从本地 mmap 加载，不访问 Hugging Face 缓存与网络
+#
+# 用法: python warm_start.py --model all-MiniLM-L6-v2 --output /app/models/warm [--backend onnx --backend-dir /app/models/backends]
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "warm_start.json"
+
+
+def snapshot_path(model_name: str, warm_dir: str) -> str:
+    return os.path.join(warm_dir, model_name.replace("/", "__"))
+
+
+def resolve_model_source(model_name: str, warm_dir: Optional[str]) -> str:
+    """存在与模型名匹配的快照时返回快照目录，否则返回模型名（走 Hugging Face 缓存）"""
+    if not warm_dir:
+        return model_name
+    path = snapshot_path(model_name, warm_dir)
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return model_name
+    return path if manifest.get("model_name") == model_name else model_name
+
+
+def prepare_snapshot(model_name: str, warm_dir: str) -> str:
+    """下载并保存模型快照（权重为 safetensors 格式），写入清单后原子替换"""
+    from sentence_transformers import SentenceTransformer
+
+    started = time.time()
+    model = SentenceTransformer(model_name, device="cpu")
+    target = snapshot_path(model_name, warm_dir)
+    tmp = target + ".tmp"
+    model.save(tmp, safe_serialization=True)
+    manifest = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "created_at": time.time()
+    }
+    with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    if os.path.exists(target):
+        os.rename(target, target + ".old")
+    os.replace(tmp, target)
+    if os.path.exists(target + ".old"):
+        import shutil
+        shutil.rmtree(target + ".old", ignore_errors=True)
+    logger.info(f"模型快照已生成: {target}，耗时 {time.time() - started:.2f}秒")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成嵌入模型热启动快照")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--output", default=os.getenv("EMBEDDING_WARM_START_DIR", "models/warm"))
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"),
+                        help="为 torch_int8 / onnx / onnx_int8 后端同时预先生成量化或 ONNX 产物并完成一致性校验")
+    parser.add_argument("--backend-dir", default=os.getenv("EMBEDDING_BACKEND_DIR", "models/backends"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    source = prepare_snapshot(args.model, args.output)
+    if args.backend != "torch":
+        # 校验结果写入产物旁的 parity.json，服务启动时直接复用
+        from embedding_backends import prepare_embedding_backend
+        parity = prepare_embedding_backend(
+            args.backend, args.model, args.backend_dir,
+            min_cosine=float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.99")), source=source
+        )
+        logger.info(f"嵌入后端 {args.backend} 已准备: {parity}")
+
+
+if __name__ == "__main__":
+    main()
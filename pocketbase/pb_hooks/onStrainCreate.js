@@ -159,6 +159,27 @@ onRecordAfterUpdateRequest((e) => {
     if (e.record.collection().name === "users") {
         console.log("用户信息更新，同步兴趣向量:", e.record.id);
         
+        // 位置变化增量推送到各服务的地理索引
+        const geoUpdate = JSON.stringify({
+            users: [{ id: e.record.id, location_data: e.record.get("location_data") }]
+        });
+        const geoTargets = ["http://ai-agent:8000"];
+        if ($os.getenv("AI_SERVICE_URL")) {
+            geoTargets.push($os.getenv("AI_SERVICE_URL"));
+        }
+        geoTargets.forEach((baseUrl) => {
+            fetch(`${baseUrl}/api/geo/users`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json"
+                },
+                body: geoUpdate
+            })
+            .catch(error => {
+                console.error("地理索引更新失败:", baseUrl, error);
+            });
+        });
+        
         // 异步更新用户兴趣向量到ChromaDB
         const userData = {
             id: e.record.id,
@@ -209,6 +230,47 @@ onRecordAfterUpdateRequest((e) => {
     }
 });
 
+// 新用户与注销用户同步到地理索引
+onRecordAfterCreateRequest((e) => {
+    if (e.record.collection().name === "users" && e.record.get("location_data")) {
+        const geoTargets = ["http://ai-agent:8000"];
+        if ($os.getenv("AI_SERVICE_URL")) {
+            geoTargets.push($os.getenv("AI_SERVICE_URL"));
+        }
+        geoTargets.forEach((baseUrl) => {
+            fetch(`${baseUrl}/api/geo/users`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json"
+                },
+                body: JSON.stringify({
+                    users: [{ id: e.record.id, location_data: e.record.get("location_data") }]
+                })
+            })
+            .catch(error => {
+                console.error("地理索引更新失败:", baseUrl, error);
+            });
+        });
+    }
+});
+
+onRecordAfterDeleteRequest((e) => {
+    if (e.record.collection().name === "users") {
+        const geoTargets = ["http://ai-agent:8000"];
+        if ($os.getenv("AI_SERVICE_URL")) {
+            geoTargets.push($os.getenv("AI_SERVICE_URL"));
+        }
+        geoTargets.forEach((baseUrl) => {
+            fetch(`${baseUrl}/api/geo/users/${e.record.id}`, {
+                method: "DELETE"
+            })
+            .catch(error => {
+                console.error("地理索引移除失败:", baseUrl, error);
+            });
+        });
+    }
+});
+
 // 错误处理钩子
 onRecordAfterCreateRequest((e) => {
     try {
@@ -6,7 +6,7 @@ import React, { useState, useRef, useEffect } from 'react'
 import { Card, Button, Input, Textarea, Modal, Loading, Tag } from '@/components/ui/index'
 import { cn, formatDate, generateId } from '@/lib/utils'
 import { StarSeed, User } from '@/lib/pocketbase'
-import { useContentAgent } from '@/lib/ai-agents'
+import { useContentAgent, StrainAnalysis } from '@/lib/ai-agents'
 
 interface Message {
   id: string
@@ -49,7 +49,7 @@ export const AISeedCreator: React.FC<AISeedCreatorProps> = ({
   const [customTag, setCustomTag] = useState('')
   const messagesEndRef = useRef<HTMLDivElement>(null)
 
-  const { analyzeContent, generateContentVector, extractSpectralTags } = useContentAgent()
+  const { analyzeStrain, generateContentVector } = useContentAgent()
 
   // 滚动到底部
   const scrollToBottom = () => {
@@ -77,16 +77,15 @@ export const AISeedCreator: React.FC<AISeedCreatorProps> = ({
 
     try {
       // AI 分析用户输入
-      const analysis = await analyzeContent(input.trim())
+      const analysis = await analyzeStrain(input.trim())
       
       // 生成建议内容
       const suggestedContent = await generateSuggestedContent(input.trim(), analysis)
       
-      // 提取光谱标签
-      const spectralTags = await extractSpectralTags(suggestedContent)
-      
-      // 预测传播潜力
-      const estimatedReach = await predictPropagationPotential(suggestedContent, analysis)
+      // 建议内容的光谱标签与传播潜力来自同一次综合分析
+      const suggestedAnalysis = await analyzeStrain(suggestedContent)
+      const spectralTags = suggestedAnalysis.tags
+      const estimatedReach = estimateReach(suggestedAnalysis)
       
       // 计算置信度
       const confidence = calculateConfidence(analysis, suggestedContent)
@@ -94,7 +93,7 @@ export const AISeedCreator: React.FC<AISeedCreatorProps> = ({
       const aiMessage: Message = {
         id: generateId(),
         role: 'assistant',
-        content: generateAIResponse(suggestedContent, analysis, confidence),
+        content: generateAIResponse(suggestedContent, estimatedReach, confidence),
         metadata: {
           suggested_content: suggestedContent,
           confidence,
@@ -151,10 +150,9 @@ export const AISeedCreator: React.FC<AISeedCreatorProps> = ({
     return suggestions[Math.floor(Math.random() * suggestions.length)]
   }
 
-  // 预测传播潜力
-  const predictPropagationPotential = async (content: string, analysis: any): Promise<number> => {
-    // TODO: 使用 AI 预测传播潜力
-    const baseReach = Math.floor(Math.random() * 500) + 100
+  // 由传播潜力分（0-100）估算触达人数
+  const estimateReach = (analysis: StrainAnalysis): number => {
+    const baseReach = 100 + analysis.potential_score * 5
     const sentimentMultiplier = analysis.sentiment === 'positive' ? 1.5 : 1
     const topicMultiplier = analysis.topics.includes('生活') ? 1.3 : 1
     return Math.round(baseReach * sentimentMultiplier * topicMultiplier)
@@ -177,9 +175,9 @@ export const AISeedCreator: React.FC<AISeedCreatorProps> = ({
   }
 
   // 生成 AI 回复
-  const generateAIResponse = (suggestedContent: string, analysis: any, confidence: number): string => {
+  const generateAIResponse = (suggestedContent: string, estimatedReach: number, confidence: number): string => {
     if (confidence > 0.8) {
-      return `我为你优化了这个内容："${suggestedContent}"。这个星种很有潜力，预计能传播给 ${Math.floor(Math.random() * 500) + 100} 人。你觉得怎么样？`
+      return `我为你优化了这个内容："${suggestedContent}"。这个星种很有潜力，预计能传播给 ${estimatedReach} 人。你觉得怎么样？`
     } else if (confidence > 0.6) {
       return `我理解你的想法。让我为你优化一下："${suggestedContent}"。这个内容还不错，但可能需要一些调整。`
     } else {
@@ -24,6 +24,7 @@ export interface ContentAnalysisAgent {
   analyzeContent(content: string): Promise<ContentAnalysis>
   generateContentVector(content: string): Promise<number[]>
   extractSpectralTags(content: string): Promise<string[]>
+  analyzeStrain(content: string): Promise<StrainAnalysis>
 }
 
 export interface SystemOptimizationAgent {
@@ -56,6 +57,12 @@ export interface ContentAnalysis {
   engagement_potential: number
 }
 
+// 毒株综合分析（一次请求得到内容分析、标签与传播潜力）
+export interface StrainAnalysis extends ContentAnalysis {
+  tags: string[]
+  potential_score: number
+}
+
 export interface Context {
   timeOfDay: number
   userActivityLevel: number
@@ -298,6 +305,27 @@ export class AIAgentManager implements AIAgentSystem {
         console.warn('光谱标签提取失败，使用降级策略:', error)
         return this.fallbackTagExtraction(content)
       }
+    },
+
+    async analyzeStrain(content: string): Promise<StrainAnalysis> {
+      try {
+        const response = await this.makeRequestWithRetry(`${this.aiServiceUrl}/api/ai/analyze-strain`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ content })
+        })
+        return await response.json()
+      } catch (error) {
+        console.warn('毒株综合分析失败，使用降级策略:', error)
+        const analysis = this.fallbackContentAnalysis(content)
+        return {
+          ...analysis,
+          tags: this.fallbackTagExtraction(content),
+          potential_score: Math.min(100, Math.max(0,
+            analysis.engagement_potential * 0.6 + analysis.readability * 0.3 + analysis.topics.length * 5
+          ))
+        }
+      }
     }
   }
 